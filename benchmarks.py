@@ -0,0 +1,388 @@
+# ===============================
+# Imports & Constants
+# ===============================
+import argparse
+import copy
+import gc
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from unittest.mock import patch
+
+import main
+
+DEFAULT_SCALES = (10, 100, 1000, 10000)
+BENCH_PARTY = ['rogue_1', 'mage_1', 'artificer_1']
+BENCH_TOOLS = {'rogue_1': 'tool_lockpick', 'artificer_1': 'tool_gadget', 'mage_1': 'tool_rune'}
+
+
+# ===============================
+# Synthetic Data
+# ===============================
+def _clone(items, count, suffix_fields=('id',)):
+    """count items cycled from items; the first copy keeps its ids so hand-written references still work."""
+    clones = []
+    for n in range(count):
+        item = copy.deepcopy(items[n % len(items)])
+        if n >= len(items):
+            for field in suffix_fields:
+                item[field] = f"{item[field]}_x{n}"
+        clones.append(item)
+    return clones
+
+
+def scaled_game_data(base, scale):
+    """
+    The shipped game data grown to `scale` crew members, heists, campaign arcs and narrative
+    events, plus `scale` loot items for the player. Ids stay unique so the data passes compile_game_data.
+    """
+    data = copy.deepcopy(base)
+    data['crew_members'] = _clone(base['crew_members'], max(scale, len(base['crew_members'])))
+    data['heists'] = _clone(base['heists'], max(scale, len(base['heists'])))
+    data['campaign_arcs'] = _clone(base['campaign_arcs'], max(scale, len(base['campaign_arcs'])))
+    data['narrative_events'] = _clone(base['narrative_events'], max(scale, len(base['narrative_events'])))
+    data['player']['starting_loot'] = [{"item": f"Trinket {n}", "value": 10 + n % 90} for n in range(scale)]
+    return data
+
+
+# ===============================
+# Measurement
+# ===============================
+def measure(name, scale, setup, op, iterations, repeat=3):
+    """
+    Times `op(state)` over `iterations` calls on a fresh `setup()` state, best of `repeat`,
+    then makes one more pass under tracemalloc for the peak memory it allocates.
+    """
+    best = None
+    for _ in range(repeat):
+        state = setup()
+        gc.collect()
+        started = time.perf_counter()
+        for _ in range(iterations):
+            op(state)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+
+    state = setup()
+    gc.collect()
+    tracemalloc.start()
+    for _ in range(iterations):
+        op(state)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "name": name,
+        "scale": scale,
+        "iterations": iterations,
+        "seconds": best,
+        "seconds_per_op": best / iterations,
+        "ops_per_second": iterations / best if best else None,
+        "peak_memory_kb": peak / 1024,
+    }
+
+
+def _silent_game(compiled, **kwargs):
+    return main.GameManager(main.GreedyThresholdDecisions(), main.EventBus(), seed=0,
+                            compiled_data=compiled, **kwargs)
+
+
+# ===============================
+# Benchmarks
+# ===============================
+# Each benchmark takes (compiled game data, workdir, scale) and returns (setup, op, iterations).
+def bench_run_heist(compiled, workdir, scale):
+    def setup():
+        return _silent_game(compiled)
+
+    def op(game):
+        game.heist_agent.run_heist('heist_1', BENCH_PARTY, BENCH_TOOLS)
+    return setup, op, 200
+
+
+def bench_skill_check(compiled, workdir, scale):
+    crew_ids = list(compiled['indexes']['crew_members'])
+
+    def setup():
+        return {"crew": _silent_game(compiled).crew_agent, "n": 0}
+
+    def op(state):
+        state["n"] += 1
+        state["crew"].perform_skill_check(crew_ids[state["n"] % len(crew_ids)], 'stealth', 6)
+    return setup, op, 5000
+
+
+def bench_apply_effects(compiled, workdir, scale):
+    effects = [{"type": "add_notoriety", "value": 1},
+               {"type": "update_reputation", "rep_type": "fear", "value": 1},
+               {"type": "modify_xp", "target": "random_member", "value": 1},
+               {"type": "temp_debuff", "who": "all_members", "skill": "stealth", "value": -1},
+               {"type": "set_status", "target": "random_member", "status": "injured"}]
+
+    def setup():
+        return _silent_game(compiled).heist_agent
+
+    def op(heist_agent):
+        heist_agent._apply_effects(effects, BENCH_PARTY, 'rogue_1', [])
+    return setup, op, 2000
+
+
+def bench_suggest_parties(compiled, workdir, scale):
+    def setup():
+        game = _silent_game(compiled)
+        game.city_agent.tool_inventory = {'tool_lockpick': 2, 'tool_gadget': 1, 'tool_rune': 1}
+        return game
+
+    def op(game):
+        game.heist_agent.suggest_parties('heist_3', top_k=3)
+    return setup, op, 5
+
+
+def bench_cheat_mode(compiled, workdir, scale):
+    def op(game):
+        with patch('builtins.print'):
+            game.enable_cheat_mode()
+    return (lambda: _silent_game(compiled)), op, 5
+
+
+def bench_check_arcs_steady(compiled, workdir, scale):
+    def setup():
+        game = _silent_game(compiled)
+        game.arc_manager.check_arcs()  # first check evaluates every stage once
+        return game
+
+    def op(game):
+        game.arc_manager.check_arcs()
+    return setup, op, 2000
+
+
+def bench_check_arcs_changing(compiled, workdir, scale):
+    def setup():
+        game = _silent_game(compiled)
+        game.arc_manager.check_arcs()
+        return game
+
+    def op(game):
+        game.city_agent.notoriety += 1
+        game.arc_manager.check_arcs()
+    return setup, op, 20
+
+
+def _bench_save(save_format):
+    def bench(compiled, workdir, scale):
+        path = os.path.join(workdir, f"bench_save.{save_format}")
+
+        def setup():
+            for leftover in (path, path + '.journal'):
+                if os.path.exists(leftover):
+                    os.remove(leftover)
+            game = _silent_game(compiled, save_format=save_format)
+            with patch('builtins.print'):
+                game.save_game(path)
+            return game
+
+        def op(game):
+            game.city_agent.notoriety += 1
+            game.city_agent.add_loot({"item": "Coin purse", "value": 5})
+            with patch('builtins.print'):
+                game.save_game(path)
+        return setup, op, 20
+    return bench
+
+
+def _bench_load(save_format):
+    def bench(compiled, workdir, scale):
+        path = os.path.join(workdir, f"bench_load.{save_format}")
+        for leftover in (path, path + '.journal'):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+        game = _silent_game(compiled, save_format=save_format)
+        with patch('builtins.print'):
+            for _ in range(5):
+                game.city_agent.notoriety += 1
+                game.save_game(path)
+
+        def setup():
+            return _silent_game(compiled, save_format=save_format)
+
+        def op(game):
+            game._save_stores.clear()  # load from disk, not from a store's in-memory state
+            with patch('builtins.print'):
+                game.load_game(path)
+        return setup, op, 20
+    return bench
+
+
+def bench_fence_loot(compiled, workdir, scale):
+    loot = compiled['data']['player']['starting_loot']
+
+    def setup():
+        game = _silent_game(compiled)
+        game.city_agent.factions = {"syndicates": {"name": "Rogue Syndicates", "standing": 1}}
+        return game
+
+    def op(game):
+        game.city_agent.loot = list(loot)
+        with patch('builtins.input', return_value='all'), patch('builtins.print'):
+            game._fence_loot()
+    return setup, op, 50
+
+
+def bench_loot_ledger(compiled, workdir, scale):
+    def setup():
+        game = _silent_game(compiled)
+        game.city_agent.factions = {"syndicates": {"name": "Rogue Syndicates", "standing": 1}}
+        return game
+
+    def op(game):
+        # One heist's worth of loot traffic: new loot in, the best piece out, the menu and a trigger read
+        game.city_agent.add_loot({"item": "Coin purse", "value": 95})
+        game.fence_best(1)
+        ', '.join(game.city_agent.loot.names())
+        main.TRIGGER_STATE_READERS["loot_value"](game.arc_manager)
+    return setup, op, 200
+
+
+def bench_game_manager_init(compiled, workdir, scale):
+    return (lambda: None), (lambda _: _silent_game(compiled)), 5
+
+
+def bench_load_game_data_cached(compiled, workdir, scale):
+    path = os.path.join(workdir, 'game_data.json')
+    main.load_game_data(path)  # writes the cache
+    return (lambda: None), (lambda _: main.load_game_data(path)), 5
+
+
+def bench_load_game_data_cold(compiled, workdir, scale):
+    path = os.path.join(workdir, 'game_data.json')
+
+    def op(_):
+        if os.path.exists(path + '.cache'):
+            os.remove(path + '.cache')
+        main.load_game_data(path)
+    return (lambda: None), op, 3
+
+
+def bench_load_game_data_streamed(compiled, workdir, scale):
+    path = os.path.join(workdir, 'game_data.json')
+    main.stream_game_data(path)  # writes the byte index
+
+    def op(_):
+        main.GameManager(main.GreedyThresholdDecisions(), main.EventBus(), seed=0,
+                         compiled_data=main.load_game_data(path, stream=True))
+    return (lambda: None), op, 5
+
+
+def bench_procedural_heists(compiled, workdir, scale):
+    config = compiled['data']['procedural_heists']
+
+    def setup():
+        return {"heists": main.ProceduralHeists(config), "n": 0}
+
+    def op(state):
+        state["n"] += 1  # always a new heist, so every lookup generates one
+        state["heists"].get(f"proc_foundry_{state['n']}")
+    return setup, op, 2000
+
+
+BENCHMARKS = {
+    "run_heist": bench_run_heist,
+    "perform_skill_check": bench_skill_check,
+    "apply_effects": bench_apply_effects,
+    "suggest_parties": bench_suggest_parties,
+    "cheat_mode": bench_cheat_mode,
+    "check_arcs_steady": bench_check_arcs_steady,
+    "check_arcs_changing": bench_check_arcs_changing,
+    "save_game_json": _bench_save("json"),
+    "save_game_journal": _bench_save("journal"),
+    "save_game_sqlite": _bench_save("sqlite"),
+    "load_game_json": _bench_load("json"),
+    "load_game_journal": _bench_load("journal"),
+    "load_game_sqlite": _bench_load("sqlite"),
+    "fence_loot": bench_fence_loot,
+    "loot_ledger": bench_loot_ledger,
+    "procedural_heists": bench_procedural_heists,
+    "game_manager_init": bench_game_manager_init,
+    "load_game_data_cached": bench_load_game_data_cached,
+    "load_game_data_cold": bench_load_game_data_cold,
+    "load_game_data_streamed": bench_load_game_data_streamed,
+}
+
+
+def _git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(scales=DEFAULT_SCALES, names=None, repeat=3, iteration_scale=1.0, base_path='game_data.json'):
+    """
+    Runs the named benchmarks (all by default) at every scale and returns a JSON-ready dict
+    with the environment and one result per (benchmark, scale). iteration_scale shrinks or
+    grows every benchmark's iteration count, e.g. 0.1 for a quick smoke run.
+    """
+    names = list(names or BENCHMARKS)
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        raise ValueError(f"Unknown benchmark(s): {', '.join(unknown)}")
+    with open(base_path, 'r', encoding='utf-8') as f:
+        base = json.load(f)
+
+    results = []
+    for scale in scales:
+        with tempfile.TemporaryDirectory() as workdir:
+            path = os.path.join(workdir, 'game_data.json')
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(scaled_game_data(base, scale), f)
+            compiled = main.load_game_data(path)
+            for name in names:
+                setup, op, iterations = BENCHMARKS[name](compiled, workdir, scale)
+                iterations = max(1, int(iterations * iteration_scale))
+                results.append(measure(name, scale, setup, op, iterations, repeat))
+    return {
+        "revision": _git_revision(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "numpy": main.np is not None,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": results,
+    }
+
+
+def print_benchmark_report(report):
+    print(f"\n=== Benchmarks @ {report['revision'] or 'unknown revision'} (Python {report['python']}) ===")
+    print(f"  {'benchmark':<24}{'scale':>7}{'per op':>14}{'ops/s':>12}{'peak KiB':>11}")
+    for r in report['results']:
+        print(f"  {r['name']:<24}{r['scale']:>7}{r['seconds_per_op'] * 1e6:>11.1f} us"
+              f"{r['ops_per_second'] or 0:>12.0f}{r['peak_memory_kb']:>11.1f}")
+
+
+# ===============================
+# Entry Point
+# ===============================
+def _parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks for The Clockwork Heist engine")
+    parser.add_argument("--scales", default=",".join(map(str, DEFAULT_SCALES)),
+                        help="comma-separated crew/heist/arc counts, e.g. 10,1000")
+    parser.add_argument("--only", default="", help=f"comma-separated benchmarks from: {', '.join(BENCHMARKS)}")
+    parser.add_argument("--repeat", type=int, default=3, help="timed passes per benchmark; the best is kept")
+    parser.add_argument("--iteration-scale", type=float, default=1.0, help="multiply every iteration count")
+    parser.add_argument("--output", default="benchmark_results.json", help="where to write the JSON results")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = _parse_args()
+    report = run_benchmarks([int(s) for s in args.scales.split(',') if s.strip()],
+                            [n.strip() for n in args.only.split(',') if n.strip()] or None,
+                            repeat=args.repeat, iteration_scale=args.iteration_scale)
+    print_benchmark_report(report)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"\n[Results written to {args.output}.]")
@@ -1,94 +1,1852 @@
 # ===============================
 # Imports & Constants
 # ===============================
+import abc
+import argparse
+import asyncio
+import atexit
+import bisect
+import concurrent.futures
+import copy
+import functools
+import hashlib
+import heapq
+import inspect
+import itertools
 import json
+import marshal
+import mmap
+import multiprocessing
+import operator
+import os
+import pickle
 import random
+import re
+import sqlite3
+import time
+from array import array
+from collections import Counter, OrderedDict
+from collections.abc import Mapping, MutableMapping
+from fractions import Fraction
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional; vectorized helpers fall back to plain Python
+    np = None
 
 CHEAT_MODE = False  # Toggle this to False for normal play
+CHECK_DIE_SIDES = 10  # Skill checks roll a d10
 
 
 # ===============================
 # Utility Functions
 # ===============================
 
-# This section is reserved for helper functions that don't belong to a specific class.
-# Currently, there are no utility functions.
+def _faces_at_least(target):
+    """Number of die faces whose roll meets or beats target."""
+    return min(CHECK_DIE_SIDES, max(0, CHECK_DIE_SIDES + 1 - target))
+
+
+def skill_check_distribution(modifier, difficulty, partial_success_margin=1, exact=False):
+    """
+    Exact outcome probabilities of a skill check, mirroring CrewAgent.perform_skill_check.
+
+    modifier is everything added to the roll: skill, temporary effects, tool and ability
+    bonuses. Returns {'success': p, 'partial': p, 'failure': p}, as Fractions if exact.
+    """
+    success = _faces_at_least(difficulty - modifier)
+    partial = max(0, _faces_at_least(difficulty - partial_success_margin - modifier) - success)
+    failure = CHECK_DIE_SIDES - success - partial
+    if exact:
+        return {CrewAgent.SUCCESS: Fraction(success, CHECK_DIE_SIDES),
+                CrewAgent.PARTIAL: Fraction(partial, CHECK_DIE_SIDES),
+                CrewAgent.FAILURE: Fraction(failure, CHECK_DIE_SIDES)}
+    return {CrewAgent.SUCCESS: success / CHECK_DIE_SIDES,
+            CrewAgent.PARTIAL: partial / CHECK_DIE_SIDES,
+            CrewAgent.FAILURE: failure / CHECK_DIE_SIDES}
+
+
+def skill_check_distribution_array(skills, bonuses, difficulties, partial_success_margin=1):
+    """
+    Vectorized skill_check_distribution over equal-length sequences (or scalars, which
+    broadcast) of skills, bonuses and difficulties. Returns a dict of NumPy arrays keyed
+    by outcome, or of lists when NumPy is not installed.
+    """
+    if np is None:
+        size = max(len(x) if hasattr(x, '__len__') else 1 for x in (skills, bonuses, difficulties))
+        columns = [x if hasattr(x, '__len__') else [x] * size for x in (skills, bonuses, difficulties)]
+        rows = [skill_check_distribution(s + b, d, partial_success_margin) for s, b, d in zip(*columns)]
+        return {outcome: [row[outcome] for row in rows]
+                for outcome in (CrewAgent.SUCCESS, CrewAgent.PARTIAL, CrewAgent.FAILURE)}
+
+    target = np.asarray(difficulties) - (np.asarray(skills) + np.asarray(bonuses))
+    success = np.clip(CHECK_DIE_SIDES + 1 - target, 0, CHECK_DIE_SIDES)
+    partial = np.clip(CHECK_DIE_SIDES + 1 - (target - partial_success_margin), 0, CHECK_DIE_SIDES) - success
+    partial = np.maximum(partial, 0)
+    return {CrewAgent.SUCCESS: success / CHECK_DIE_SIDES,
+            CrewAgent.PARTIAL: partial / CHECK_DIE_SIDES,
+            CrewAgent.FAILURE: (CHECK_DIE_SIDES - success - partial) / CHECK_DIE_SIDES}
+
+
+@functools.lru_cache(maxsize=4096)
+def _pass_chance(modifier, difficulty):
+    """Chance that a check does not fail (success or partial), cached for planners."""
+    dist = skill_check_distribution(modifier, difficulty)
+    return dist[CrewAgent.SUCCESS] + dist[CrewAgent.PARTIAL]
+
+
+def _success_chance(modifier, difficulty):
+    """Chance that modifier + d10 meets the difficulty."""
+    return _faces_at_least(difficulty - modifier) / CHECK_DIE_SIDES
+
+
+class ChangeClock:
+    """
+    Orders changes to one game's state against its saves. Changes are stamped with `now`; a
+    save takes mark(), which returns the current stamp and moves the clock on, so what
+    changed after that save is exactly what carries a later stamp. A GameManager hands its
+    clock to its crew agent and city agent; agents built on their own get a clock of their own.
+    """
+    def __init__(self):
+        self.now = 1
+
+    def mark(self):
+        self.now += 1
+        return self.now - 1
+
+
+
+class RandomStreams:
+    """
+    Per-session random number streams: 'rolls' (skill-check dice), 'events' (random
+    events, alchemy backfires) and 'targets' (who an effect lands on). Each stream is a
+    random.Random seeded from a SHA-256 hash of the session seed, its spawn path and the
+    stream name, so streams of one session, and of sessions spawned from it, never share
+    a seed. Without a seed every stream is the global random module, as before.
+    """
+    NAMES = ("rolls", "events", "targets")
+
+    def __init__(self, seed=None, path=()):
+        self.seed = seed
+        self.path = tuple(path)
+        for name in self.NAMES:
+            setattr(self, name, random if seed is None else random.Random(self._derive(name)))
+
+    def _derive(self, name):
+        material = f"{self.seed!r}/{'/'.join(map(str, self.path))}/{name}".encode('utf-8')
+        return int.from_bytes(hashlib.sha256(material).digest(), 'big')
+
+    def spawn(self, key):
+        """An independent child session, e.g. one simulated trial or worker."""
+        if self.seed is None:
+            return RandomStreams(random.getrandbits(128))
+        return RandomStreams(self.seed, self.path + (key,))
+
+
+# ===============================
+# Decision Providers
+# ===============================
+class DecisionProvider(abc.ABC):
+    """
+    Answers the ability prompts and choices raised by HeistAgent and ArcManager, and the
+    menu input of GameManager.
+
+    confirm() returns True to use an ability; choose() returns the index of the chosen
+    option, or None if the answer was invalid; ask() returns a line of menu input. context
+    is a mapping that may carry the 'event' being resolved, the estimated 'success_chance' of
+    the check the ability would help with, a 'preferred' option index, per-option 'scores'
+    and the 'keys' a player types to pick each option. Subclasses must implement confirm().
+    """
+    @abc.abstractmethod
+    def confirm(self, ability_id, prompt, context=None):
+        """True to use the ability."""
+
+    def choose(self, decision_id, prompt, options, context=None):
+        return (context or {}).get('preferred', 0)
+
+    def ask(self, decision_id, prompt, context=None):
+        return input(prompt)
+
+
+def _parse_choice(answer, options, context=None):
+    """
+    The option index a typed answer picks, or None: the option's number, or its key when
+    the prompt lists option 'keys' in its context (e.g. S/C/M for the alchemy potions).
+    """
+    keys = (context or {}).get('keys')
+    if keys:
+        return keys.index(answer.upper()) if answer.upper() in keys else None
+    try:
+        idx = int(answer) - 1
+    except ValueError:
+        return None
+    return idx if 0 <= idx < len(options) else None
+
+
+class ConsoleDecisions(DecisionProvider):
+    """Interactive play: every decision is typed at the console."""
+    def confirm(self, ability_id, prompt, context=None):
+        return input(prompt).upper() == 'Y'
+
+    def choose(self, decision_id, prompt, options, context=None):
+        return _parse_choice(input(prompt), options, context)
+
+
+class AlwaysYesDecisions(DecisionProvider):
+    """Uses every ability the moment it is offered."""
+    def confirm(self, ability_id, prompt, context=None):
+        return True
+
+
+class NeverDecisions(DecisionProvider):
+    """Never uses an ability."""
+    def confirm(self, ability_id, prompt, context=None):
+        return False
+
+
+class GreedyThresholdDecisions(DecisionProvider):
+    """
+    Spends an ability only when the check it would help is less likely than threshold to
+    succeed. Prompts without a success estimate (rerolls after a failure, storing a
+    success) are always accepted, and choices go to the highest-scoring option.
+    """
+    def __init__(self, threshold=0.75):
+        self.threshold = threshold
+
+    def confirm(self, ability_id, prompt, context=None):
+        chance = (context or {}).get('success_chance')
+        return chance is None or chance < self.threshold
+
+    def choose(self, decision_id, prompt, options, context=None):
+        scores = (context or {}).get('scores')
+        if scores:
+            return max(range(len(scores)), key=scores.__getitem__)
+        return super().choose(decision_id, prompt, options, context)
+
+
+class CallableDecisions(DecisionProvider):
+    """
+    Wraps user callables: confirm(ability_id, context) -> bool and, optionally,
+    choose(decision_id, options, context) -> index.
+    """
+    def __init__(self, confirm, choose=None):
+        self._confirm = confirm
+        self._choose = choose
+
+    def confirm(self, ability_id, prompt, context=None):
+        return bool(self._confirm(ability_id, context or {}))
+
+    def choose(self, decision_id, prompt, options, context=None):
+        if self._choose is None:
+            return super().choose(decision_id, prompt, options, context)
+        return self._choose(decision_id, options, context or {})
+
+
+class PromptContext(Mapping):
+    """
+    A prompt context whose costlier fields (e.g. 'success_chance') are given as functions
+    and worked out the first time a provider reads them, so providers that never look,
+    like the console and the simulators, never pay for them.
+    """
+    def __init__(self, fields=None, **lazy):
+        self._fields = dict(fields or {})
+        self._lazy = lazy
+
+    def __getitem__(self, key):
+        if key not in self._fields and key in self._lazy:
+            self._fields[key] = self._lazy.pop(key)()
+        return self._fields[key]
+
+    def __iter__(self):
+        return itertools.chain(self._fields, self._lazy)
+
+    def __len__(self):
+        return len(self._fields) + len(self._lazy)
+
+    def __repr__(self):
+        return f"PromptContext({self._fields!r}, lazy={sorted(self._lazy)!r})"
+
+
+class Prompt:
+    """
+    A decision a step generator is waiting on. The heist, arc and menu logic is written as
+    generators (HeistAgent.run_heist_steps, ArcManager.check_arcs_steps,
+    GameManager.start_game_steps, ...) that yield a Prompt wherever they need an answer
+    and are sent the answer back. run_steps drives them to the end with a blocking
+    DecisionProvider; run_steps_async awaits providers that answer asynchronously.
+    kind is the DecisionProvider method that answers it: confirm, choose or ask.
+    """
+    __slots__ = ("kind", "decision_id", "text", "options", "context")
+
+    def __init__(self, kind, decision_id, text, options=None, context=None):
+        self.kind = kind
+        self.decision_id = decision_id
+        self.text = text
+        self.options = options
+        self.context = context
+
+    @classmethod
+    def confirm(cls, ability_id, prompt, context=None):
+        return cls("confirm", ability_id, prompt, context=context)
+
+    @classmethod
+    def choose(cls, decision_id, prompt, options, context=None):
+        return cls("choose", decision_id, prompt, options, context)
+
+    @classmethod
+    def ask(cls, decision_id, prompt, context=None):
+        return cls("ask", decision_id, prompt, context=context)
+
+    def answer(self, decisions):
+        """The answer from decisions; an awaitable if it answers asynchronously."""
+        if self.kind == "choose":
+            return decisions.choose(self.decision_id, self.text, self.options, self.context)
+        return getattr(decisions, self.kind)(self.decision_id, self.text, self.context)
+
+    def __repr__(self):
+        return f"Prompt({self.kind!r}, {self.decision_id!r}, {self.text!r})"
+
+
+def run_steps(steps, decisions):
+    """Runs a step generator to the end, answering its prompts from decisions. Returns its result."""
+    answer = None
+    while True:
+        try:
+            prompt = steps.send(answer)
+        except StopIteration as done:
+            return done.value
+        answer = prompt.answer(decisions)
+
+
+async def run_steps_async(steps, decisions):
+    """run_steps as a coroutine: answers that are awaitable (e.g. a remote player's reply) are awaited."""
+    answer = None
+    while True:
+        try:
+            prompt = steps.send(answer)
+        except StopIteration as done:
+            return done.value
+        answer = prompt.answer(decisions)
+        if inspect.isawaitable(answer):
+            answer = await answer
+
+
+def blocking(steps_method):
+    """
+    The blocking form of a step generator method: runs self.<steps_method> with run_steps and
+    self.decisions. The method is looked up on each call, so wrapping it (e.g. to profile it)
+    covers both forms.
+    """
+    name = steps_method.__name__
+
+    def run(self, *args, **kwargs):
+        return run_steps(getattr(self, name)(*args, **kwargs), self.decisions)
+    run.__doc__ = steps_method.__doc__
+    return run
+
+
+DECISION_PROVIDERS = {
+    "console": ConsoleDecisions,
+    "yes": AlwaysYesDecisions,
+    "never": NeverDecisions,
+    "greedy": GreedyThresholdDecisions,
+}
+
+
+# ===============================
+# Event Bus
+# ===============================
+def _format_skill_check(f):
+    if f['temp_modifier'] != 0:
+        skill_line = f"  > Base Skill: {f['base_skill']} (Modified to {f['effective_skill']} by temporary effect)"
+    else:
+        skill_line = f"  > Skill: {f['base_skill']}"
+    return (f"  > {f['name']} attempts {f['skill']} check (Difficulty: {f['difficulty']})\n{skill_line}\n"
+            f"  > + Tool/Ability Bonus: {f['tool_bonus']} + Roll: {f['roll']} = Total: {f['total']}")
+
+
+def _format_narrative_event(f):
+    lines = ["\n--- Narrative Event ---", f['description']]
+    lines.extend(f"  [{i + 1}] {text}" for i, text in enumerate(f['choices']))
+    return "\n".join(lines)
+
+
+# Every event kind the engine emits, with its console rendering: a str.format template
+# over the event's fields, or a callable taking the fields dict for conditional text.
+EVENT_FORMATS = {
+    # Crew
+    'crew.level_up': "[Progression] {name} has reached Level {level}!",
+    'check.unknown_crew': "[Warning] perform_skill_check: crew '{crew_id}' not found.",
+    'check.roll': _format_skill_check,
+    # Heist flow
+    'heist.not_found': "Heist not found.",
+    'heist.start': "\n--- Starting Heist: {name} ---",
+    'heist.extra_event': "[Notoriety Effect] Your reputation precedes you, drawing out a dangerous foe!",
+    'random_event.reputation': lambda f: ("[Reputation Effect] Your fearsome reputation makes this situation more volatile! (Difficulty +1)"
+                                          if f['difficulty_change'] > 0 else
+                                          "[Reputation Effect] Your respectable reputation gives you an edge. (Difficulty -1)"),
+    'random_event.forewarned': "\n[Scout's Forewarning!] Finn Ashwhistle spots trouble ahead.\n  > Upcoming Event: {description}",
+    'random_event.occurs': "\n[A random event occurs during the heist!]",
+    'event.start': "\n* Event: {description}",
+    'event.no_crew': "No suitable crew member for this event! It automatically fails.",
+    'event.scaled': "  > [Notoriety Effect] The stakes are higher! (Difficulty +{increase})",
+    'event.requirement_failed': "  > {name} is too inexperienced! Needs {required} {check} (has {has}).",
+    'event.outcome': lambda f: f"  > {f['result'].title()}: {f['text']}",
+    'getaway.start': "\n--- Getaway: {name} ---\n{description}",
+    'getaway.no_crew': "No suitable crew for the getaway. Automatic failure!",
+    'getaway.outcome': lambda f: f"  > {f['result'].title()}: {f['text']}",
+    'heist.result': lambda f: "\n--- Heist Successful! ---" if f['success'] else "\n--- Heist Failed! ---",
+    'heist.double_loot': "[Gambler's Reward] The loot is doubled!",
+    'heist.xp': "\n[Crew Report] Each participating member gains {xp} XP.",
+    'heist.summary': "Final Notoriety: {notoriety}\nTotal Loot Acquired: {loot}",
+    # Abilities
+    'ability.eagle_of_brasshaven': "[Eagle of Brasshaven] Finn's vigilance allows the crew to bypass an unforeseen complication!",
+    'ability.arcane_reservoir_release': "  > [Arcane Reservoir] Lyra releases the stored magical success, effortlessly resolving the situation.",
+    'ability.ghost_in_the_gears': "  > [Ghost in the Gears] Silas finds a hidden path, and the crew slips past the challenge entirely.",
+    'ability.shielding_elixir': "  > [Alchemist's Elixir] The crew feels invigorated by the potion!",
+    'ability.clockwork_legion': "  > [Clockwork Legion] A swarm of tiny clockwork helpers aids the crew!",
+    'ability.tinkers_edge': "  > [Tinker's Edge] Dorian quickly assembles a gadget to help {name}!",
+    'ability.double_or_nothing': "  > [Gambler's Wager] Cassian Vey is betting it all on a second chance!",
+    'ability.double_or_nothing_result': lambda f: ("  > Reroll Success! The gamble paid off spectacularly!" if f['success'] else
+                                                   "  > Reroll Failure! The house always wins. Notoriety increases sharply."),
+    'ability.chronoward': "  > [Chronoward] Time shimmers and resets around the failed action!",
+    'ability.arcane_reservoir_store': "  > [Arcane Reservoir] The moment of success is captured and stored.",
+    # Tools
+    'tool.bonus': "  > {name} uses {tool} for a +{value} bonus.",
+    'tool.difficulty_reduction': "  > {name} uses {tool} to lower the difficulty by {value}.",
+    'tool.bypass': "  > {name} uses {tool} to bypass the check, gaining {notoriety} notoriety!",
+    'tool.alchemy': "  > {name} brews a {potion} elixir! All crew gain +1 for this event.",
+    'tool.alchemy_backfire': "  > [Alchemy Backfire!] The elixir sputters and fumes! The Watch takes notice. Notoriety +1.",
+    'tool.used': "  > {name} uses {tool}. ({uses_left} uses left)",
+    'tool.exhausted': "  > {name} has no uses left for {tool}.",
+    # Outcome effects
+    'effect.status': "  > [Effect Applied!] {name} is now {status}!",
+    'effect.xp': "  > [Effect Applied!] {name}'s XP is modified by {value}!",
+    'effect.temp_modifier': "  > [Effect Applied!] {name}'s {skill} is temporarily modified by {value}!",
+    'heist.rescue_unlocked': "[Heist Unlocked] Rescue Heist is now available to free your crew!",
+    'faction.hostile': "[Faction] {name} is now hostile!",
+    # City
+    'city.notoriety': "[City Update] Notoriety increased to {notoriety}",
+    'city.reputation': lambda f: (f"[City Update] Your reputation for {f['rep_type']} has "
+                                  f"{'increased' if f['amount'] > 0 else 'decreased'} to {f['value']}."),
+    'city.loot': "[City Update] Loot acquired: {item} (Value: {value})",
+    # Campaign arcs
+    'arc.special_event': "\n[Special Event Triggered] {description}",
+    'arc.heist_unlocked': "[Heist Unlocked] {heist_id} is now available!",
+    'narrative.event': _format_narrative_event,
+    'narrative.loot_lost': "[Effect] Lost {loss} loot.",
+    'narrative.bad_faction_effect': "[Warning] Could not parse faction effect {faction}: {delta}",
+    'faction.standing': "[Faction Update] {name} standing changed by {delta}.",
+}
+
+
+def render_event(kind, fields):
+    """The console text for an event."""
+    template = EVENT_FORMATS[kind]
+    return template(fields) if callable(template) else template.format(**fields)
+
+
+class EventBus:
+    """
+    Routes game events to sinks. Agents call emit(kind, **fields) instead of printing;
+    with no sinks attached emit returns before any formatting happens.
+    """
+    def __init__(self, *sinks):
+        self.sinks = []
+        for sink in sinks:
+            self.add_sink(sink)
+
+    @property
+    def enabled(self):
+        return bool(self.sinks)
+
+    def add_sink(self, sink):
+        if not isinstance(sink, NullSink):
+            self.sinks.append(sink)
+        return sink
+
+    def remove_sink(self, sink):
+        if sink in self.sinks:
+            self.sinks.remove(sink)
+
+    def emit(self, kind, **fields):
+        if not self.sinks:
+            return
+        if kind not in EVENT_FORMATS:
+            raise ValueError(f"Unknown event kind '{kind}'")
+        for sink in self.sinks:
+            sink.handle(kind, fields)
+
+
+class ConsoleSink:
+    """Prints events exactly as the game always has."""
+    def handle(self, kind, fields):
+        print(render_event(kind, fields))
+
+
+class NullSink:
+    """Discards everything; an EventBus drops it on attach so it costs nothing."""
+    def handle(self, kind, fields):
+        pass
+
+
+class JsonlFileSink:
+    """Appends one JSON object per event ({"kind": ..., **fields}) to a file."""
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def handle(self, kind, fields):
+        self._file.write(json.dumps({"kind": kind, **fields}, default=str) + "\n")
+
+    def close(self):
+        self._file.close()
+
+
+class CollectorSink:
+    """Keeps (kind, fields) pairs in memory, e.g. for tests and batch analysis."""
+    def __init__(self):
+        self.events = []
+
+    def handle(self, kind, fields):
+        self.events.append((kind, fields))
+
+    def of_kind(self, kind):
+        return [fields for k, fields in self.events if k == kind]
+
+
+def _prometheus_labels(labels):
+    """'{name="value",...}' for ((name, value), ...) pairs, escaped as the exposition format requires."""
+    if not labels:
+        return ""
+    pairs = []
+    for name, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+class PrometheusSink:
+    """
+    Keeps gameplay and engine counters from the events it sees and writes them to `path` in
+    the Prometheus text exposition format, at most every `interval` seconds as events arrive
+    and whenever write() is called. The file is replaced atomically, so a scraper or a
+    node_exporter textfile collector never reads half of it.
+
+    The notoriety and treasury gauges are read from the watched CityAgent when the file is
+    written (treasury changes emit no event); unwatch() freezes their last values. Counters
+    from sinks filled elsewhere, e.g. in simulation workers, are added in with merge().
+    """
+    # name: (type, help)
+    METRICS = {
+        "clockwork_heists_started_total": ("counter", "Heists started, by heist id."),
+        "clockwork_heists_succeeded_total": ("counter", "Heists finished without a failed event, by heist id."),
+        "clockwork_heists_failed_total": ("counter", "Heists finished with at least one failed event, by heist id."),
+        "clockwork_skill_checks_total": ("counter", "Skill checks rolled, by skill and result."),
+        "clockwork_ability_uses_total": ("counter", "Abilities used in finished heists, by ability."),
+        "clockwork_notoriety": ("gauge", "Current city notoriety."),
+        "clockwork_treasury": ("gauge", "Current treasury in coin."),
+        "clockwork_run_heist_seconds": ("histogram", "Wall-clock time from the start to the end of a heist."),
+    }
+    LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0, 5.0, 30.0)
+
+    def __init__(self, path=None, interval=15.0, city_agent=None, clock=time.perf_counter):
+        self.path = path
+        self.interval = interval
+        self.city_agent = city_agent
+        self.clock = clock
+        self.counters = {}  # shape: { (metric name, ((label, value), ...)): count }
+        self.gauges = {}    # shape: { metric name: value }, used when no CityAgent is watched
+        self.latency_buckets = [0] * len(self.LATENCY_BUCKETS)  # non-cumulative; rendered cumulatively
+        self.latency_count = 0
+        self.latency_sum = 0.0
+        self._heist_started = {}  # shape: { heist run id: clock at its heist.start }
+        self._written = clock()
+
+    def _count(self, name, *labels):
+        key = (name, labels)
+        self.counters[key] = self.counters.get(key, 0) + 1
+
+    def handle(self, kind, fields):
+        if kind == 'check.roll':
+            self._count("clockwork_skill_checks_total", ("skill", fields['skill']), ("result", fields['result']))
+        elif kind == 'heist.start':
+            self._count("clockwork_heists_started_total", ("heist_id", fields['heist_id']))
+            self._heist_started[fields.get('run_id')] = self.clock()
+        elif kind == 'heist.result':
+            name = "clockwork_heists_succeeded_total" if fields['success'] else "clockwork_heists_failed_total"
+            self._count(name, ("heist_id", fields['heist_id']))
+        elif kind == 'heist.summary':
+            for ability in fields.get('abilities', ()):
+                self._count("clockwork_ability_uses_total", ("ability", ability))
+            started = self._heist_started.pop(fields.get('run_id'), None)
+            if started is not None:
+                self.observe_latency(self.clock() - started)
+            self.gauges["clockwork_notoriety"] = fields['notoriety']
+        elif kind == 'city.notoriety':
+            self.gauges["clockwork_notoriety"] = fields['notoriety']
+
+        if self.path is not None and self.clock() - self._written >= self.interval:
+            self.write()
+
+    def observe_latency(self, seconds):
+        self.latency_count += 1
+        self.latency_sum += seconds
+        index = bisect.bisect_left(self.LATENCY_BUCKETS, seconds)
+        if index < len(self.latency_buckets):
+            self.latency_buckets[index] += 1
+
+    def unwatch(self):
+        """Stops reading gauges from the CityAgent, keeping its current values."""
+        if self.city_agent is not None:
+            self.gauges["clockwork_notoriety"] = self.city_agent.notoriety
+            self.gauges["clockwork_treasury"] = self.city_agent.treasury
+            self.city_agent = None
+
+    def merge(self, other):
+        """Adds another sink's counters and latencies to this one; its gauges replace these."""
+        for key, count in other.counters.items():
+            self.counters[key] = self.counters.get(key, 0) + count
+        self.latency_buckets = [a + b for a, b in zip(self.latency_buckets, other.latency_buckets)]
+        self.latency_count += other.latency_count
+        self.latency_sum += other.latency_sum
+        other.unwatch()
+        self.gauges.update(other.gauges)
+
+    def render(self):
+        """The metrics in the Prometheus text exposition format."""
+        gauges = dict(self.gauges)
+        if self.city_agent is not None:
+            gauges["clockwork_notoriety"] = self.city_agent.notoriety
+            gauges["clockwork_treasury"] = self.city_agent.treasury
+        by_name = {}
+        for (name, labels), count in self.counters.items():
+            by_name.setdefault(name, []).append((labels, count))
+
+        lines = []
+        for name, (kind, help_text) in self.METRICS.items():
+            if kind == "counter":
+                samples = [(f"{name}{_prometheus_labels(labels)}", count) for labels, count in sorted(by_name.get(name, []))]
+            elif kind == "gauge":
+                samples = [(name, gauges[name])] if name in gauges else []
+            else:
+                cumulative, samples = 0, []
+                for bound, count in zip(self.LATENCY_BUCKETS, self.latency_buckets):
+                    cumulative += count
+                    samples.append((f'{name}_bucket{{le="{bound}"}}', cumulative))
+                samples += [(f'{name}_bucket{{le="+Inf"}}', self.latency_count),
+                            (f"{name}_sum", self.latency_sum), (f"{name}_count", self.latency_count)]
+            if samples:
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+                lines += [f"{sample} {value}" for sample, value in samples]
+        return "\n".join(lines) + "\n"
+
+    def write(self):
+        """Writes the metrics to path now."""
+        temporary = f"{self.path}.tmp"
+        with open(temporary, 'w', encoding='utf-8') as f:
+            f.write(self.render())
+        os.replace(temporary, self.path)
+        self._written = self.clock()
+
+
+def console_bus():
+    return EventBus(ConsoleSink())
+
+
+# ===============================
+# Effect Handlers
+# ===============================
+EFFECT_HANDLERS = {}  # shape: { effect type: (compile function, required fields) }
+
+
+def effect_handler(effect_type, *required):
+    """
+    Registers a compiler for an outcome effect type. The compiler takes the effect dict
+    and returns a callable(heist_agent, crew_ids, active_crew_id, total_loot).
+    """
+    def register(compile_fn):
+        EFFECT_HANDLERS[effect_type] = (compile_fn, required)
+        return compile_fn
+    return register
+
+
+def compile_effect(effect):
+    """Validates an effect dict and compiles it into a single callable."""
+    etype = effect.get('type') if isinstance(effect, dict) else None
+    if etype not in EFFECT_HANDLERS:
+        raise ValueError(f"Unknown effect type '{etype}' in {effect!r}")
+    compile_fn, required = EFFECT_HANDLERS[etype]
+    missing = [field for field in required if field not in effect]
+    if missing:
+        raise ValueError(f"Effect '{etype}' is missing {', '.join(missing)}: {effect!r}")
+    return compile_fn(effect)
+
+
+def compile_effects(effects):
+    return [compile_effect(effect) for effect in effects or []]
+
+
+def _single_target(effect):
+    """Target picker for effects aimed at one member: the active member or a random one."""
+    if effect.get('who') == 'active_member':
+        return lambda agent, crew_ids, active_crew_id: active_crew_id
+    return lambda agent, crew_ids, active_crew_id: agent.rng.targets.choice(crew_ids)
+
+
+@effect_handler('add_notoriety')
+def _compile_add_notoriety(effect):
+    value = effect.get('value', 1)
+
+    def apply(agent, crew_ids, active_crew_id, total_loot):
+        agent.city_agent.increase_notoriety(value)
+    return apply
+
+
+@effect_handler('update_reputation', 'rep_type', 'value')
+def _compile_update_reputation(effect):
+    rep_type, value = effect['rep_type'], effect['value']
+
+    def apply(agent, crew_ids, active_crew_id, total_loot):
+        agent.city_agent.update_reputation(rep_type, value)
+    return apply
+
+
+@effect_handler('set_status', 'status')
+def _compile_set_status(effect):
+    target, status = _single_target(effect), effect['status']
+
+    def apply(agent, crew_ids, active_crew_id, total_loot):
+        member = agent.crew_agent.edit_member(target(agent, crew_ids, active_crew_id))
+        if member:
+            member['status'] = status
+            agent.events.emit('effect.status', crew_id=member['id'], name=member['name'], status=status)
+            # Unlock rescue heist if someone is arrested
+            if status == 'arrested':
+                if "rescue_heist" not in agent.city_agent.unlocked_heists:
+                    agent.city_agent.unlocked_heists.add("rescue_heist")
+                    agent.events.emit('heist.rescue_unlocked')
+    return apply
+
+
+@effect_handler('lose_loot')
+def _compile_lose_loot(effect):
+    scope = effect.get('scope')
+    amount = effect.get('amount', effect.get('value', 1))
+
+    def apply(agent, crew_ids, active_crew_id, total_loot):
+        if scope == 'half' and total_loot:
+            half = len(total_loot) // 2
+            del total_loot[:half]
+        elif scope == 'primary' and total_loot:
+            total_loot.pop(0)
+        else:
+            for _ in range(amount):
+                if total_loot:
+                    total_loot.pop()
+    return apply
+
+
+@effect_handler('set_faction_hostile')
+def _compile_set_faction_hostile(effect):
+    faction_id = effect.get('faction')
+
+    def apply(agent, crew_ids, active_crew_id, total_loot):
+        factions = agent.city_agent.factions
+        faction = faction_id
+        if faction == 'random' and factions:
+            faction = agent.rng.targets.choice(list(factions.keys()))
+        if faction not in factions:
+            return  # no known factions to turn hostile (e.g. a new game)
+        agent.city_agent.edit_faction(faction)['standing'] = -999
+        agent.events.emit('faction.hostile', faction=faction, name=factions[faction]['name'])
+    return apply
+
+
+@effect_handler('modify_xp')
+def _compile_modify_xp(effect):
+    target, value = _single_target(effect), effect.get('value', 0)
+
+    def apply(agent, crew_ids, active_crew_id, total_loot):
+        member = agent.crew_agent.edit_member(target(agent, crew_ids, active_crew_id))
+        if member:
+            member['xp'] += value
+            agent.events.emit('effect.xp', crew_id=member['id'], name=member['name'], value=value)
+    return apply
+
+
+@effect_handler('temp_debuff', 'skill', 'value')
+def _compile_temp_debuff(effect):
+    skill, value, who = effect['skill'], effect['value'], effect.get('who')
+    if who == 'all_members':
+        targets = lambda agent, crew_ids, active_crew_id: crew_ids
+    elif who == 'active_member':
+        targets = lambda agent, crew_ids, active_crew_id: [active_crew_id]
+    elif who == 'random_member':
+        targets = lambda agent, crew_ids, active_crew_id: [agent.rng.targets.choice(crew_ids)]
+    elif 'role' in effect:
+        role = effect['role'].lower()
+
+        def targets(agent, crew_ids, active_crew_id):
+            members = [(crew_id, agent.crew_agent.get_crew_member(crew_id)) for crew_id in crew_ids]
+            return [crew_id for crew_id, member in members if member and member['role'].lower() == role]
+    else:
+        targets = lambda agent, crew_ids, active_crew_id: []
+
+    def apply(agent, crew_ids, active_crew_id, total_loot):
+        for target_id in targets(agent, crew_ids, active_crew_id):
+            modifiers = agent.temporary_effects.setdefault(target_id, {})
+            member = agent.crew_agent.get_crew_member(target_id)
+            if member:
+                modifiers[skill] = modifiers.get(skill, 0) + value
+                agent.events.emit('effect.temp_modifier', crew_id=target_id, name=member['name'], skill=skill, value=value)
+    return apply
+
+
+@effect_handler('game_over')
+def _compile_game_over(effect):
+    # The finale's failure text ends the story; the engine has no game-over state to set.
+    return lambda agent, crew_ids, active_crew_id, total_loot: None
+
+
+def outcome_effect_lists(heists, random_events, special_events):
+    """Yields the effect list of every event and getaway outcome in the heist data."""
+    events = list(special_events) + list(random_events)
+    for heist in heists:
+        events.extend(heist.get('events', []))
+        if heist.get('getaway'):
+            events.append(heist['getaway'])
+    for event in events:
+        for key in ('success', 'partial_success', 'failure'):
+            effects = (event.get(key) or {}).get('effects')
+            if effects:
+                yield effects
+
+
+# ===============================
+# Trigger Expressions
+# ===============================
+# Game state an arc trigger can read. A dependency is a tuple whose first element names the
+# reader and whose remaining elements are its arguments, e.g. ("crew", "rogue_1", "level").
+TRIGGER_STATE_READERS = {
+    "notoriety": lambda manager: manager.city_agent.notoriety,
+    "treasury": lambda manager: manager.city_agent.treasury,
+    "heists_completed": lambda manager: manager.city_agent.heists_completed,
+    "loot_value": lambda manager: manager.city_agent.loot.total_value,
+    "loot_count": lambda manager: len(manager.city_agent.loot),
+    "reputation": lambda manager, key: manager.city_agent.reputation.get(key, 0),
+    "faction": lambda manager, faction_id: manager.city_agent.factions.get(faction_id, {}).get('standing'),
+    "faction_standings": lambda manager: tuple((f, data['standing']) for f, data in manager.city_agent.factions.items()),
+    "crew": lambda manager, crew_id, field: _crew_field(manager.crew_agent.get_crew_member(crew_id), field),
+}
+
+TRIGGER_SCALARS = {
+    "notoriety": "notoriety",
+    "treasury": "treasury",
+    "heists_completed": "heists_completed",
+    "heist_completed": "heists_completed",  # spelling used by the shipped campaign data
+    "loot_value": "loot_value",
+    "loot_count": "loot_count",
+}
+CREW_FIELD_DEFAULTS = {"level": 0, "xp": 0, "status": "active", "role": None}
+
+TRIGGER_COMPARISONS = {
+    ">=": operator.ge, "<=": operator.le, ">": operator.gt,
+    "<": operator.lt, "==": operator.eq, "!=": operator.ne,
+}
+_TRIGGER_TOKEN = re.compile(r"""\s*(?:(\d+)|"([^"]*)"|'([^']*)'|(>=|<=|==|!=|>|<|\(|\))|([A-Za-z_][\w.]*))""")
+
+
+def _crew_field(member, field):
+    if not member:
+        return None
+    return member.get(field, CREW_FIELD_DEFAULTS[field])
+
+
+def _tokenize_trigger(text):
+    tokens, pos = [], 0
+    text = text.strip()
+    while pos < len(text):
+        match = _TRIGGER_TOKEN.match(text, pos)
+        if not match or match.end() == pos:
+            raise ValueError(f"trigger {text!r}: unexpected input at {text[pos:]!r}")
+        number, dq, sq, symbol, name = match.groups()
+        if number is not None:
+            tokens.append(("value", int(number)))
+        elif dq is not None or sq is not None:
+            tokens.append(("value", dq if dq is not None else sq))
+        elif symbol is not None:
+            tokens.append(("symbol", symbol))
+        elif name in ("and", "or", "not"):
+            tokens.append(("symbol", name))
+        elif name in ("true", "false"):
+            tokens.append(("value", name == "true"))
+        else:
+            tokens.append(("name", name))
+        pos = match.end()
+    return tokens
+
+
+class _TriggerParser:
+    """
+    Recursive-descent parser that compiles a trigger straight to closures over the arc manager.
+
+        expr       := and_expr ("or" and_expr)*
+        and_expr   := not_expr ("and" not_expr)*
+        not_expr   := "not" not_expr | comparison
+        comparison := operand (("<" | "<=" | ">" | ">=" | "==" | "!=") operand)?
+        operand    := NUMBER | STRING | true | false | state | "(" expr ")"
+        state      := notoriety | treasury | heists_completed | loot_value | loot_count
+                    | reputation.<key> | faction.<id>[.standing] | crew.<id>.<field>
+                    | <crew_id> <field> | faction_hostile_all
+    """
+
+    def __init__(self, text):
+        self.text = text
+        self.tokens = _tokenize_trigger(text)
+        self.pos = 0
+        self.deps = set()
+
+    def error(self, message):
+        return ValueError(f"trigger {self.text!r}: {message}")
+
+    def peek(self, offset=0):
+        index = self.pos + offset
+        return self.tokens[index] if index < len(self.tokens) else (None, None)
+
+    def take(self, symbol=None):
+        token = self.peek()
+        if token[0] is None or (symbol is not None and token != ("symbol", symbol)):
+            raise self.error(f"expected {symbol or 'more input'}")
+        self.pos += 1
+        return token
+
+    def parse(self):
+        node = self.expr()
+        if self.pos != len(self.tokens):
+            raise self.error(f"unexpected {self.peek()[1]!r}")
+        return (lambda manager: bool(node(manager))), self.deps
+
+    def expr(self):
+        node = self.and_expr()
+        while self.peek() == ("symbol", "or"):
+            self.take()
+            left, right = node, self.and_expr()
+            node = lambda manager, left=left, right=right: left(manager) or right(manager)
+        return node
+
+    def and_expr(self):
+        node = self.not_expr()
+        while self.peek() == ("symbol", "and"):
+            self.take()
+            left, right = node, self.not_expr()
+            node = lambda manager, left=left, right=right: left(manager) and right(manager)
+        return node
+
+    def not_expr(self):
+        if self.peek() == ("symbol", "not"):
+            self.take()
+            operand = self.not_expr()
+            return lambda manager: not operand(manager)
+        return self.comparison()
+
+    def comparison(self):
+        left = self.operand()
+        kind, symbol = self.peek()
+        if kind != "symbol" or symbol not in TRIGGER_COMPARISONS:
+            return left
+        self.take()
+        compare, right = TRIGGER_COMPARISONS[symbol], self.operand()
+
+        def compared(manager):
+            a, b = left(manager), right(manager)
+            if a is None or b is None:  # a missing crew member or faction never matches
+                return False
+            try:
+                return compare(a, b)
+            except TypeError:
+                return False
+        return compared
+
+    def operand(self):
+        kind, value = self.take()
+        if kind == "value":
+            return lambda manager: value
+        if (kind, value) == ("symbol", "("):
+            node = self.expr()
+            self.take(")")
+            return node
+        if kind != "name":
+            raise self.error(f"unexpected {value!r}")
+        return self.state(value)
+
+    def read(self, *dep):
+        self.deps.add(dep)
+        reader, args = TRIGGER_STATE_READERS[dep[0]], dep[1:]
+        return lambda manager: reader(manager, *args)
+
+    def state(self, name):
+        parts = name.split('.')
+        if name in TRIGGER_SCALARS:
+            return self.read(TRIGGER_SCALARS[name])
+        if name == "faction_hostile_all":
+            standings = self.read("faction_standings")
+            return lambda manager: bool(standings(manager)) and all(s < 0 for _, s in standings(manager))
+        if parts[0] == "reputation" and len(parts) == 2:
+            return self.read("reputation", parts[1])
+        if parts[0] in ("faction", "factions") and (len(parts) == 2 or parts[2:] == ["standing"]):
+            return self.read("faction", parts[1])
+        if parts[0] == "crew" and len(parts) == 3 and parts[2] in CREW_FIELD_DEFAULTS:
+            return self.read("crew", parts[1], parts[2])
+        field = self.peek()
+        if len(parts) == 1 and field[0] == "name" and field[1] in CREW_FIELD_DEFAULTS:
+            self.take()  # legacy "<crew_id> level" form
+            return self.read("crew", name, field[1])
+        raise self.error(f"unknown state {name!r}")
+
+
+@functools.lru_cache(maxsize=None)
+def compile_trigger(text):
+    """Compiles a trigger expression to (predicate(manager), frozenset of dependencies)."""
+    predicate, deps = _TriggerParser(text).parse()
+    return predicate, frozenset(deps)
+
+
+def compile_stage_trigger(stage):
+    """
+    Compiles an arc stage into (predicate(manager), dependencies), or None when it has no
+    trigger. A stage fires when its notoriety `threshold` is reached or its `trigger`
+    expression holds. Raises ValueError for a malformed stage.
+    """
+    if not isinstance(stage, dict):
+        raise ValueError(f"arc stage must be an object, got {stage!r}")
+    conditions, deps = [], set()
+    if 'threshold' in stage:
+        try:
+            threshold = int(stage['threshold'])
+        except (TypeError, ValueError):
+            raise ValueError(f"arc stage threshold must be an integer, got {stage['threshold']!r}") from None
+        conditions.append(lambda manager: manager.city_agent.notoriety >= threshold)
+        deps.add(("notoriety",))
+    if stage.get("trigger"):
+        predicate, trigger_deps = compile_trigger(stage["trigger"])
+        conditions.append(predicate)
+        deps.update(trigger_deps)
+
+    if not conditions:
+        return None
+    if len(conditions) == 1:
+        return conditions[0], deps
+    return (lambda manager: any(condition(manager) for condition in conditions)), deps
+
+
+# ===============================
+# Game Data
+# ===============================
+GAME_DATA_CACHE_VERSION = 2
+# Collections indexed by id in the compiled cache; agents accept these dicts directly.
+INDEXED_COLLECTIONS = ("crew_members", "tools", "heists", "special_events", "narrative_events")
+REQUIRED_SECTIONS = ("player", "progression", "crew_members", "tools", "heists", "random_events",
+                     "special_events", "narrative_events", "campaign_arcs")
+
+
+def _index_by_id(items):
+    """{id: item} for a list of dicts; an already indexed dict or LazySection is returned as is."""
+    if isinstance(items, (dict, LazySection)):
+        return items
+    return {item['id']: item for item in items}
+
+
+def compile_game_data(game_data):
+    """
+    Validates parsed game data and builds its id indexes. Raises ValueError for a missing
+    section, a duplicate id, an outcome effect or arc trigger that does not compile, or
+    procedural heist templates that cannot generate heists.
+    """
+    missing = [section for section in REQUIRED_SECTIONS if section not in game_data]
+    if missing:
+        raise ValueError(f"game data is missing: {', '.join(missing)}")
+    indexes = {}
+    for section in INDEXED_COLLECTIONS:
+        indexes[section] = _index_by_id(game_data[section])
+        if len(indexes[section]) != len(game_data[section]):
+            raise ValueError(f"duplicate ids in {section}")
+    for effects in outcome_effect_lists(game_data['heists'], game_data['random_events'], game_data['special_events']):
+        compile_effects(effects)
+    if not isinstance(game_data['campaign_arcs'], LazySection):  # streamed arcs are checked by ArcManager
+        for arc in game_data['campaign_arcs']:
+            for stage in arc.get('stages', []):
+                compile_stage_trigger(stage)
+    if game_data.get('procedural_heists'):
+        validate_procedural_heists(game_data['procedural_heists'])
+    return {"data": game_data, "indexes": indexes}
+
+
+def _file_signature(path):
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def load_game_data(path='game_data.json', cache_path=None, stream=None):
+    """
+    Loads game data through a compiled pickle cache (path + '.cache' by default).
+
+    The cache is used as is while the JSON's mtime and size match; if only those changed,
+    a SHA-256 of the content decides whether it is still valid. Otherwise the JSON is
+    parsed, validated and indexed again and the cache rewritten. Returns the compiled
+    dict: {'data': parsed game data, 'indexes': {collection: {id: item}}}.
+
+    Files of STREAM_THRESHOLD_BYTES or more (or any file with stream=True) go through
+    stream_game_data instead, which keeps the bulky sections on disk.
+    """
+    signature = _file_signature(path)
+    if stream is None:
+        stream = signature[1] >= STREAM_THRESHOLD_BYTES
+    if stream:
+        return stream_game_data(path)
+    cache_path = cache_path or path + '.cache'
+    cached = None
+    try:
+        with open(cache_path, 'rb') as f:
+            cached = pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError, IndexError):
+        cached = None
+    if not isinstance(cached, dict) or cached.get('version') != GAME_DATA_CACHE_VERSION:
+        cached = None
+
+    if cached and cached['signature'] == signature:
+        return cached['compiled']
+
+    with open(path, 'rb') as f:
+        raw = f.read()
+    digest = hashlib.sha256(raw).hexdigest()
+    if cached and cached['sha256'] == digest:
+        compiled = cached['compiled']  # touched but unchanged: keep the compiled data
+    else:
+        compiled = compile_game_data(json.loads(raw.decode('utf-8')))
+
+    _write_cache(cache_path, {"version": GAME_DATA_CACHE_VERSION, "signature": signature,
+                              "sha256": digest, "compiled": compiled})
+    return compiled
+
+
+def _write_cache(cache_path, payload):
+    """Writes the cache atomically; an unwritable location just means no cache."""
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(payload, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+# Files at least this large are streamed: bulky sections stay on disk, indexed by id offset
+STREAM_THRESHOLD_BYTES = 16 * 1024 * 1024
+STREAMED_SECTIONS = ("narrative_events", "campaign_arcs")
+STREAM_INDEX_VERSION = 1
+
+_JSON_COLON = re.compile(rb'\s*:\s*')
+_JSON_COMMA = re.compile(rb'\s*,?\s*')
+
+
+class _JsonWindow:
+    """
+    Decodes JSON values at byte offsets of a file through a sliding window. The window is
+    decoded as Latin-1, one character per byte, so str offsets are byte offsets and the C
+    decoder can do the scanning; decoded strings are re-read as UTF-8 where it matters.
+    """
+    def __init__(self, buf, size=1 << 22):
+        self.buf, self.size = buf, size
+        self.base, self.text = 0, ''
+        self.decoder = json.JSONDecoder()
+
+    def decode(self, pos):
+        """(value, end offset) for the JSON value starting at byte offset pos."""
+        size = self.size
+        while True:
+            offset = pos - self.base
+            if 0 <= offset < len(self.text):
+                complete = self.base + len(self.text) == len(self.buf)
+                try:
+                    value, end = self.decoder.raw_decode(self.text, offset)
+                    if end < len(self.text) or complete:
+                        return value, self.base + end
+                except json.JSONDecodeError:
+                    if complete:
+                        raise
+                size = max(size, 2 * (len(self.text) - offset))  # the value runs past the window
+            self.base, self.text = pos, self.buf[pos:pos + size].decode('latin-1')
+
+
+def _utf8(text):
+    return text.encode('latin-1').decode('utf-8') if isinstance(text, str) else text
+
+
+def index_game_data(path):
+    """
+    Scans a game data file section by section, decoding each item of the STREAMED_SECTIONS
+    only long enough to read its id. Returns {'sections': {name: (start, end)}, 'items':
+    {name: {id: (start, end)}}}, the byte spans of every top-level section and streamed item.
+    """
+    sections, items = {}, {}
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+        window = _JsonWindow(buf)
+        pos = _JSON_COMMA.match(buf, _JSON_COMMA.match(buf, 0).end() + 1).end()  # past the opening '{'
+        while buf[pos] != ord('}'):
+            name, pos = window.decode(pos)
+            name = _utf8(name)
+            start = _JSON_COLON.match(buf, pos).end()
+            if name not in STREAMED_SECTIONS:
+                end = window.decode(start)[1]
+            elif buf[start] != ord('['):
+                raise ValueError(f"{name} must be a list")
+            else:
+                spans = items[name] = {}
+                pos = _JSON_COMMA.match(buf, start + 1).end()
+                while buf[pos] != ord(']'):
+                    item, end = window.decode(pos)
+                    item_id = _utf8(item.get('id')) if isinstance(item, dict) else None
+                    if item_id is None or item_id in spans:
+                        raise ValueError(f"missing or duplicate id in {name}")
+                    spans[item_id] = (pos, end)
+                    pos = _JSON_COMMA.match(buf, end).end()
+                end = pos + 1
+            sections[name] = (start, end)
+            pos = _JSON_COMMA.match(buf, end).end()
+    return {"sections": sections, "items": items}
+
+
+class LazySection:
+    """
+    A streamed section of a game data file. Iterating decodes the items in file order one
+    at a time without keeping them; indexing by id decodes that item on first access and
+    keeps it. Only the path and spans are pickled, so it can be sent to worker processes.
+    """
+    def __init__(self, path, spans):
+        self.path = path
+        self.spans = spans     # shape: { item id: (start, end) }, in file order
+        self._decoded = {}
+        self._buffer = None
+
+    def __getstate__(self):
+        return {"path": self.path, "spans": self.spans}
+
+    def __setstate__(self, state):
+        self.__init__(state["path"], state["spans"])
+
+    def _decode(self, span):
+        if self._buffer is None:
+            with open(self.path, 'rb') as f:
+                self._buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        start, end = span
+        return json.loads(self._buffer[start:end])
+
+    def __len__(self):
+        return len(self.spans)
+
+    def __iter__(self):
+        for item_id, span in self.spans.items():
+            yield self._decoded[item_id] if item_id in self._decoded else self._decode(span)
+
+    def __contains__(self, item_id):
+        return item_id in self.spans
+
+    def __getitem__(self, item_id):
+        if item_id not in self._decoded:
+            self._decoded[item_id] = self._decode(self.spans[item_id])
+        return self._decoded[item_id]
+
+    def get(self, item_id, default=None):
+        return self[item_id] if item_id in self.spans else default
+
+
+def stream_game_data(path='game_data.json', index_path=None):
+    """
+    Loads game data section by section: the STREAMED_SECTIONS become LazySections and
+    everything else is decoded as usual. The byte index is kept in index_path (path +
+    '.index' by default) while the file's mtime and size match, so a large file is only
+    scanned once. Returns the same compiled dict as load_game_data.
+    """
+    index_path = index_path or path + '.index'
+    signature = _file_signature(path)
+    try:
+        with open(index_path, 'rb') as f:
+            cached = pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError, IndexError):
+        cached = None
+    if isinstance(cached, dict) and cached.get('version') == STREAM_INDEX_VERSION and cached['signature'] == signature:
+        index = cached['index']
+    else:
+        index = index_game_data(path)
+        _write_cache(index_path, {"version": STREAM_INDEX_VERSION, "signature": signature, "index": index})
+
+    game_data = {}
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+        for name, (start, end) in index['sections'].items():
+            if name in index['items']:
+                game_data[name] = LazySection(path, index['items'][name])
+            else:
+                game_data[name] = json.loads(buf[start:end])
+    return compile_game_data(game_data)
+
+
+# ===============================
+# Procedural Heists
+# ===============================
+def generate_heist(config, district, n):
+    """
+    Heist number n of a district, built from the templates in the game data's
+    'procedural_heists' section in the same schema as the hand-written heists. The same
+    seed, district and n always give the same heist; difficulty climbs with n up to the
+    district's cap. Events and getaways share their outcome dicts with the templates.
+    """
+    rng = RandomStreams(config.get('seed', 0), ("heist", district['id'], n)).events
+    low, high = district['difficulty']
+    difficulty = min(high, low + n // district.get('escalate_every', 5) + rng.randint(0, 1))
+
+    templates = [t for t in config['events'] if t['check'] in district['checks']]
+    events = []
+    for template in rng.sample(templates, min(len(templates), 2 + (difficulty >= 5))):
+        event = dict(template, difficulty=max(1, difficulty + rng.randint(-1, 1)))
+        if rng.random() < 0.5:
+            event['scaling'] = {"notoriety_threshold": 6, "difficulty_increase": 1}
+        events.append(event)
+    getaway = dict(rng.choice(config['getaways']), difficulty=difficulty + rng.randint(0, 1))
+    loot = [{"item": item['item'], "value": int(round(item['value'] * difficulty / 30)) * 10}
+            for item in rng.sample(district['loot'], min(2, len(district['loot'])))]
+    required_roles = rng.sample(district['roles'], min(len(district['roles']), 1 + (difficulty >= 5)))
+
+    heist = {
+        "id": f"{ProceduralHeists.PREFIX}{district['id']}_{n}",
+        "name": f"The {rng.choice(district['adjectives'])} {rng.choice(district['sites'])} ({district['name']})",
+        "district": district['id'],
+        "difficulty": difficulty,
+        "xp_success": 4 * (difficulty - 1),
+        "xp_fail": 1,
+        "required_roles": required_roles,
+        "max_party_size": max(len(required_roles), 3 + (difficulty >= 5)),
+        "potential_loot": loot,
+        "getaway": getaway,
+        "events": events,
+    }
+    if district.get('extra_event'):
+        heist['scaling'] = {"notoriety_threshold": district.get('extra_event_notoriety', 8),
+                            "extra_event": district['extra_event']}
+    return heist
+
+
+def validate_procedural_heists(config):
+    """Raises ValueError if the 'procedural_heists' section cannot generate heists."""
+    districts = config.get('districts', [])
+    if len(_index_by_id(districts)) != len(districts):
+        raise ValueError("duplicate ids in procedural_heists districts")
+    if not config.get('getaways'):
+        raise ValueError("procedural_heists needs at least one getaway template")
+    for effects in outcome_effect_lists([], config.get('events', []), config['getaways']):
+        compile_effects(effects)
+    checks = {template['check'] for template in config.get('events', [])}
+    for district in districts:
+        if not checks.intersection(district['checks']):
+            raise ValueError(f"district '{district['id']}' has no event templates for its checks")
+        low, high = district['difficulty']
+        if low > high:
+            raise ValueError(f"district '{district['id']}' has an empty difficulty range")
+
+
+def procedural_heists(game_data):
+    """A ProceduralHeists for the game data, or None when it has no 'procedural_heists' section."""
+    config = game_data.get('procedural_heists')
+    return ProceduralHeists(config) if config else None
+
+
+class ProceduralHeists:
+    """
+    An effectively endless city of generated heists with ids like proc_<district>_<n>.
+    A heist is generated the first time it is looked up and kept in an LRU cache of
+    cache_size entries, so memory grows with the heists actually viewed, not the city.
+    """
+    PREFIX = "proc_"
+
+    def __init__(self, config):
+        self.config = config
+        self.districts = _index_by_id(config.get('districts', []))
+        self.offers_per_district = config.get('offers_per_district', 1)
+        self.cache_size = config.get('cache_size', 64)
+        self._cache = OrderedDict()  # heist id -> heist, least recently used first
+
+    def parse_id(self, heist_id):
+        """(district, n) for a procedural heist id, or None."""
+        if not heist_id.startswith(self.PREFIX):
+            return None
+        district_id, _, n = heist_id[len(self.PREFIX):].rpartition('_')
+        if district_id not in self.districts or not n.isdecimal() or str(int(n)) != n:
+            return None
+        return self.districts[district_id], int(n)
+
+    def get(self, heist_id):
+        """The heist with this id, generating it on first use, or None for an unknown id."""
+        heist = self._cache.get(heist_id)
+        if heist is not None:
+            self._cache.move_to_end(heist_id)
+            return heist
+        parsed = self.parse_id(heist_id)
+        if parsed is None:
+            return None
+        heist = self._cache[heist_id] = generate_heist(self.config, *parsed)
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return heist
+
+    def __contains__(self, heist_id):
+        return self.parse_id(heist_id) is not None
+
+    def templates(self):
+        """Every event and getaway template, whose outcome effects generated heists share."""
+        return self.config.get('events', []) + self.config.get('getaways', [])
+
+    def offers(self, heists_completed):
+        """
+        Ids of the jobs on offer: every district unlocked by heists_completed posts
+        offers_per_district heists, which move on as the crew completes heists.
+        """
+        return [f"{self.PREFIX}{district_id}_{n}"
+                for district_id, district in self.districts.items()
+                if heists_completed >= district.get('unlock_after', 0)
+                for n in range(heists_completed, heists_completed + self.offers_per_district)]
 
 
 # ===============================
 # Agents
 # ===============================
+VECTOR_MIN_MEMBERS = 16  # Below this many members a Python loop beats NumPy set-up
+
+
+class SkillMatrix:
+    """
+    Every crew skill value as one members x skills table of C ints, stored row-major in
+    an array('i'). Each CrewMember reads and writes its own row. Rows are only ever
+    appended, so forked agents share one table; a skill no member has yet adds a column.
+    """
+
+    def __init__(self):
+        self.columns = {}  # shape: { skill: column index }
+        self.width = 0
+        self.rows = 0
+        self.data = array('i')
+        self._tuples = {}  # shape: { tuple: the same tuple }, so records share their key and skill tuples
+
+    def column(self, skill):
+        """The column of skill, added (zero in every row) the first time it is seen."""
+        col = self.columns.get(skill)
+        if col is None:
+            old, width = self.data, self.width
+            data = array('i', bytes(old.itemsize * (width + 1) * self.rows))
+            if width:
+                for row in range(self.rows):
+                    data[row * (width + 1):row * (width + 1) + width] = old[row * width:(row + 1) * width]
+            col = self.columns[skill] = width
+            self.data, self.width = data, width + 1
+        return col
+
+    def add_row(self, source=None, skills=None):
+        """
+        Appends a row and returns its index: a copy of row source, the values of a
+        skills mapping (zero elsewhere), or all zeros.
+        """
+        if source is not None:
+            self.data.extend(self.data[source * self.width:(source + 1) * self.width])
+        elif skills:
+            cols = [self.column(skill) for skill in skills]
+            values = [0] * self.width
+            for col, value in zip(cols, skills.values()):
+                values[col] = value
+            self.data.extend(values)
+        else:
+            self.data.frombytes(bytes(self.data.itemsize * self.width))
+        self.rows += 1
+        return self.rows - 1
+
+    def set(self, row, skill, value):
+        col = self.column(skill)
+        self.data[row * self.width + col] = value
+
+    def view(self):
+        """
+        The table as a writable rows x width NumPy array over the same memory. Drop it
+        before the table grows: the array('i') cannot resize while a view is alive.
+        """
+        if not self.data:
+            return np.zeros((self.rows, self.width), dtype=np.intc)
+        return np.frombuffer(self.data, dtype=np.intc).reshape(self.rows, self.width)
+
+    def intern(self, values):
+        return self._tuples.setdefault(values, values)
+
+
+class _SkillsView(MutableMapping):
+    """member['skills']: a live dict-like view of one CrewMember's skill row."""
+    __slots__ = ("member",)
+
+    def __init__(self, member):
+        self.member = member
+
+    def __getitem__(self, skill):
+        if skill not in self.member.skill_names:
+            raise KeyError(skill)
+        return self.member.skill(skill)
+
+    def get(self, skill, default=None):
+        return self.member.skill(skill, default)
+
+    def __setitem__(self, skill, value):
+        self.member.set_skill(skill, value)
+
+    def __delitem__(self, skill):
+        member = self.member
+        if skill not in member.skill_names:
+            raise KeyError(skill)
+        member.set_skill(skill, 0)
+        member.skill_names = member.matrix.intern(tuple(name for name in member.skill_names if name != skill))
+
+    def __contains__(self, skill):
+        return skill in self.member.skill_names
+
+    def __iter__(self):
+        return iter(self.member.skill_names)
+
+    def __len__(self):
+        return len(self.member.skill_names)
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+
+class CrewMember(MutableMapping):
+    """
+    One crew member as a dict-compatible record: the usual fields live in slots, any
+    others in `extra`, and the skills in a SkillMatrix row that member['skills'] views.
+    key_order lists the keys present, in the order of the dict the record was built
+    from. skill() and set_skill() are the fast paths; copy() shares the row until
+    either record writes a skill.
+    """
+    FIELDS = frozenset(("id", "name", "role", "xp", "level", "upgrades", "description", "status"))
+    __slots__ = ("id", "name", "role", "xp", "level", "upgrades", "description", "status",
+                 "matrix", "row", "owns_row", "skill_names", "key_order", "extra")
+
+    def __init__(self, source, matrix):
+        self.id = self.name = self.role = self.xp = self.level = self.upgrades = self.description = self.status = None
+        self.matrix = matrix
+        self.extra = None
+        skills = source.get('skills', {})
+        self.row = matrix.add_row(skills=skills)
+        self.owns_row = True
+        self.skill_names = matrix.intern(tuple(skills))
+        order = tuple(source) if 'skills' in source else tuple(source) + ('skills',)
+        self.key_order = matrix.intern(order)
+        for key, value in source.items():
+            if key in self.FIELDS:
+                setattr(self, key, value)
+            elif key != 'skills':
+                if self.extra is None:
+                    self.extra = {}
+                self.extra[key] = value
+        if self.upgrades is not None:
+            self.upgrades = list(self.upgrades)
+
+    def skill(self, name, default=0):
+        if name not in self.skill_names:
+            return default
+        matrix = self.matrix
+        return matrix.data[self.row * matrix.width + matrix.columns[name]]
+
+    def set_skill(self, name, value):
+        if not self.owns_row:
+            self.own_row()
+        self.matrix.set(self.row, name, value)
+        if name not in self.skill_names:
+            self.skill_names = self.matrix.intern(self.skill_names + (name,))
+
+    def own_row(self):
+        """Moves this record to a private copy of its row if a copy() still shares it."""
+        if not self.owns_row:
+            self.row = self.matrix.add_row(self.row)
+            self.owns_row = True
+
+    def copy(self):
+        """A record with the same fields, sharing this one's skill row until either writes a skill."""
+        twin = CrewMember.__new__(CrewMember)
+        (twin.id, twin.name, twin.role, twin.xp, twin.level, twin.description, twin.status,
+         twin.matrix, twin.row, twin.skill_names, twin.key_order) = (
+            self.id, self.name, self.role, self.xp, self.level, self.description, self.status,
+            self.matrix, self.row, self.skill_names, self.key_order)
+        twin.upgrades = None if self.upgrades is None else list(self.upgrades)
+        twin.extra = None if self.extra is None else dict(self.extra)
+        self.owns_row = twin.owns_row = False
+        return twin
+
+    def to_dict(self):
+        """A plain dict copy of this member, e.g. for saving."""
+        matrix = self.matrix
+        data, columns, start = matrix.data, matrix.columns, self.row * matrix.width
+        member = {}
+        for key in self.key_order:
+            if key in self.FIELDS:
+                member[key] = getattr(self, key)
+            elif key == 'skills':
+                member[key] = {name: data[start + columns[name]] for name in self.skill_names}
+            else:
+                member[key] = self.extra[key]
+        if self.upgrades is not None:
+            member['upgrades'] = list(self.upgrades)
+        return member
+
+    def __getitem__(self, key):
+        if key not in self.key_order:
+            raise KeyError(key)
+        if key in self.FIELDS:
+            return getattr(self, key)
+        if key == 'skills':
+            return _SkillsView(self)
+        return self.extra[key]
+
+    def get(self, key, default=None):
+        return self[key] if key in self.key_order else default
+
+    def __setitem__(self, key, value):
+        if key in self.FIELDS:
+            setattr(self, key, value)
+        elif key == 'skills':
+            skills = dict(value)
+            self.row, self.owns_row = self.matrix.add_row(skills=skills), True
+            self.skill_names = self.matrix.intern(tuple(skills))
+        else:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+        if key not in self.key_order:
+            self.key_order = self.matrix.intern(self.key_order + (key,))
+
+    def __delitem__(self, key):
+        if key not in self.key_order:
+            raise KeyError(key)
+        if key in self.FIELDS:
+            setattr(self, key, None)
+        elif key == 'skills':
+            self.row, self.owns_row, self.skill_names = self.matrix.add_row(), True, ()
+        else:
+            del self.extra[key]
+        self.key_order = self.matrix.intern(tuple(k for k in self.key_order if k != key))
+
+    def __contains__(self, key):
+        return key in self.key_order
+
+    def __iter__(self):
+        return iter(self.key_order)
+
+    def __len__(self):
+        return len(self.key_order)
+
+    def __repr__(self):
+        return repr(self.to_dict())
+
+    def __reduce__(self):
+        return CrewMember, (self.to_dict(), SkillMatrix())
+
+
 class CrewAgent:
     # Adding outcome constants for clarity
     SUCCESS = "success"
     PARTIAL = "partial"
     FAILURE = "failure"
 
-    def __init__(self, crew_data, progression_data):
-        self.crew_members = {c['id']: c for c in crew_data}
+    def __init__(self, crew_data, progression_data, events=None, rng=None, changes=None):
+        members = _index_by_id(crew_data)
+        self.skill_matrix = SkillMatrix()
+        for member in members.values():
+            for skill in member.get('skills', {}):
+                self.skill_matrix.column(skill)
+        # Records may be shared with forked agents; write through edit_member.
+        self.crew_members = {crew_id: CrewMember(member, self.skill_matrix) for crew_id, member in members.items()}
         self.progression_data = progression_data
+        self.events = events or console_bus()
+        self.rng = rng or RandomStreams()
+        self._owned = dict(self.crew_members)  # shape: { crew_id: record this agent may write in place }
+        self.changes = changes or ChangeClock()
+        self.edit_stamps = {}  # shape: { crew_id: change stamp of its latest edit }, oldest first
+        self.roster_stamp = self.changes.now  # change stamp of the last time the roster was replaced
 
     def get_crew_member(self, crew_id):
         return self.crew_members.get(crew_id)
 
+    def edit_member(self, crew_id):
+        """The member record for crew_id, ready to modify: copied first unless this agent owns it."""
+        member = self.crew_members.get(crew_id)
+        if member is None:
+            return member
+        self.edit_stamps.pop(crew_id, None)
+        self.edit_stamps[crew_id] = self.changes.now
+        if self._owned.get(crew_id) is member:
+            return member
+        member = member.copy() if isinstance(member, CrewMember) else CrewMember(member, self.skill_matrix)
+        self.crew_members[crew_id] = self._owned[crew_id] = member
+        return member
+
+    def best_member(self, crew_ids, skill, temporary_effects=None):
+        """
+        (crew_id, effective skill) of the first of crew_ids with the highest skill plus
+        temporary modifier, or (None, -99). Large groups are ranked with one NumPy argmax.
+        """
+        temporary_effects = temporary_effects or {}
+        crew_members = self.crew_members
+        matrix = self.skill_matrix
+        if np is not None and len(crew_ids) >= VECTOR_MIN_MEMBERS and skill in matrix.columns:
+            members = [(crew_id, crew_members[crew_id]) for crew_id in crew_ids if crew_id in crew_members]
+            if members and all(member.matrix is matrix for _, member in members):
+                rows = np.fromiter((member.row for _, member in members), dtype=np.intp, count=len(members))
+                values = matrix.view()[rows, matrix.columns[skill]].astype(np.int64)
+                if temporary_effects:
+                    values += np.fromiter((temporary_effects.get(crew_id, {}).get(skill, 0) for crew_id, _ in members),
+                                          dtype=np.int64, count=len(members))
+                best = int(values.argmax())
+                if values[best] <= -99:
+                    return None, -99
+                return members[best][0], int(values[best])
+
+        best_crew_id, best_skill = None, -99
+        for crew_id in crew_ids:
+            member = crew_members.get(crew_id)
+            if member is None:
+                continue
+            effective_skill = member.skill(skill)
+            if temporary_effects:
+                effective_skill += temporary_effects.get(crew_id, {}).get(skill, 0)
+            if effective_skill > best_skill:
+                best_crew_id, best_skill = crew_id, effective_skill
+        return best_crew_id, best_skill
+
+    def set_all_skills(self, value):
+        """Sets every skill of every member to value, writing the matrix in bulk where it can."""
+        members = [self.edit_member(crew_id) for crew_id in self.crew_members]
+        for member in members:
+            member.own_row()
+        matrix = self.skill_matrix
+        if np is not None and len(members) >= VECTOR_MIN_MEMBERS and all(member.matrix is matrix for member in members):
+            groups = {}  # shape: { skill-name tuple: [rows] }; tuples are interned, so groups are few
+            for member in members:
+                groups.setdefault(member.skill_names, []).append(member.row)
+            table = matrix.view()
+            for names, rows in groups.items():
+                if names:
+                    table[np.ix_(rows, [matrix.columns[name] for name in names])] = value
+            return
+        for member in members:
+            for skill in member.skill_names:
+                member.set_skill(skill, value)
+
+    def fork(self, events=None, rng=None):
+        """A copy sharing every member dict with this agent until either side edits one."""
+        child = copy.copy(self)
+        child.crew_members = dict(self.crew_members)
+        child.events = events or self.events
+        child.rng = rng or self.rng
+        child._owned = {}
+        child.edit_stamps = dict(self.edit_stamps)
+        self._owned = {}
+        return child
+
+    def edited_since(self, mark):
+        """Ids of the members edited since a ChangeClock mark, most recent first."""
+        for crew_id, stamp in reversed(self.edit_stamps.items()):
+            if stamp <= mark:
+                break
+            yield crew_id
+
+    def touch(self):
+        """Marks every member as edited, e.g. after the roster is replaced."""
+        self.edit_stamps = dict.fromkeys(self.crew_members, self.changes.now)
+
+    def load_members(self, crew_data):
+        """Replaces the roster in place with records built from crew_data, e.g. a loaded save."""
+        loaded = CrewAgent(crew_data, self.progression_data, self.events, self.rng, self.changes)
+        self.skill_matrix = loaded.skill_matrix
+        self.crew_members = loaded.crew_members
+        self._owned = loaded._owned
+        self.roster_stamp = self.changes.now
+        self.touch()
+
     def add_xp(self, crew_id, xp_amount):
         """Adds XP to a crew member and checks for level ups."""
-        member = self.get_crew_member(crew_id)
-        if not member:
+        member = self.edit_member(crew_id)
+        if member is None:
             return False
 
-        member['xp'] += xp_amount
+        member.xp += xp_amount
         leveled_up = False
 
         xp_thresholds = self.progression_data['xp_thresholds']
 
         # Using a while loop in case of multiple level-ups from a large XP gain
-        while member['level'] < self.progression_data['level_cap'] and member['xp'] >= xp_thresholds[member['level']]:
-            member['level'] += 1
+        while member.level < self.progression_data['level_cap'] and member.xp >= xp_thresholds[member.level]:
+            member.level += 1
             leveled_up = True
-            print(f"[Progression] {member['name']} has reached Level {member['level']}!")
+            self.events.emit('crew.level_up', crew_id=crew_id, name=member.name, level=member.level)
 
         return leveled_up
 
     def perform_skill_check(self, crew_id, skill, difficulty, partial_success_margin=1, roll=None, tool_bonus=0, temporary_effects=None):
 
         crew_member = self.get_crew_member(crew_id)
-        if not crew_member:
+        if crew_member is None:
             # Consistent return type, and a helpful debug message
-            print(f"[Warning] perform_skill_check: crew '{crew_id}' not found.")
+            self.events.emit('check.unknown_crew', crew_id=crew_id)
             return self.FAILURE
 
         if temporary_effects is None:
             temporary_effects = {}
 
-        base_skill_value = crew_member['skills'].get(skill, 0)
+        base_skill_value = crew_member.skill(skill)
         # safe lookup for temporary modifier
         temp_modifier = temporary_effects.get(crew_id, {}).get(skill, 0)
         effective_skill = base_skill_value + temp_modifier
 
         if roll is None:
-            roll = random.randint(1, 10)
+            roll = self.rng.rolls.randint(1, CHECK_DIE_SIDES)
 
         total_skill = effective_skill + tool_bonus + roll
 
-        print(f"  > {crew_member['name']} attempts {skill} check (Difficulty: {difficulty})")
-        if temp_modifier != 0:
-            print(f"  > Base Skill: {base_skill_value} (Modified to {effective_skill} by temporary effect)")
-        else:
-            print(f"  > Skill: {base_skill_value}")
-        print(f"  > + Tool/Ability Bonus: {tool_bonus} + Roll: {roll} = Total: {total_skill}")
-
         if total_skill >= difficulty:
-            return self.SUCCESS
+            result = self.SUCCESS
         elif total_skill >= difficulty - partial_success_margin:
-            return self.PARTIAL
+            result = self.PARTIAL
         else:
-            return self.FAILURE
+            result = self.FAILURE
+
+        self.events.emit('check.roll', crew_id=crew_id, name=crew_member.name, skill=skill, difficulty=difficulty,
+                         base_skill=base_skill_value, temp_modifier=temp_modifier, effective_skill=effective_skill,
+                         tool_bonus=tool_bonus, roll=roll, total=total_skill, result=result)
+        return result
+
+    def skill_check_probabilities(self, crew_id, skill, difficulty, partial_success_margin=1, tool_bonus=0,
+                                  temporary_effects=None, event_bonus=0, exact=False):
+        """
+        Exact outcome distribution of perform_skill_check with the same arguments, without
+        rolling. event_bonus covers event-wide buffs (elixirs, Clockwork Legion) that
+        run_heist otherwise folds into tool_bonus.
+        """
+        crew_member = self.get_crew_member(crew_id)
+        if crew_member is None:
+            return skill_check_distribution(0, float('inf'), partial_success_margin, exact)
+
+        temp_modifier = (temporary_effects or {}).get(crew_id, {}).get(skill, 0)
+        modifier = crew_member.skill(skill) + temp_modifier + tool_bonus + event_bonus
+        return skill_check_distribution(modifier, difficulty, partial_success_margin, exact)
 
 
 class ToolAgent:
     def __init__(self, tool_data):
-        self.tools = {t['id']: t for t in tool_data}
+        self.tools = _index_by_id(tool_data)
 
     def get_tool_effect(self, tool_id, crew_role):
         tool = self.tools.get(tool_id)
@@ -108,14 +1866,433 @@ class ToolAgent:
         return tool and crew_role in tool['usable_by']
 
 
+class HeistPlan:
+    """
+    A heist compiled for one party and tool loadout. Holds the party members, their
+    upgrades, the best member per skill and each event's resolved tool action, so the
+    event loop looks things up instead of rescanning the crew every event.
+    """
+    # Tool actions resolved per (event, crew member)
+    TOOL_BONUS = "bonus"
+    TOOL_REDUCTION = "difficulty_reduction"
+    TOOL_BYPASS = "bypass"
+    TOOL_ALCHEMY = "alchemy_craft"
+
+    def __init__(self, heist, crew_ids, tool_assignments, crew_agent, tool_agent):
+        self.heist = heist
+        self.crew_ids = list(crew_ids)
+        self.tool_assignments = tool_assignments
+        self.crew_agent = crew_agent
+        self.tool_agent = tool_agent
+        self.members = {}
+        for crew_id in crew_ids:
+            member = crew_agent.get_crew_member(crew_id)
+            if member is not None:
+                self.members[crew_id] = member
+        self.upgrades = {crew_id: set(member.upgrades or ()) for crew_id, member in self.members.items()}
+        self.eagle_present = any('scout_eagle_of_brasshaven' in upgrades for upgrades in self.upgrades.values())
+        self._best = {}          # shape: { skill: (crew_id, skill_value) } from base skills
+        self._tool_actions = {}  # shape: { (id(event), crew_id): (tool_id, tool, effect, action) }
+
+    def member(self, crew_id):
+        """The party member with this id, or None if they are not on this heist."""
+        return self.members.get(crew_id)
+
+    def has_upgrade(self, crew_id, upgrade):
+        return upgrade in self.upgrades.get(crew_id, ())
+
+    def best_member(self, skill, temporary_effects=None):
+        """
+        (crew_id, effective skill) of the first party member with the highest skill, or
+        (None, -99). Uses the base-skill table unless temporary effects are active.
+        """
+        if not temporary_effects:
+            if skill not in self._best:
+                self._best[skill] = self.crew_agent.best_member(self.members, skill)
+            return self._best[skill]
+        return self.crew_agent.best_member(self.members, skill, temporary_effects)
+
+    def tool_action(self, event, crew_id):
+        """
+        (tool_id, tool, effect, action) for the tool this member carries into the event.
+        action is one of the TOOL_* constants, or None when the tool does not apply to
+        the event; tool_id is None when they carry no usable tool.
+        """
+        key = (id(event), crew_id)
+        if key not in self._tool_actions:
+            self._tool_actions[key] = self._resolve_tool(event, crew_id)
+        return self._tool_actions[key]
+
+    def _resolve_tool(self, event, crew_id):
+        tool_id = self.tool_assignments.get(crew_id)
+        member = self.members.get(crew_id)
+        effect = self.tool_agent.get_tool_effect(tool_id, member.role) if tool_id and member is not None else {}
+        if not effect:
+            return None, None, {}, None
+
+        action = None
+        if effect.get('type') == 'bonus' and (effect.get('skill') == event['check'] or effect.get('skill') == 'any'):
+            action = self.TOOL_BONUS
+        elif effect.get('type') == 'difficulty_reduction':
+            if effect.get('condition', '').replace('-', ' ') in event['description'].lower():
+                action = self.TOOL_REDUCTION
+        elif effect.get('type') == 'bypass' and effect.get('check') == event['check']:
+            action = self.TOOL_BYPASS
+        elif effect.get('type') == 'special' and effect.get('id') == 'alchemy_craft':
+            action = self.TOOL_ALCHEMY
+        return tool_id, self.tool_agent.tools[tool_id], effect, action
+
+
+class PartySearch:
+    """
+    Branch and bound over the parties for one heist; see HeistAgent.suggest_parties.
+
+    Members are tried strongest first, tracking which member leads each check (run_heist
+    picks the highest base skill, earliest on ties). A branch is dropped once an optimistic
+    bound cannot beat the current top_k, and members that would lead no check, fill no
+    required role and bring no Eagle are never added, as they cannot change the odds. Tools
+    only matter in a leader's hands, so they are assigned per finished party rather than
+    searched member by member.
+
+    Rosters of up to EXACT_LIMIT active members are searched in full, so the parties found
+    are the true best. Larger rosters are first narrowed by _shortlist, which makes the
+    result approximate: a member outside the shortlist can still belong to the best party.
+    """
+    EXACT_LIMIT = 24
+
+    def __init__(self, agent, heist_id, heist, objective="success", candidates=None):
+        self.agent = agent
+        self.heist_id = heist_id
+        self.max_size = heist.get('max_party_size', 3)
+        self.required_roles = set(heist.get('required_roles', []))
+        self.loot_value = sum(item['value'] for item in heist.get('potential_loot', []))
+        self.scale = self.loot_value if objective == "expected_value" else 1
+        self._prepare_events(heist)
+        self._prepare_tools()
+        self._prepare_members(candidates)
+        self._prepare_bounds()
+
+    def _prepare_events(self, heist):
+        """The heist's events and the random events that may join them, as run_heist prepares them."""
+        agent, notoriety = self.agent, self.agent.city_agent.notoriety
+        self.events = list(heist['events'])
+        scaling = heist.get('scaling', {})
+        if notoriety >= scaling.get('notoriety_threshold', 999) and scaling.get('extra_event') in agent.special_events:
+            self.events.append(agent.special_events[scaling['extra_event']])
+        fear, respect = agent.city_agent.reputation['fear'], agent.city_agent.reputation['respect']
+        self.random_events = []
+        for template in agent.random_events:
+            event = dict(template)
+            if 'reputation_hook' in event:
+                event['difficulty'] += 1 if fear > respect else -1 if respect > fear else 0
+            event['description'] = f"[Random Event] {event['description']}"
+            self.random_events.append(event)
+        self.all_events = self.events + self.random_events
+        self.checks = sorted({event['check'] for event in self.all_events})
+
+        self.start_difficulty = {}
+        for event in self.all_events:
+            ev_scaling = event.get('scaling', {})
+            self.start_difficulty[id(event)] = event['difficulty']
+            if notoriety >= ev_scaling.get('notoriety_threshold', 999):
+                self.start_difficulty[id(event)] += ev_scaling.get('difficulty_increase', 0)
+
+    def _prepare_tools(self):
+        """Per-tool effect tables, keyed by (tool, check) or (tool, event id); a missing key means no effect."""
+        tools, checks, all_events = self.agent.tool_agent.tools, self.checks, self.all_events
+        self.inventory = {tid: count for tid, count in self.agent.city_agent.tool_inventory.items()
+                          if count > 0 and tid in tools}
+        self.bonus_of, self.reduction_of, self.bypasses, self.signature = {}, {}, set(), {}
+        for tid in self.inventory:
+            effect = tools[tid].get('effect', {})
+            for check in checks:
+                if effect.get('type') == 'bonus' and effect.get('skill') in (check, 'any'):
+                    self.bonus_of[tid, check] = effect['value']
+                if effect.get('type') == 'bypass' and effect.get('check') == check:
+                    self.bypasses.add((tid, check))
+            for event in all_events:
+                if (effect.get('type') == 'difficulty_reduction' and
+                        effect.get('condition', '').replace('-', ' ') in event['description'].lower()):
+                    self.reduction_of[tid, id(event)] = effect['value']
+            for check in checks:
+                sig = (self.bonus_of.get((tid, check), 0), (tid, check) in self.bypasses,
+                       tuple(self.reduction_of.get((tid, id(event)), 0) for event in all_events if event['check'] == check))
+                if any(sig[:2]) or any(sig[2]):
+                    self.signature[tid, check] = sig
+        self.useful_tools = [tid for tid in self.inventory if any((tid, check) in self.signature for check in checks)]
+        self.max_reduction = {id(event): max([self.reduction_of.get((tid, id(event)), 0) for tid in self.useful_tools], default=0)
+                              for event in all_events}
+        self.bypassable = {check for check in checks if any((tid, check) in self.bypasses for tid in self.useful_tools)}
+
+    def _prepare_members(self, candidates):
+        """The active candidates as search entries, strongest first."""
+        crew_agent, checks = self.agent.crew_agent, self.checks
+        pool = candidates if candidates is not None else list(crew_agent.crew_members)
+        active, role_tools, role_bonus = [], {}, {}
+        for cid in pool:
+            member = crew_agent.get_crew_member(cid)
+            if member and member.get('status', 'active') == 'active':
+                role = member['role']
+                if role not in role_tools:
+                    # Usable tools, and so a member's best tool bonus per check, depend only on the role
+                    tools = role_tools[role] = [tid for tid in self.useful_tools
+                                                if self.agent.tool_agent.validate_tool_usage(tid, role)]
+                    role_bonus[role] = [max([self.bonus_of.get((tid, check), 0) for tid in tools], default=0) for check in checks]
+                active.append((cid, member))
+
+        searched = range(len(active))
+        if len(active) > self.EXACT_LIMIT:
+            searched = sorted(self._shortlist(active, role_bonus))
+        self.members = []  # entries: (crew_id, member, usable tools, base skills, skill + best tool bonus, has Eagle)
+        for i in searched:
+            cid, member = active[i]
+            skills = {check: member.skill(check) for check in checks}
+            bonus = role_bonus[member['role']]
+            best = {check: skills[check] + bonus[k] for k, check in enumerate(checks)}
+            eagle = 'scout_eagle_of_brasshaven' in member.get('upgrades', [])
+            self.members.append((cid, member, role_tools[member['role']], skills, best, eagle))
+        self.members.sort(key=lambda m: -sum(m[4].values()))
+
+    def _shortlist(self, active, role_bonus):
+        """
+        Indexes into active (a list of (crew_id, member)) worth searching in a large roster:
+        the strongest max_party_size members by skill plus tool bonus for each check, and
+        for each required role, plus any Eagle of Brasshaven scout. This is a heuristic; a
+        member who tops no single list can still be best through combined coverage. Ties
+        keep roster order. Large rosters are ranked with NumPy over the crew skill matrix.
+        """
+        checks, max_size = self.checks, self.max_size
+        shortlist = {i for i, (_, member) in enumerate(active)
+                     if 'scout_eagle_of_brasshaven' in member.get('upgrades', [])}
+        matrix = self.agent.crew_agent.skill_matrix
+        if np is not None and len(active) >= VECTOR_MIN_MEMBERS and all(member.matrix is matrix for _, member in active):
+            rows = np.fromiter((member.row for _, member in active), dtype=np.intp, count=len(active))
+            table = matrix.view()
+            base = np.zeros((len(active), len(checks)), dtype=np.int64)
+            for k, check in enumerate(checks):
+                if check in matrix.columns:
+                    base[:, k] = table[rows, matrix.columns[check]]
+            del table
+            roles = list(role_bonus)
+            role_ids = np.fromiter((roles.index(member['role']) for _, member in active), dtype=np.intp, count=len(active))
+            best = base + np.array([role_bonus[role] for role in roles], dtype=np.int64).reshape(len(roles), len(checks))[role_ids]
+            for k in range(len(checks)):
+                shortlist.update(np.lexsort((-base[:, k], -best[:, k]))[:max_size].tolist())
+            totals = best.sum(axis=1)
+            for role in self.required_roles:
+                if role in role_bonus:
+                    same_role = np.flatnonzero(role_ids == roles.index(role))
+                    shortlist.update(same_role[np.argsort(-totals[same_role], kind='stable')[:max_size]].tolist())
+            return shortlist
+
+        base = [[member.skill(check) for check in checks] for _, member in active]
+        best = [[skill + bonus for skill, bonus in zip(skills, role_bonus[member['role']])]
+                for skills, (_, member) in zip(base, active)]
+        for k in range(len(checks)):
+            shortlist.update(sorted(range(len(active)), key=lambda i: (-best[i][k], -base[i][k]))[:max_size])
+        for role in self.required_roles:
+            same_role = [i for i, (_, member) in enumerate(active) if member['role'] == role]
+            shortlist.update(sorted(same_role, key=lambda i: -sum(best[i]))[:max_size])
+        return shortlist
+
+    def _prepare_bounds(self):
+        """Suffix tables over the sorted members, so bound() is a few lookups per check."""
+        members, checks = self.members, self.checks
+        n = len(members)
+        # overtake[check][i][level]: best skill+tool among candidates i.. whose base skill
+        # beats the given leader skill level (level 0 = no leader yet).
+        levels = {check: sorted({m[3][check] for m in members}) for check in checks}
+        self.level_index = {check: {skill: k + 1 for k, skill in enumerate(levels[check])} for check in checks}
+        self.overtake = {check: [[-99] * (len(levels[check]) + 1) for _ in range(n + 1)] for check in checks}
+        self.suffix_base = [dict.fromkeys(checks, -99) for _ in range(n + 1)]
+        self.suffix_roles = [set() for _ in range(n + 1)]
+        self.suffix_eagle = [False] * (n + 1)
+        for i in range(n - 1, -1, -1):
+            _, member, _, skills, best, eagle = members[i]
+            for check in checks:
+                row = self.overtake[check][i] = list(self.overtake[check][i + 1])
+                row[0] = max(row[0], best[check])
+                for k, skill in enumerate(levels[check], 1):
+                    if skills[check] > skill:
+                        row[k] = max(row[k], best[check])
+                self.suffix_base[i][check] = max(self.suffix_base[i + 1][check], skills[check])
+            self.suffix_roles[i] = self.suffix_roles[i + 1] | {member['role']}
+            self.suffix_eagle[i] = self.suffix_eagle[i + 1] or eagle
+
+    def odds_bound(self, modifiers, bases, reduction, bypass, eagle):
+        """Upper bound on the score given each check's (optimistic) modifier and leader skill."""
+        def pass_bound(event):
+            check = event['check']
+            required = event.get('requirements', {}).get(check)
+            if modifiers[check] <= -99 or (required and bases[check] < required):
+                return 0.0
+            if check in bypass:
+                return 1.0
+            return _pass_chance(modifiers[check], self.start_difficulty[id(event)] - reduction(event))
+
+        # Notoriety only rises during a heist, so start-of-heist difficulties are a floor,
+        # and an inserted random event can only multiply the odds by its own pass chance.
+        p = self.scale
+        for event in self.events:
+            p *= pass_bound(event)
+            if not p:
+                return 0.0
+        if self.random_events and not eagle:
+            p *= 0.75 + 0.25 * sum(pass_bound(event) for event in self.random_events) / len(self.random_events)
+        return p
+
+    def bound(self, leaders, i, eagle):
+        """Optimistic score for any party extending `leaders` with candidates i.. ."""
+        modifiers, bases = {}, {}
+        for check in self.checks:
+            lead_base, lead_value, _ = leaders[check]
+            modifiers[check] = max(lead_value, self.overtake[check][i][self.level_index[check].get(lead_base, 0)])
+            bases[check] = max(lead_base, self.suffix_base[i][check])
+        return self.odds_bound(modifiers, bases, lambda event: self.max_reduction[id(event)], self.bypassable,
+                               eagle or self.suffix_eagle[i])
+
+    def threshold(self):
+        # The small slack keeps float noise in near-certain odds from defeating the bound.
+        return self._top[0][0] + 1e-9 * self.scale if len(self._top) >= self._top_k else -1.0
+
+    def best(self, top_k):
+        """Up to top_k dicts with 'crew_ids', 'tool_assignments', 'success' and 'expected_value', best first."""
+        self._top_k = top_k
+        self._top = []  # min-heap of (score, order, entry)
+        self._order = itertools.count()
+        self._odds_cache = {}
+        self.search(0, [], {check: (-99, -99, None) for check in self.checks}, set(), False)
+        return [entry for _, _, entry in sorted(self._top, reverse=True)]
+
+    def search(self, start, party, leaders, roles, eagle):
+        """Tries every party extending `party` with members from start on; leaders maps check -> (base, value, index)."""
+        if party:
+            self.consider(party, leaders, roles, eagle)
+        if len(party) == self.max_size:
+            return
+        missing = self.required_roles - roles
+        if len(missing) > self.max_size - len(party):
+            return
+        for i in range(start, len(self.members)):
+            if self.bound(leaders, i, eagle) <= self.threshold() or not missing <= self.suffix_roles[i]:
+                break  # both only get worse further down the sorted list
+            _, member, _, skills, best, member_eagle = self.members[i]
+            child = dict(leaders)
+            for check in self.checks:
+                if skills[check] > leaders[check][0]:
+                    child[check] = (skills[check], best[check], len(party))
+            if child == leaders and member['role'] not in missing and not (member_eagle and not eagle):
+                continue  # leads nothing, now or later, and fills no needed role
+            if self.bound(child, i + 1, eagle or member_eagle) <= self.threshold():
+                continue
+            party.append(self.members[i])
+            self.search(i + 1, party, child, roles | {member['role']}, eagle or member_eagle)
+            party.pop()
+
+    def consider(self, party, leaders, roles, eagle):
+        """Scores a finished party under each worthwhile tool assignment."""
+        if not self.required_roles <= roles or self.bound(leaders, len(self.members), eagle) <= self.threshold():
+            return
+        led = {}
+        for check in self.checks:
+            led.setdefault(leaders[check][2], []).append(check)
+        leader_list = list(led)
+
+        # Tools with the same effect on a leader's checks are interchangeable, so only
+        # enough copies to cover every leader are kept per effect.
+        options = []
+        for idx in leader_list:
+            groups = {}
+            for tid in party[idx][2]:
+                if any((tid, check) in self.signature for check in led[idx]):
+                    groups.setdefault(tuple(self.signature.get((tid, check)) for check in led[idx]), []).append(tid)
+            choices = []
+            for tids in groups.values():
+                covered = 0
+                for tid in sorted(tids, key=lambda t: -self.inventory[t]):
+                    if covered >= len(leader_list):
+                        break
+                    choices.append(tid)
+                    covered += self.inventory[tid]
+            options.append(choices + [None])
+        self._assign(party, leaders, eagle, leader_list, options, 0, {}, {})
+
+    def _tool_bound(self, leaders, eagle, holder):
+        """Bound with tools fixed for the leaders in `holder`, optimistic for the rest."""
+        modifiers, bases = {}, {}
+        for check in self.checks:
+            base, value, idx = leaders[check]
+            bases[check] = base
+            modifiers[check] = base + self.bonus_of.get((holder[idx], check), 0) if idx in holder else value
+
+        def reduction(event):
+            idx = leaders[event['check']][2]
+            return self.reduction_of.get((holder[idx], id(event)), 0) if idx in holder else self.max_reduction[id(event)]
+        bypass = {check for check in self.checks
+                  if ((holder[leaders[check][2]], check) in self.bypasses if leaders[check][2] in holder
+                      else check in self.bypassable)}
+        return self.odds_bound(modifiers, bases, reduction, bypass, eagle)
+
+    def _assign(self, party, leaders, eagle, leader_list, options, j, holder, used):
+        """Gives the j-th leader on each of their tool options in turn, recording finished assignments."""
+        if self._tool_bound(leaders, eagle, holder) <= self.threshold():
+            return
+        if j == len(leader_list):
+            self._record(party, leaders, eagle, holder)
+            return
+        idx = leader_list[j]
+        for tid in options[j]:
+            if tid and used.get(tid, 0) >= self.inventory[tid]:
+                continue
+            holder[idx] = tid
+            if tid:
+                used[tid] = used.get(tid, 0) + 1
+            self._assign(party, leaders, eagle, leader_list, options, j + 1, holder, used)
+            if tid:
+                used[tid] -= 1
+            del holder[idx]
+
+    def _record(self, party, leaders, eagle, holder):
+        crew_ids = [m[0] for m in party]
+        assignment = {party[idx][0]: tid for idx, tid in holder.items() if tid}
+        # Odds depend only on who leads each check, their tools and the Eagle.
+        key = (tuple((party[leaders[check][2]][0], holder[leaders[check][2]]) for check in self.checks), eagle)
+        if key not in self._odds_cache:
+            self._odds_cache[key] = self.agent.estimate_heist_odds(self.heist_id, crew_ids, assignment)['success']
+        success = self._odds_cache[key]
+        entry = {"crew_ids": crew_ids, "tool_assignments": assignment,
+                 "success": success, "expected_value": success * self.loot_value}
+        item = (success * self.scale, -next(self._order), entry)
+        if len(self._top) < self._top_k:
+            heapq.heappush(self._top, item)
+        elif item > self._top[0]:
+            heapq.heapreplace(self._top, item)
+
+
+# Ids for heist runs, unique in the process, so sinks can pair each heist.start with its
+# heist.summary when several games emit into one sink
+_HEIST_RUNS = itertools.count(1)
+
+
 class HeistAgent:
-    def __init__(self, heist_data, random_events_data, special_events_data, crew_agent, tool_agent, city_agent):
-        self.heists = {h['id']: h for h in heist_data}
+    # Outcomes for random events that do not define their own
+    RANDOM_EVENT_OUTCOMES = {
+        'success': {"text": "The crew handled the unexpected situation."},
+        'failure': {"text": "The event causes a complication.", "effects": [{"type": "add_notoriety", "value": 1}]},
+    }
+
+    def __init__(self, heist_data, random_events_data, special_events_data, crew_agent, tool_agent, city_agent, decisions=None,
+                 events=None, rng=None, procedural=None):
+        self.heists = _index_by_id(heist_data)
+        self.procedural = procedural               # ProceduralHeists behind get_heist, or None
         self.random_events = random_events_data
-        self.special_events = {e['id']: e for e in special_events_data}
+        self.special_events = _index_by_id(special_events_data)
         self.crew_agent = crew_agent
         self.tool_agent = tool_agent
         self.city_agent = city_agent
+        self.decisions = decisions or ConsoleDecisions()
+        self.events = events or console_bus()
+        self.rng = rng or crew_agent.rng  # rerolls go through crew_agent, so share its streams by default
 
         # Persistent defaults so methods like _apply_effects can be called anytime
         self.tools_used_this_heist = {}            # shape: { crew_id: { tool_id: used_count } }
@@ -124,99 +2301,216 @@ class HeistAgent:
         self.double_loot_active = False
         self.arcane_reservoir_stored = False
         self.last_heist_successful = False # Exposed for other systems to check
- 
+        self.last_event_outcomes = {'success': 0, 'partial': 0, 'failure': 0}
+        self.last_heist_loot = []
+        self.last_getaway_result = None
+
+        self._compiled_effects = {}                # shape: { id(effects list): (effects list, [compiled effect]) }
+        self._compile_outcome_effects()
+
+    def fork(self, crew_agent, city_agent, events=None, rng=None):
+        """A copy bound to forked crew and city agents, sharing heist data and compiled effects."""
+        child = copy.copy(self)
+        child.crew_agent, child.city_agent = crew_agent, city_agent
+        child.events = events or self.events
+        child.rng = rng or self.rng
+        child.tools_used_this_heist = {}
+        child.abilities_used_this_heist = set()
+        child.temporary_effects = {}
+        child.last_event_outcomes = dict(self.last_event_outcomes)
+        child.last_heist_loot = list(self.last_heist_loot)
+        return child
+
+    def _estimate_event_chance(self, event, crew_ids, bonus=0):
+        """Success chance of the best crew member on an event, before tools and scaling."""
+        best_crew_id, best_skill = self.crew_agent.best_member(crew_ids, event['check'], self.temporary_effects)
+        if best_crew_id is None:
+            return 0.0
+        return _success_chance(best_skill + bonus, event['difficulty'])
+
+    def _compile_outcome_effects(self):
+        """Compiles the effect list of every event and getaway outcome once, at load time."""
+        special_events = list(self.special_events.values()) + [self.RANDOM_EVENT_OUTCOMES]
+        if self.procedural:
+            special_events += self.procedural.templates()
+        for effects in outcome_effect_lists(self.heists.values(), self.random_events, special_events):
+            if id(effects) not in self._compiled_effects:
+                self._compiled_effects[id(effects)] = (effects, compile_effects(effects))
+
+    def get_heist(self, heist_id):
+        """A hand-written heist by id, else a procedural one (generated on first use), else None."""
+        heist = self.heists.get(heist_id)
+        if heist is None and self.procedural is not None:
+            heist = self.procedural.get(heist_id)
+        return heist
 
-    # New helper method in HeistAgent
     def _apply_effects(self, effects, crew_ids, active_crew_id, total_loot=None):
         """Applies a list of effect objects to the game state."""
         if not effects:
             return
 
-        for effect in effects:
-            etype = effect.get('type')
-
-            if etype == 'add_notoriety':
-                self.city_agent.increase_notoriety(effect.get('value', 1))
-
-            elif etype == 'update_reputation':
-                self.city_agent.update_reputation(effect['rep_type'], effect['value'])
-
-            elif etype == 'set_status':
-                target_id = active_crew_id if effect.get('who') == 'active_member' else random.choice(crew_ids)
-                member = self.crew_agent.get_crew_member(target_id)
-                if member:
-                    member['status'] = effect['status']
-                    print(f"  > [Effect Applied!] {member['name']} is now {effect['status']}!")
-                    # Unlock rescue heist if someone is arrested
-                    if effect['status'] == 'arrested':
-                        if "rescue_heist" not in self.city_agent.unlocked_heists:
-                            self.city_agent.unlocked_heists.add("rescue_heist")
-                            print("[Heist Unlocked] Rescue Heist is now available to free your crew!")
-
-            elif etype == 'lose_loot':
-                scope = effect.get('scope')
-                if scope == 'half' and total_loot:
-                    half = len(total_loot) // 2
-                    del total_loot[:half]
-                elif scope == 'primary' and total_loot:
-                    total_loot.pop(0)
-                else:
-                    amount = effect.get('amount', effect.get('value', 1))
-                    for _ in range(amount):
-                        if total_loot:
-                            total_loot.pop()
-
-            elif etype == 'set_faction_hostile':
-                faction = effect.get('faction')
-                if faction == 'random':
-                    faction = random.choice(list(self.city_agent.factions.keys()))
-                self.city_agent.factions[faction]['standing'] = -999
-                print(f"[Faction] {self.city_agent.factions[faction]['name']} is now hostile!")
-
-
-            elif etype == 'modify_xp':
-                target_id = active_crew_id if effect.get('who') == 'active_member' else random.choice(crew_ids)
-                member = self.crew_agent.get_crew_member(target_id)
-                if member:
-                    value = effect.get('value', 0)
-                    member['xp'] += value
-                    print(f"  > [Effect Applied!] {member['name']}'s XP is modified by {value}!")
-
-            elif etype == 'temp_debuff':
-                target_ids = []
-                who = effect.get('who')
-                if who == 'all_members':
-                    target_ids = crew_ids
-                elif who == 'active_member':
-                    target_ids = [active_crew_id]
-                elif who == 'random_member':
-                    target_ids = [random.choice(crew_ids)]
-                # This part for role-based targeting needs to be a loop
-                elif 'role' in effect:
-                    for crew_id in crew_ids:
-                        member = self.crew_agent.get_crew_member(crew_id)
-                        if member and member['role'].lower() == effect['role'].lower():
-                            target_ids.append(crew_id)
-
-                for target_id in target_ids:
-                    if target_id not in self.temporary_effects:
-                        self.temporary_effects[target_id] = {}
-                    skill = effect['skill']
-                    value = effect['value']
-                    member = self.crew_agent.get_crew_member(target_id) # Correctly get member inside loop
-                    if member:
-                        self.temporary_effects[target_id][skill] = self.temporary_effects[target_id].get(skill, 0) + value
-                        print(f"  > [Effect Applied!] {member['name']}'s {skill} is temporarily modified by {value}!")
+        entry = self._compiled_effects.get(id(effects))
+        compiled = entry[1] if entry and entry[0] is effects else compile_effects(effects)
+        for apply in compiled:
+            apply(self, crew_ids, active_crew_id, total_loot)
+
+    def estimate_heist_odds(self, heist_id, crew_ids, tool_assignments=None):
+        """
+        Exact odds of run_heist succeeding for this party, assuming no optional abilities.
+
+        Dynamic programming over the event sequence with states of
+        (remaining events, notoriety, tool charges used); equal states reached along
+        different paths are evaluated once. Covers notoriety scaling (including notoriety
+        gained mid-heist), the 1-in-4 inserted random event at every position, requirement
+        gates, per-heist tool charges and the getaway check. Returns a dict with
+        'success', 'failure', 'random_event_chance' and the 'getaway' outcome distribution.
+        """
+        plan = self.compile_plan(heist_id, crew_ids, tool_assignments)
+        if not plan:
+            raise ValueError(f"Unknown heist '{heist_id}'")
+        heist, tool_assignments = plan.heist, plan.tool_assignments
+        start_notoriety = self.city_agent.notoriety
+
+        base_events = list(heist['events'])
+        scaling = heist.get('scaling', {})
+        if start_notoriety >= scaling.get('notoriety_threshold', 999) and scaling.get('extra_event') in self.special_events:
+            base_events.append(self.special_events[scaling['extra_event']])
+
+        # Random event candidates, prepared the way run_heist prepares them.
+        random_events = []
+        if self.random_events and not plan.eagle_present:
+            fear, respect = self.city_agent.reputation['fear'], self.city_agent.reputation['respect']
+            for template in self.random_events:
+                event = template.copy()
+                if 'reputation_hook' in event:
+                    event['difficulty'] += 1 if fear > respect else -1 if respect > fear else 0
+                event['description'] = f"[Random Event] {event['description']}"
+                event.setdefault('failure', self.RANDOM_EVENT_OUTCOMES['failure'])
+                random_events.append(event)
+        random_event_chance = 0.25 if random_events else 0.0
+
+        # Tool charges are tracked per assigned crew member, like tools_used_this_heist.
+        tooled = [cid for cid in plan.members if tool_assignments.get(cid) in self.tool_agent.tools]
+        tool_slot = {cid: i for i, cid in enumerate(tooled)}
+
+        def notoriety_gain(outcome):
+            return sum(e.get('value', 1) for e in (outcome or {}).get('effects') or [] if e.get('type') == 'add_notoriety')
+
+        def resolve(event, notoriety, uses):
+            """Yields (probability, notoriety, uses) for each way of getting past an event."""
+            check = event['check']
+            best_id, best_skill = plan.best_member(check)
+            if not best_id:
+                return
+            difficulty = event['difficulty']
+            ev_scaling = event.get('scaling', {})
+            if notoriety >= ev_scaling.get('notoriety_threshold', 999):
+                difficulty += ev_scaling.get('difficulty_increase', 0)
+            required = event.get('requirements', {}).get(check)
+            if required and best_skill < required:
+                return
+
+            tool_bonus, bypass = 0, False
+            _, tool, effect, action = plan.tool_action(event, best_id)
+            if effect and best_id in tool_slot:
+                slot = tool_slot[best_id]
+                if uses[slot] < tool.get('uses_per_heist', 1):
+                    spent = uses[:slot] + (uses[slot] + 1,) + uses[slot + 1:]
+                    if action == HeistPlan.TOOL_BONUS:
+                        tool_bonus, uses = effect['value'], spent
+                    elif action == HeistPlan.TOOL_REDUCTION:
+                        difficulty, uses = difficulty - effect['value'], spent
+                    elif action == HeistPlan.TOOL_BYPASS:
+                        bypass, uses = True, spent
+                        notoriety += effect.get('notoriety', 0)
+
+            if bypass:
+                yield 1.0, notoriety + notoriety_gain(event.get('success')), uses
+                return
+            dist = skill_check_distribution(best_skill + tool_bonus, difficulty)
+            if dist[CrewAgent.SUCCESS]:
+                yield dist[CrewAgent.SUCCESS], notoriety + notoriety_gain(event.get('success')), uses
+            if dist[CrewAgent.PARTIAL]:
+                yield dist[CrewAgent.PARTIAL], notoriety + notoriety_gain(event.get('partial_success')), uses
+
+        memo = {}
+
+        def p_clear(sequence, notoriety, uses):
+            """Probability that no remaining event in sequence fails."""
+            if not sequence:
+                return 1.0
+            key = (tuple(map(id, sequence)), notoriety, uses)
+            if key not in memo:
+                rest = sequence[1:]
+                memo[key] = sum(p * p_clear(rest, n, u) for p, n, u in resolve(sequence[0], notoriety, uses))
+            return memo[key]
+
+        no_uses = (0,) * len(tooled)
+        success = (1 - random_event_chance) * p_clear(tuple(base_events), start_notoriety, no_uses)
+        if random_event_chance:
+            positions = len(base_events) + 1
+            weight = random_event_chance / (len(random_events) * positions)
+            for event in random_events:
+                for pos in range(positions):
+                    sequence = tuple(base_events[:pos]) + (event,) + tuple(base_events[pos:])
+                    success += weight * p_clear(sequence, start_notoriety, no_uses)
+
+        getaway_odds = None
+        getaway = heist.get('getaway')
+        if getaway:
+            best_id, best_skill = plan.best_member(getaway['check'])
+            if best_id:
+                getaway_odds = skill_check_distribution(best_skill, getaway['difficulty'])
+            else:
+                getaway_odds = skill_check_distribution(0, float('inf'))
 
-    
-    def run_heist(self, heist_id, crew_ids, tool_assignments):
-        heist = self.heists.get(heist_id)
+        return {
+            "success": success,
+            "failure": 1 - success,
+            "random_event_chance": random_event_chance,
+            "getaway": getaway_odds,
+        }
+
+    def suggest_parties(self, heist_id, top_k=3, objective="success", candidates=None):
+        """
+        Finds the best legal crews and tool assignments for a heist.
+
+        Parties respect max_party_size, required_roles, active status, tool roles and the
+        counts in the city's tool_inventory. They are ranked by estimate_heist_odds success
+        ('success') or by success times the heist's loot value ('expected_value'), and
+        searched by PartySearch: exactly for rosters of up to PartySearch.EXACT_LIMIT active
+        members, over a heuristic shortlist (so approximately) for larger ones. Returns up
+        to top_k dicts with 'crew_ids', 'tool_assignments', 'success' and 'expected_value',
+        best first.
+        """
+        heist = self.get_heist(heist_id)
         if not heist:
-            print("Heist not found.")
+            raise ValueError(f"Unknown heist '{heist_id}'")
+        if objective not in ("success", "expected_value"):
+            raise ValueError(f"Unknown objective '{objective}'")
+        return PartySearch(self, heist_id, heist, objective, candidates).best(top_k)
+
+    def compile_plan(self, heist_id, crew_ids, tool_assignments=None):
+        """Compiles a heist and party into a HeistPlan, or returns None for an unknown heist."""
+        heist = self.get_heist(heist_id)
+        if not heist:
+            return None
+        return HeistPlan(heist, crew_ids, tool_assignments or {}, self.crew_agent, self.tool_agent)
+
+    def run_heist_steps(self, heist_id, crew_ids, tool_assignments):
+        """
+        Runs a heist as a step generator, yielding a Prompt for each ability decision.
+        Returns the ids of crew members who levelled up.
+        """
+        plan = self.compile_plan(heist_id, crew_ids, tool_assignments)
+        if not plan:
+            self.events.emit('heist.not_found', heist_id=heist_id)
             return []
+        heist = plan.heist
 
         # --- Initialize Heist State ---
-        print(f"\n--- Starting Heist: {heist['name']} ---")
+        run_id = next(_HEIST_RUNS)
+        self.events.emit('heist.start', heist_id=heist_id, name=heist['name'], crew_ids=list(crew_ids), run_id=run_id)
         total_loot = []
         self.tools_used_this_heist = {}
         self.abilities_used_this_heist = set()
@@ -224,123 +2518,62 @@ class HeistAgent:
         self.double_loot_active = False
         self.arcane_reservoir_stored = False # Tracks stored success for the Mage
 
+        self.last_getaway_result = None
+
         # Heist outcome tracking
         event_outcomes = {'success': 0, 'partial': 0, 'failure': 0}
 
         # --- Event Generation ---
-        events_to_run = list(heist['events'])
-
-        # Heist-level Notoriety Scaling
-        if 'scaling' in heist and self.city_agent.notoriety >= heist['scaling'].get('notoriety_threshold', 999):
-            if 'extra_event' in heist['scaling']:
-                extra_event_id = heist['scaling']['extra_event']
-                if extra_event_id in self.special_events:
-                    print(f"[Notoriety Effect] Your reputation precedes you, drawing out a dangerous foe!")
-                    events_to_run.append(self.special_events[extra_event_id])
-
-
-        # --- Random Event Check ---
-        avoid_random_event = False
-        for crew_id in crew_ids:
-            member = self.crew_agent.get_crew_member(crew_id)
-            if member and 'scout_eagle_of_brasshaven' in member.get('upgrades', []):
-                print("[Eagle of Brasshaven] Finn's vigilance allows the crew to bypass an unforeseen complication!")
-                avoid_random_event = True
-                self.abilities_used_this_heist.add('eagle_of_brasshaven')
-                break
-
-        if not avoid_random_event and self.random_events and random.randint(1, 4) == 1:
-            random_event = random.choice(self.random_events).copy()
-
-            if 'reputation_hook' in random_event:
-                fear = self.city_agent.reputation['fear']
-                respect = self.city_agent.reputation['respect']
-                if fear > respect:
-                    random_event['difficulty'] += 1
-                    print(f"[Reputation Effect] Your fearsome reputation makes this situation more volatile! (Difficulty +1)")
-                elif respect > fear:
-                    random_event['difficulty'] -= 1
-                    print(f"[Reputation Effect] Your respectable reputation gives you an edge. (Difficulty -1)")
-
-            random_event['description'] = f"[Random Event] {random_event['description']}"
-            random_event.setdefault('success', {"text": "The crew handled the unexpected situation."})
-            random_event.setdefault('failure', {"text": "The event causes a complication.", "effects": [{"type": "add_notoriety", "value": 1}]})
-
-            scout_present = 'scout_1' in crew_ids
-            if scout_present and 'scout_1' not in self.abilities_used_this_heist:
-                print(f"\n[Scout's Forewarning!] Finn Ashwhistle spots trouble ahead.")
-                print(f"  > Upcoming Event: {random_event['description']}")
-                self.abilities_used_this_heist.add('scout_1')
-            else:
-                print(f"\n[A random event occurs during the heist!]")
-
-            insert_pos = random.randint(0, len(events_to_run))
-            events_to_run.insert(insert_pos, random_event)
+        events_to_run = self._generate_events(heist, plan, crew_ids)
 
         # --- Main Event Loop ---
         for event in events_to_run:
             # --- Arcane Reservoir Spend ---
-            mage_member = self.crew_agent.get_crew_member('mage_1')
-            if (mage_member and 'mage_1' in crew_ids and self.arcane_reservoir_stored and
-                    'mage_arcane_reservoir' in mage_member.get('upgrades', [])):
-                use_ability = input(f"\n* Event: {event['description']}\n  > Use Lyra's stored success from the Arcane Reservoir to auto-succeed? [Y/N]: ").upper()
-                if use_ability == 'Y':
-                    print("  > [Arcane Reservoir] Lyra releases the stored magical success, effortlessly resolving the situation.")
+            if self.arcane_reservoir_stored and plan.has_upgrade('mage_1', 'mage_arcane_reservoir'):
+                if (yield Prompt.confirm('arcane_reservoir', f"\n* Event: {event['description']}\n  > Use Lyra's stored success from the Arcane Reservoir to auto-succeed? [Y/N]: ",
+                                         PromptContext({'event': event}, success_chance=functools.partial(self._estimate_event_chance, event, crew_ids)))):
+                    self.events.emit('ability.arcane_reservoir_release', event_id=event.get('id'))
                     self.arcane_reservoir_stored = False
                     event_outcomes['success'] += 1
                     continue
 
-            rogue_member = self.crew_agent.get_crew_member('rogue_1')
-            if (rogue_member and 'rogue_1' in crew_ids and
-                    'rogue_ghost_in_gears' in rogue_member.get('upgrades', []) and
+            if (plan.has_upgrade('rogue_1', 'rogue_ghost_in_gears') and
                     'ghost_in_the_gears' not in self.abilities_used_this_heist):
 
-                use_ability = input(f"\n* Event: {event['description']}\n  > Use Silas's 'Ghost in the Gears' to bypass this event completely? [Y/N]: ").upper()
-                if use_ability == 'Y':
-                    print("  > [Ghost in the Gears] Silas finds a hidden path, and the crew slips past the challenge entirely.")
+                if (yield Prompt.confirm('ghost_in_the_gears', f"\n* Event: {event['description']}\n  > Use Silas's 'Ghost in the Gears' to bypass this event completely? [Y/N]: ",
+                                         PromptContext({'event': event}, success_chance=functools.partial(self._estimate_event_chance, event, crew_ids)))):
+                    self.events.emit('ability.ghost_in_the_gears', event_id=event.get('id'))
                     self.abilities_used_this_heist.add('ghost_in_the_gears')
                     event_outcomes['success'] += 1
                     continue
 
-            print(f"\n* Event: {event['description']}")
+            self.events.emit('event.start', event_id=event.get('id'), description=event['description'], check=event['check'])
             
             # --- Pre-Check Abilities (Event-Wide Buffs) ---
             event_wide_bonus = 0
             
             # Alchemist Ability Check
-            alchemist_member = self.crew_agent.get_crew_member('alchemist_1')
-            if (alchemist_member and 'alchemist_1' in crew_ids and 'alchemist_1' not in self.abilities_used_this_heist):
-                use_ability = input(f"  > Use Alchemist's 'Shielding Elixir' for a +1 bonus to all crew checks in this event? [Y/N]: ").upper()
-                if use_ability == 'Y':
+            if plan.member('alchemist_1') and 'alchemist_1' not in self.abilities_used_this_heist:
+                if (yield Prompt.confirm('shielding_elixir', f"  > Use Alchemist's 'Shielding Elixir' for a +1 bonus to all crew checks in this event? [Y/N]: ",
+                                         PromptContext({'event': event}, success_chance=functools.partial(self._estimate_event_chance, event, crew_ids, event_wide_bonus)))):
                     event_wide_bonus += 1
                     self.abilities_used_this_heist.add('alchemist_1')
-                    print("  > [Alchemist's Elixir] The crew feels invigorated by the potion!")
+                    self.events.emit('ability.shielding_elixir', event_id=event.get('id'))
             
             # Artificer "Clockwork Legion" Check
-            artificer_member = self.crew_agent.get_crew_member('artificer_1')
-            if (artificer_member and 'artificer_1' in crew_ids and
-                    'artificer_clockwork_legion' in artificer_member.get('upgrades', []) and
+            if (plan.has_upgrade('artificer_1', 'artificer_clockwork_legion') and
                     'clockwork_legion' not in self.abilities_used_this_heist):
-                use_ability = input(f"  > Use Dorian's 'Clockwork Legion' for a +2 bonus to all crew checks in this event? [Y/N]: ").upper()
-                if use_ability == 'Y':
+                if (yield Prompt.confirm('clockwork_legion', f"  > Use Dorian's 'Clockwork Legion' for a +2 bonus to all crew checks in this event? [Y/N]: ",
+                                         PromptContext({'event': event}, success_chance=functools.partial(self._estimate_event_chance, event, crew_ids, event_wide_bonus)))):
                     event_wide_bonus += 2
                     self.abilities_used_this_heist.add('clockwork_legion')
-                    print(f"  > [Clockwork Legion] A swarm of tiny clockwork helpers aids the crew!")
+                    self.events.emit('ability.clockwork_legion', event_id=event.get('id'))
 
             # Find best crew member, accounting for temporary effects
-            best_crew_id = None
-            best_skill = -99 # Start low to account for negative skills
-            for crew_id in crew_ids:
-                member = self.crew_agent.get_crew_member(crew_id)
-                if member:
-                    temp_modifier = self.temporary_effects.get(crew_id, {}).get(event['check'], 0)
-                    effective_skill = member['skills'].get(event['check'], 0) + temp_modifier
-                    if effective_skill > best_skill:
-                        best_skill = effective_skill
-                        best_crew_id = crew_id
+            best_crew_id, best_skill = plan.best_member(event['check'], self.temporary_effects)
 
             if not best_crew_id:
-                print("No suitable crew member for this event! It automatically fails.")
+                self.events.emit('event.no_crew', event_id=event.get('id'))
                 event_outcomes['failure'] += 1
                 continue
 
@@ -351,27 +2584,27 @@ class HeistAgent:
                 if 'difficulty_increase' in event['scaling']:
                     increase = event['scaling']['difficulty_increase']
                     difficulty += increase
-                    print(f"  > [Notoriety Effect] The stakes are higher! (Difficulty +{increase})")
+                    self.events.emit('event.scaled', event_id=event.get('id'), increase=increase)
 
-            crew_member = self.crew_agent.get_crew_member(best_crew_id)
+            crew_member = plan.member(best_crew_id)
 
             # --- Requirement Check ---
             requirements = event.get("requirements", {})
             required_value = requirements.get(event['check'])
             # Check against base skill, not temporarily modified skill
-            if required_value and crew_member['skills'].get(event['check'], 0) < required_value:
-                print(f"  > {crew_member['name']} is too inexperienced! Needs {required_value} {event['check']} (has {crew_member['skills'].get(event['check'], 0)}).")
+            if required_value and crew_member.skill(event['check']) < required_value:
+                self.events.emit('event.requirement_failed', event_id=event.get('id'), crew_id=best_crew_id, name=crew_member['name'],
+                                 required=required_value, check=event['check'], has=crew_member.skill(event['check']))
                 event_outcomes['failure'] += 1
                 continue
             
             # --- Single-Check Abilities (like Tinker's Edge) ---
             tinker_bonus = 0
-            if 'artificer_1' in crew_ids and artificer_member:
-                if ('artificer_tinkers_edge' in artificer_member.get('upgrades', []) and
-                        'tinkers_edge' not in self.abilities_used_this_heist):
-                    use_ability = input(f"  > Use Dorian's 'Tinker's Edge' for a +2 bonus on this specific check? [Y/N]: ").upper()
-                    if use_ability == 'Y':
-                        print(f"  > [Tinker's Edge] Dorian quickly assembles a gadget to help {crew_member['name']}!")
+            if plan.has_upgrade('artificer_1', 'artificer_tinkers_edge'):
+                if 'tinkers_edge' not in self.abilities_used_this_heist:
+                    if (yield Prompt.confirm('tinkers_edge', f"  > Use Dorian's 'Tinker's Edge' for a +2 bonus on this specific check? [Y/N]: ",
+                                             PromptContext({'event': event}, success_chance=functools.partial(_success_chance, best_skill + event_wide_bonus, difficulty)))):
+                        self.events.emit('ability.tinkers_edge', crew_id=best_crew_id, name=crew_member['name'])
                         tinker_bonus = 2
                         self.abilities_used_this_heist.add('tinkers_edge')
             
@@ -379,15 +2612,13 @@ class HeistAgent:
             total_bonus = event_wide_bonus + tinker_bonus
 
             # --- Dice Roll & Tool Handling ---
-            roll = random.randint(1, 10)
+            roll = self.rng.rolls.randint(1, CHECK_DIE_SIDES)
             bypass_check = False
             tool_bonus = 0
 
-            tool_id = tool_assignments.get(best_crew_id)
+            tool_id, tool, effect, tool_action = plan.tool_action(event, best_crew_id)
             if tool_id:
-                effect = self.tool_agent.get_tool_effect(tool_id, crew_member['role'])
                 if effect:
-                    tool = self.tool_agent.tools[tool_id]
                     # Per-crew mapping: tools_used_this_heist[crew_id] -> { tool_id: used_count }
                     crew_tool_usage = self.tools_used_this_heist.get(best_crew_id, {})
                     used = crew_tool_usage.get(tool_id, 0)
@@ -395,46 +2626,50 @@ class HeistAgent:
 
                     if uses_left > 0:
                         # Bonus that matches the event check; allow 'any' in tool effect too
-                        if effect.get('type') == 'bonus' and (effect.get('skill') == event['check'] or effect.get('skill') == 'any'):
+                        if tool_action == HeistPlan.TOOL_BONUS:
                             tool_bonus = effect['value']
                             self.tools_used_this_heist.setdefault(best_crew_id, {})[tool_id] = used + 1
-                            print(f"  > {crew_member['name']} uses {tool['name']} for a +{tool_bonus} bonus.")
-                        elif effect.get('type') == 'difficulty_reduction':
-                            condition = effect.get('condition', '').replace('-', ' ')
-                            if condition in event['description'].lower():
-                                difficulty -= effect['value']  # reduce the check difficulty
-                                self.tools_used_this_heist.setdefault(best_crew_id, {})[tool_id] = used + 1
-                                print(f"  > {crew_member['name']} uses {tool['name']} to lower the difficulty by {effect['value']}.")
-                        elif effect.get('type') == 'bypass' and effect.get('check') == event['check']:
+                            self.events.emit('tool.bonus', crew_id=best_crew_id, name=crew_member['name'], tool_id=tool_id, tool=tool['name'], value=tool_bonus)
+                        elif tool_action == HeistPlan.TOOL_REDUCTION:
+                            difficulty -= effect['value']  # reduce the check difficulty
+                            self.tools_used_this_heist.setdefault(best_crew_id, {})[tool_id] = used + 1
+                            self.events.emit('tool.difficulty_reduction', crew_id=best_crew_id, name=crew_member['name'], tool_id=tool_id,
+                                             tool=tool['name'], value=effect['value'])
+                        elif tool_action == HeistPlan.TOOL_BYPASS:
                             bypass_check = True
                             self.city_agent.increase_notoriety(effect.get('notoriety', 0))
                             self.tools_used_this_heist.setdefault(best_crew_id, {})[tool_id] = used + 1
-                            print(f"  > {crew_member['name']} uses {tool['name']} to bypass the check, gaining {effect.get('notoriety',0)} notoriety!")
-                        elif effect.get('type') == 'special' and effect.get('id') == 'alchemy_craft':
-                            use_kit = input(f"  > Use Alchemy Kit to brew a potion for the whole crew this event? [Y/N]: ").upper()
-                            if use_kit == 'Y':
-                                potion_type = input("    Choose potion type: [S]tealth, [C]ombat, [M]agic: ").upper()
-                                chosen_type = {"S": "stealth", "C": "combat", "M": "magic"}.get(potion_type, "any")
+                            self.events.emit('tool.bypass', crew_id=best_crew_id, name=crew_member['name'], tool_id=tool_id, tool=tool['name'],
+                                             notoriety=effect.get('notoriety', 0))
+                        elif tool_action == HeistPlan.TOOL_ALCHEMY:
+                            if (yield Prompt.confirm('alchemy_kit', f"  > Use Alchemy Kit to brew a potion for the whole crew this event? [Y/N]: ",
+                                                     PromptContext({'event': event}, success_chance=functools.partial(_success_chance, best_skill + total_bonus, difficulty)))):
+                                potions = ["stealth", "combat", "magic"]
+                                choice = yield Prompt.choose('alchemy_potion', "    Choose potion type: [S]tealth, [C]ombat, [M]agic: ", potions,
+                                                             {'event': event, 'keys': ["S", "C", "M"],
+                                                              'preferred': potions.index(event['check']) if event['check'] in potions else 0})
+                                chosen_type = potions[choice] if choice is not None else "any"
                                 event_wide_bonus += 1
                                 self.tools_used_this_heist.setdefault(best_crew_id, {})[tool_id] = used + 1
-                                print(f"  > {crew_member['name']} brews a {chosen_type} elixir! All crew gain +1 for this event.")
+                                self.events.emit('tool.alchemy', crew_id=best_crew_id, name=crew_member['name'], potion=chosen_type)
                                 # Backfire check
-                                if random.randint(1, 6) == 1:
-                                    print("  > [Alchemy Backfire!] The elixir sputters and fumes! The Watch takes notice. Notoriety +1.")
+                                if self.rng.events.randint(1, 6) == 1:
+                                    self.events.emit('tool.alchemy_backfire', crew_id=best_crew_id)
                                     self.city_agent.increase_notoriety(1)
 
-                        print(f"  > {crew_member['name']} uses {tool['name']}. ({max(0, uses_left - 1)} uses left)")
+                        self.events.emit('tool.used', crew_id=best_crew_id, name=crew_member['name'], tool_id=tool_id, tool=tool['name'],
+                                         uses_left=max(0, uses_left - 1))
                     else:
-                        print(f"  > {crew_member['name']} has no uses left for {tool['name']}.")
+                        self.events.emit('tool.exhausted', crew_id=best_crew_id, name=crew_member['name'], tool_id=tool_id, tool=tool['name'])
 
 
             # --- Ability Check (from Level-Up Upgrades) ---
             auto_succeed = False
-            if (crew_member and event['check'] == 'stealth' and
-                'rogue_shadowstep' in crew_member.get('upgrades', []) and
+            if (crew_member is not None and event['check'] == 'stealth' and
+                plan.has_upgrade(best_crew_id, 'rogue_shadowstep') and
                 'rogue_shadowstep' not in self.abilities_used_this_heist):
-                use_ability = input(f"  > Use {crew_member['name']}'s 'Shadowstep' to automatically succeed? [Y/N]: ").upper()
-                if use_ability == 'Y':
+                if (yield Prompt.confirm('rogue_shadowstep', f"  > Use {crew_member['name']}'s 'Shadowstep' to automatically succeed? [Y/N]: ",
+                                     PromptContext({'event': event}, success_chance=functools.partial(_success_chance, best_skill + total_bonus + tool_bonus, difficulty)))):
                     auto_succeed = True
                     self.abilities_used_this_heist.add('rogue_shadowstep')
 
@@ -457,26 +2692,22 @@ class HeistAgent:
             if result == self.crew_agent.FAILURE:
                 gambler_present = 'gambler_1' in crew_ids
                 if gambler_present and 'gambler_1' not in self.abilities_used_this_heist:
-                    use_ability = input(f"  > A setback! Use Gambler's 'Double or Nothing' to reroll? [Y/N]: ").upper()
-                    if use_ability == 'Y':
+                    if (yield Prompt.confirm('double_or_nothing', f"  > A setback! Use Gambler's 'Double or Nothing' to reroll? [Y/N]: ", {'event': event})):
                         self.abilities_used_this_heist.add('gambler_1')
-                        print("  > [Gambler's Wager] Cassian Vey is betting it all on a second chance!")
+                        self.events.emit('ability.double_or_nothing', event_id=event.get('id'))
                         reroll_result = self.crew_agent.perform_skill_check(best_crew_id, event['check'], difficulty, temporary_effects=self.temporary_effects)
                         if reroll_result == self.crew_agent.SUCCESS:
-                            print("  > Reroll Success! The gamble paid off spectacularly!")
+                            self.events.emit('ability.double_or_nothing_result', success=True)
                             result = self.crew_agent.SUCCESS
                             self.double_loot_active = True
                         else:
-                            print("  > Reroll Failure! The house always wins. Notoriety increases sharply.")
+                            self.events.emit('ability.double_or_nothing_result', success=False)
                             self.city_agent.increase_notoriety(2)
                 
-                mage_member = self.crew_agent.get_crew_member('mage_1')
-                if (mage_member and 'mage_1' in crew_ids and
-                        'mage_chronoward' in mage_member.get('upgrades', []) and
+                if (plan.has_upgrade('mage_1', 'mage_chronoward') and
                         'chronoward' not in self.abilities_used_this_heist):
-                    use_ability = input(f"  > A critical failure! Use Lyra's 'Chronoward' to rewind time and reroll? [Y/N]: ").upper()
-                    if use_ability == 'Y':
-                        print("  > [Chronoward] Time shimmers and resets around the failed action!")
+                    if (yield Prompt.confirm('chronoward', f"  > A critical failure! Use Lyra's 'Chronoward' to rewind time and reroll? [Y/N]: ", {'event': event})):
+                        self.events.emit('ability.chronoward', event_id=event.get('id'))
                         self.abilities_used_this_heist.add('chronoward')
                         new_result = self.crew_agent.perform_skill_check(
                             best_crew_id,
@@ -494,16 +2725,13 @@ class HeistAgent:
                 outcome = event.get('success', {"text": "The crew succeeded."})
 
                 # --- Arcane Reservoir Store ---
-                mage_member = self.crew_agent.get_crew_member('mage_1')
-                if (mage_member and 'mage_1' in crew_ids and
-                        'mage_arcane_reservoir' in mage_member.get('upgrades', []) and
+                if (plan.has_upgrade('mage_1', 'mage_arcane_reservoir') and
                         not self.arcane_reservoir_stored and # Can't store if one is already held
                         'arcane_reservoir_store' not in self.abilities_used_this_heist): # Can only store once
-                    store_success = input("  > Store this success in Lyra's Arcane Reservoir for later use? [Y/N]: ").upper()
-                    if store_success == 'Y':
+                    if (yield Prompt.confirm('arcane_reservoir_store', "  > Store this success in Lyra's Arcane Reservoir for later use? [Y/N]: ", {'event': event})):
                         self.arcane_reservoir_stored = True
                         self.abilities_used_this_heist.add('arcane_reservoir_store')
-                        print("  > [Arcane Reservoir] The moment of success is captured and stored.")
+                        self.events.emit('ability.arcane_reservoir_store', event_id=event.get('id'))
 
                 self.temporary_effects.clear()
 
@@ -519,61 +2747,25 @@ class HeistAgent:
 
             # Unified outcome resolution
             if outcome:
-                print(f"  > {result.title()}: {outcome['text']}")
+                self.events.emit('event.outcome', event_id=event.get('id'), crew_id=best_crew_id, result=result, text=outcome['text'])
                 self._apply_effects(outcome.get('effects'), crew_ids, best_crew_id, total_loot)
                 self.temporary_effects.clear()
 
-
-        
         # --- Distinct Getaway Phase ---
-        getaway = heist.get('getaway')
-        if getaway:
-            print(f"\n--- Getaway: {getaway['name']} ---")
-            print(f"{getaway['description']}")
+        self._run_getaway(heist, plan, crew_ids, total_loot)
 
-            # Select best crew for getaway
-            best_id, best_skill = None, -99
-            for crew_id in crew_ids:
-                member = self.crew_agent.get_crew_member(crew_id)
-                if member:
-                    skill_val = member['skills'].get(getaway['check'], 0)
-                    if skill_val > best_skill:
-                        best_skill, best_id = skill_val, crew_id
-
-            if not best_id:
-                print("No suitable crew for the getaway. Automatic failure!")
-                result = self.crew_agent.FAILURE
-            else:
-                result = self.crew_agent.perform_skill_check(
-                    best_id,
-                    getaway['check'],
-                    getaway['difficulty'],
-                    temporary_effects=self.temporary_effects
-                )
-
-            # Determine which outcome object to use based on the result
-            outcome_key = "partial_success" if result == "partial" else result
-            outcome = getaway.get(outcome_key, {})
-
-
-            # Print the descriptive text for the player
-            print(f"  > {result.title()}: {outcome['text']}")
-            
-            # Apply the structured effects
-            self._apply_effects(outcome.get('effects'), crew_ids, best_id, total_loot)
-
-        
-        
         # --- Heist Resolution ---
         leveled_up_crew = []
         heist_successful = event_outcomes['failure'] == 0
         self.last_heist_successful = heist_successful
+        self.last_event_outcomes = event_outcomes
+        self.last_heist_loot = total_loot
 
         if heist_successful:
-            print("\n--- Heist Successful! ---")
+            self.events.emit('heist.result', heist_id=heist_id, success=True, event_outcomes=dict(event_outcomes))
             xp_gain = heist.get("xp_success", 8)
             if self.double_loot_active:
-                print("[Gambler's Reward] The loot is doubled!")
+                self.events.emit('heist.double_loot')
             for loot_item in heist['potential_loot']:
                 self.city_agent.add_loot(loot_item)
                 total_loot.append(loot_item)
@@ -581,38 +2773,417 @@ class HeistAgent:
                     self.city_agent.add_loot(loot_item)
                     total_loot.append(loot_item)
         else:
-            print("\n--- Heist Failed! ---")
+            self.events.emit('heist.result', heist_id=heist_id, success=False, event_outcomes=dict(event_outcomes))
             xp_gain = heist.get("xp_fail", 1)
 
-        print(f"\n[Crew Report] Each participating member gains {xp_gain} XP.")
+        self.events.emit('heist.xp', xp=xp_gain, crew_ids=list(crew_ids))
         for crew_id in crew_ids:
             if self.crew_agent.add_xp(crew_id, xp_gain):
                 leveled_up_crew.append(crew_id)
 
-        print(f"Final Notoriety: {self.city_agent.notoriety}")
-        print(f"Total Loot Acquired: {[item['item'] for item in total_loot]}")
+        self.events.emit('heist.summary', heist_id=heist_id, notoriety=self.city_agent.notoriety, loot=[item['item'] for item in total_loot],
+                         abilities=sorted(self.abilities_used_this_heist), run_id=run_id)
 
         return leveled_up_crew
 
+    run_heist = blocking(run_heist_steps)
+
+    def _generate_events(self, heist, plan, crew_ids):
+        """The heist's events for this run: scaled extras and any random event slotted in."""
+        events_to_run = list(heist['events'])
+
+        # Heist-level Notoriety Scaling
+        if 'scaling' in heist and self.city_agent.notoriety >= heist['scaling'].get('notoriety_threshold', 999):
+            if 'extra_event' in heist['scaling']:
+                extra_event_id = heist['scaling']['extra_event']
+                if extra_event_id in self.special_events:
+                    self.events.emit('heist.extra_event', event_id=extra_event_id)
+                    events_to_run.append(self.special_events[extra_event_id])
+
+        # --- Random Event Check ---
+        avoid_random_event = False
+        if plan.eagle_present:
+            self.events.emit('ability.eagle_of_brasshaven')
+            avoid_random_event = True
+            self.abilities_used_this_heist.add('eagle_of_brasshaven')
+
+        if not avoid_random_event and self.random_events and self.rng.events.randint(1, 4) == 1:
+            random_event = self.rng.events.choice(self.random_events).copy()
+
+            if 'reputation_hook' in random_event:
+                fear = self.city_agent.reputation['fear']
+                respect = self.city_agent.reputation['respect']
+                if fear > respect:
+                    random_event['difficulty'] += 1
+                    self.events.emit('random_event.reputation', difficulty_change=1)
+                elif respect > fear:
+                    random_event['difficulty'] -= 1
+                    self.events.emit('random_event.reputation', difficulty_change=-1)
+
+            random_event['description'] = f"[Random Event] {random_event['description']}"
+            random_event.setdefault('success', self.RANDOM_EVENT_OUTCOMES['success'])
+            random_event.setdefault('failure', self.RANDOM_EVENT_OUTCOMES['failure'])
+
+            scout_present = 'scout_1' in crew_ids
+            if scout_present and 'scout_1' not in self.abilities_used_this_heist:
+                self.events.emit('random_event.forewarned', event_id=random_event.get('id'), description=random_event['description'])
+                self.abilities_used_this_heist.add('scout_1')
+            else:
+                self.events.emit('random_event.occurs', event_id=random_event.get('id'))
+
+            insert_pos = self.rng.events.randint(0, len(events_to_run))
+            events_to_run.insert(insert_pos, random_event)
+
+        return events_to_run
+
+    def _run_getaway(self, heist, plan, crew_ids, total_loot):
+        """The getaway check after the last event, if the heist has one; sets last_getaway_result."""
+        getaway = heist.get('getaway')
+        if not getaway:
+            return
+
+        self.events.emit('getaway.start', name=getaway['name'], description=getaway['description'], check=getaway['check'])
+
+        # Select best crew for getaway
+        best_id, best_skill = plan.best_member(getaway['check'])
+
+        if not best_id:
+            self.events.emit('getaway.no_crew')
+            result = self.crew_agent.FAILURE
+        else:
+            result = self.crew_agent.perform_skill_check(
+                best_id,
+                getaway['check'],
+                getaway['difficulty'],
+                temporary_effects=self.temporary_effects
+            )
+
+        self.last_getaway_result = result
+
+        # Determine which outcome object to use based on the result
+        outcome_key = "partial_success" if result == "partial" else result
+        outcome = getaway.get(outcome_key, {})
+
+        # Print the descriptive text for the player
+        self.events.emit('getaway.outcome', crew_id=best_id, result=result, text=outcome['text'])
+
+        # Apply the structured effects
+        self._apply_effects(outcome.get('effects'), crew_ids, best_id, total_loot)
+
+
+class LootLedger:
+    """
+    The city's loot as an ordered, list-like ledger. Items are kept in an OrderedDict keyed
+    by an ever-increasing sequence number, with an index from item contents to sequence
+    numbers, so appending, popping either end and removing an item (the first equal one,
+    as list.remove does) are O(1). Aggregates are kept up to date as items come and go:
+    - total_value and value_counts, for O(1) loot_value and fencing in O(distinct values)
+    - item_counts, the number of items with each name
+    - a max-heap on value for best(n) in O(n log size); removed items are dropped lazily
+    Items are treated as immutable once added. copy() is O(1): both ledgers share their
+    structures until either one changes.
+    """
+
+    def __init__(self, items=(), changes=None):
+        self._items = OrderedDict()  # shape: { sequence number: item }
+        self._seqs = {}              # shape: { content key: [sequence numbers, ascending] }
+        self._heap = []              # entries: (-value, sequence number, item)
+        self._next = 0
+        self._shared = False
+        self.total_value = 0
+        self.value_counts = {}       # shape: { value: number of items }
+        self.item_counts = {}        # shape: { item name: number of items }
+        self._names = None           # cached item names, rebuilt after any change
+        self.changes = changes or ChangeClock()
+        self._marks = []             # entries: (change stamp, lowest sequence number changed); see changed_since
+        self.extend(items)
+
+    @staticmethod
+    def _key(item):
+        """A hashable key shared by exactly the items equal to item (None if its values are unhashable)."""
+        try:
+            return frozenset(item.items())
+        except TypeError:
+            return None
+
+    def _unshare(self):
+        self._items = OrderedDict(self._items)
+        self._seqs = {key: list(seqs) for key, seqs in self._seqs.items()}
+        self._heap = list(self._heap)
+        self.value_counts = dict(self.value_counts)
+        self.item_counts = dict(self.item_counts)
+        self._shared = False
+
+    def append(self, item):
+        if self._shared:
+            self._unshare()
+        seq = self._next
+        self._next += 1
+        self._items[seq] = item
+        self._seqs.setdefault(self._key(item), []).append(seq)
+        value = item.get('value', 0)
+        heapq.heappush(self._heap, (-value, seq, item))
+        self.total_value += value
+        self.value_counts[value] = self.value_counts.get(value, 0) + 1
+        name = item.get('item')
+        self.item_counts[name] = self.item_counts.get(name, 0) + 1
+        self._names = None
+        self._mark(seq)
+
+    def extend(self, items):
+        items = list(items)
+        if len(items) < 64:
+            for item in items:
+                self.append(item)
+            return
+        # In bulk: heapify once instead of pushing item by item
+        if self._shared:
+            self._unshare()
+        seqs = range(self._next, self._next + len(items))
+        self._next += len(items)
+        self._items.update(zip(seqs, items))
+        index, key_of = self._seqs, self._key
+        values = [item.get('value', 0) for item in items]
+        for seq, item in zip(seqs, items):
+            index.setdefault(key_of(item), []).append(seq)
+        self._heap.extend(zip([-value for value in values], seqs, items))
+        heapq.heapify(self._heap)
+        self.total_value += sum(values)
+        for counts, keys in ((self.value_counts, values), (self.item_counts, [item.get('item') for item in items])):
+            for key, count in Counter(keys).items():
+                counts[key] = counts.get(key, 0) + count
+        self._names = None
+        self._mark(seqs[0])
+
+    def _discard(self, seq, key=False):
+        if self._shared:
+            self._unshare()
+        item = self._items.pop(seq)
+        key = self._key(item) if key is False else key
+        seqs = self._seqs[key]
+        if seqs[-1] == seq:
+            seqs.pop()
+        elif seqs[0] == seq:
+            del seqs[0]
+        else:
+            seqs.remove(seq)
+        if not seqs:
+            del self._seqs[key]
+        value = item.get('value', 0)
+        self.total_value -= value
+        self.value_counts[value] -= 1
+        if not self.value_counts[value]:
+            del self.value_counts[value]
+        name = item.get('item')
+        self.item_counts[name] -= 1
+        if not self.item_counts[name]:
+            del self.item_counts[name]
+        self._names = None
+        self._mark(seq)
+        if len(self._heap) > 2 * len(self._items) + 64:
+            self._heap = [(-entry.get('value', 0), s, entry) for s, entry in self._items.items()]
+            heapq.heapify(self._heap)
+        return item
+
+    def _first_equal(self, item):
+        key = self._key(item)
+        for seq in self._seqs.get(key, ()):
+            if key is not None or self._items[seq] == item:
+                return key, seq
+        return key, None
+
+    def pop(self, index=-1):
+        """Removes and returns the item at index; O(1) at either end."""
+        return self._discard(self._seq_at(index))
+
+    def remove(self, item):
+        """Removes the first item equal to item, like list.remove."""
+        key, seq = self._first_equal(item)
+        if seq is None:
+            raise ValueError("item not in loot ledger")
+        self._discard(seq, key)
+
+    def clear(self):
+        marks = self._marks
+        self.__init__(changes=self.changes)
+        self._marks = marks
+        self.touch()
+
+    def touch(self):
+        """Marks every item as changed, e.g. when this ledger replaces another."""
+        self._mark(0)
+
+    def _mark(self, seq):
+        # Items from seq on changed now. Older marks at or past seq add nothing, so the
+        # stamps and sequence numbers of the marks kept both increase.
+        marks, now = self._marks, self.changes.now
+        if marks and marks[-1][0] == now:
+            seq = min(seq, marks.pop()[1])
+        while marks and marks[-1][1] >= seq:
+            marks.pop()
+        marks.append((now, seq))
+
+    def changed_since(self, mark):
+        """
+        (position, items from there on) covering every change since a ChangeClock mark: the
+        items before position are the ones the ledger held then. None if nothing changed.
+        """
+        marks = self._marks
+        i = bisect.bisect_left(marks, (mark + 1,))
+        if i == len(marks):
+            return None
+        low, items, tail = marks[i][1], self._items, []
+        for seq in reversed(items):
+            if seq < low:
+                break
+            tail.append(items[seq])
+        tail.reverse()
+        return len(items) - len(tail), tail
+
+    def best(self, count):
+        """The count most valuable items, highest first; equal values in the order they were added."""
+        if self._shared:
+            self._unshare()
+        heap, found = self._heap, []
+        while heap and len(found) < count:
+            entry = heapq.heappop(heap)
+            if entry[1] in self._items:
+                found.append(entry)
+        for entry in found:
+            heapq.heappush(heap, entry)
+        return [entry[2] for entry in found]
+
+    def names(self):
+        """Item names in order. The list is cached until the ledger changes; do not modify it."""
+        if self._names is None:
+            self._names = [item['item'] for item in self._items.values()]
+        return self._names
+
+    def copy(self):
+        """A ledger of the same (shared) items; the two copy their structures on first change."""
+        child = copy.copy(self)
+        child._marks = list(self._marks)
+        self._shared = child._shared = True
+        return child
+
+    def _seq_at(self, index):
+        size = len(self._items)
+        if index < 0:
+            index += size
+        if not 0 <= index < size:
+            raise IndexError("loot ledger index out of range")
+        if index == size - 1:
+            return next(reversed(self._items))
+        return next(itertools.islice(self._items, index, None))
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return list(self)[index]
+        return self._items[self._seq_at(index)]
+
+    def __delitem__(self, index):
+        if not isinstance(index, slice):
+            self._discard(self._seq_at(index))
+        elif index.start in (None, 0) and index.step is None:
+            for _ in range(len(range(*index.indices(len(self._items))))):
+                self._discard(next(iter(self._items)))
+        else:
+            for seq in list(self._items)[index]:
+                self._discard(seq)
+
+    def __len__(self):
+        return len(self._items)
+
+    def __iter__(self):
+        return iter(self._items.values())
+
+    def __contains__(self, item):
+        return self._first_equal(item)[1] is not None
+
+    def __eq__(self, other):
+        if isinstance(other, (list, LootLedger)):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(list(self))
+
+
+# Stamps for CityAgent.factions_version, unique across agents so a fork never reuses its parent's stamp
+_FACTION_VERSIONS = itertools.count()
+
 
 class CityAgent:
-    def __init__(self, player_data):
+    def __init__(self, player_data, events=None, changes=None):
+        self.events = events or console_bus()
+        self.changes = changes or ChangeClock()  # stamps loot changes for saves
         self.notoriety = player_data.get('notoriety', 0)
-        self.loot = list(player_data.get('starting_loot', []))
-        self.reputation = player_data.get('reputation', {"fear": 0, "respect": 0})
+        self.loot = player_data.get('starting_loot', [])
+        self.reputation = dict(player_data.get('reputation', {"fear": 0, "respect": 0}))
         # Initialize factions (NEW)
         self.factions = {f['id']: {"standing": f['standing'], "name": f['name']}
                          for f in player_data.get('factions', [])}
         self.unlocked_heists = set(h['id'] for h in player_data.get('starting_heists', []))
         self.heists_completed = 0
         self.treasury = 100
-        self.tool_inventory = player_data.get('tool_inventory', {})
-
+        self.tool_inventory = dict(player_data.get('tool_inventory', {}))
+        self._owned_factions = {}  # faction dicts may be shared with forks; write through edit_faction
+
+    def edit_faction(self, faction_id):
+        """The faction dict for faction_id, ready to modify: copied first unless this agent owns it."""
+        faction = self.factions.get(faction_id)
+        if faction is None:
+            return faction
+        self.factions_version = next(_FACTION_VERSIONS)  # the caller is about to change a standing
+        if self._owned_factions.get(faction_id) is faction:
+            return faction
+        faction = dict(faction)
+        self.factions[faction_id] = self._owned_factions[faction_id] = faction
+        return faction
+
+    @property
+    def factions(self):
+        """
+        { faction id: {"standing", "name"} }. Change standings through edit_faction, which (like
+        assigning a new dict here) moves factions_version on so derived tables know to rebuild.
+        """
+        return self._factions
+
+    @factions.setter
+    def factions(self, factions):
+        self._factions = factions
+        self.factions_version = next(_FACTION_VERSIONS)
+
+    @property
+    def loot(self):
+        """The LootLedger of loot items; assigning a list replaces it with a ledger of those items."""
+        return self._loot
+
+    @loot.setter
+    def loot(self, items):
+        self._loot = items if isinstance(items, LootLedger) else LootLedger(items, self.changes)
+        self._loot.changes = self.changes
+        self._loot.touch()
+
+    def fork(self, events=None):
+        """A copy whose containers are fresh but whose loot items and factions are shared."""
+        child = copy.copy(self)
+        child.events = events or self.events
+        child.loot = self.loot.copy()
+        child.reputation = dict(self.reputation)
+        child.factions = dict(self.factions)
+        child.unlocked_heists = set(self.unlocked_heists)
+        child.tool_inventory = dict(self.tool_inventory)
+        child._owned_factions = {}
+        self._owned_factions = {}
+        return child
 
 
     def increase_notoriety(self, amount=1):
         self.notoriety += amount
-        print(f"[City Update] Notoriety increased to {self.notoriety}")
+        self.events.emit('city.notoriety', notoriety=self.notoriety, amount=amount)
 
     def treasury_value(self):
         return self.treasury
@@ -621,121 +3192,180 @@ class CityAgent:
     def update_reputation(self, rep_type, amount):
         if rep_type in self.reputation:
             self.reputation[rep_type] += amount
-            if amount > 0:
-                print(f"[City Update] Your reputation for {rep_type} has increased to {self.reputation[rep_type]}.")
-            else:
-                print(f"[City Update] Your reputation for {rep_type} has decreased to {self.reputation[rep_type]}.")
+            self.events.emit('city.reputation', rep_type=rep_type, amount=amount, value=self.reputation[rep_type])
 
     def add_loot(self, item):
         self.loot.append(item)
-        print(f"[City Update] Loot acquired: {item['item']} (Value: {item['value']})")
+        self.events.emit('city.loot', item=item['item'], value=item['value'])
 
 
 class ArcManager:
-    def __init__(self, arcs_data, narrative_events, special_events, city_agent, crew_agent):
+    def __init__(self, arcs_data, narrative_events, special_events, city_agent, crew_agent, decisions=None, events=None):
         self.arcs = arcs_data
-        self.narrative_events = {e['id']: e for e in narrative_events}
-        self.special_events = {e['id']: e for e in special_events}
+        self.narrative_events = _index_by_id(narrative_events)
+        self.special_events = _index_by_id(special_events)
         self.city_agent = city_agent
         self.crew_agent = crew_agent
+        self.decisions = decisions or ConsoleDecisions()
+        self.events = events or console_bus()
         self.completed_triggers = set()  # prevent repeating the same stage
 
-    def check_arcs(self):
-        """Check all arcs against current game state."""
+        # Stages compiled once, in arc/stage order, and indexed by the state they read:
+        # crew fields by member, faction standings, and the city's scalars.
+        self._stages = []
+        self._crew_dependents = {}     # shape: { crew_id: { dependency: [stage orders] } }
+        self._faction_dependents = {}  # shape: { dependency: [stage orders] }
+        self._polled_dependents = {}   # shape: { dependency: [stage orders] }
         for arc in self.arcs:
             for idx, stage in enumerate(arc.get('stages', [])):
-                # skip if stage is not a dict (defensive)
-                if not isinstance(stage, dict):
+                compiled = compile_stage_trigger(stage)
+                if compiled is None:
                     continue
-
+                predicate, deps = compiled
+                order = len(self._stages)
                 # stable trigger key using arc id + stage index
-                trigger_id = f"{arc['id']}:stage_{idx}"
-                if trigger_id in self.completed_triggers:
-                    continue
-
-                # Notoriety threshold stage
-                if 'threshold' in stage:
-                    try:
-                        threshold = int(stage['threshold'])
-                    except (TypeError, ValueError):
-                        continue
-                    if self.city_agent.notoriety >= threshold:
-                        self._fire_stage(stage)
-                        self.completed_triggers.add(trigger_id)
-                        continue
-
-                # Faction hostile all
-                if stage.get("trigger") == "faction_hostile_all":
-                    if self.city_agent.factions and all(f['standing'] < 0 for f in self.city_agent.factions.values()):
-                        self._fire_stage(stage)
-                        self.completed_triggers.add(trigger_id)
-                        continue
-
-                # Crew level trigger (e.g., "rogue_1 level >= 2")
-                trigger_text = stage.get("trigger", "")
-                if "level" in trigger_text:
-                    parts = trigger_text.split()
-                    if len(parts) >= 4:
-                        crew_id = parts[0]
-                        try:
-                            level_required = int(parts[3])
-                        except ValueError:
-                            continue
-                        member = self.crew_agent.get_crew_member(crew_id)
-                        if member and member.get('level', 0) >= level_required:
-                            self._fire_stage(stage)
-                            self.completed_triggers.add(trigger_id)
-                            continue
-
-
-    def _fire_stage(self, stage):
+                self._stages.append((f"{arc['id']}:stage_{idx}", stage, predicate))
+                for dep in deps:
+                    if dep[0] == "crew":
+                        index = self._crew_dependents.setdefault(dep[1], {})
+                    elif dep[0] in ("faction", "faction_standings"):
+                        index = self._faction_dependents
+                    else:
+                        index = self._polled_dependents
+                    index.setdefault(dep, []).append(order)
+        self._watched = {}    # dependency -> value when last checked
+        self._pending = set(range(len(self._stages)))  # stages to evaluate on the next check
+        self._completed_seen = (None, 0)
+        self._crew_seen = None      # crew agent change-clock mark at the last look; None reads every member
+        self._factions_seen = None  # city factions_version at the last look
+
+    def fork(self, city_agent, crew_agent, events=None):
+        """A copy tracking progress separately, bound to forked city and crew agents."""
+        child = copy.copy(self)
+        child.city_agent, child.crew_agent = city_agent, crew_agent
+        child.events = events or self.events
+        child.completed_triggers = set(self.completed_triggers)
+        child._watched = dict(self._watched)
+        child._pending = set(self._pending)
+        child._completed_seen = (child.completed_triggers, self._completed_seen[1]) \
+            if self._completed_seen[0] is self.completed_triggers else self._completed_seen
+        return child
+
+    def completed_arcs(self):
+        """
+        Ids of the arcs whose stages have all fired. A stage with neither a threshold nor a
+        trigger can never fire, so it does not hold its arc back.
+        """
+        unfinished = {trigger_id.rsplit(':', 1)[0] for trigger_id, _, _ in self._stages
+                      if trigger_id not in self.completed_triggers}
+        return [arc['id'] for arc in self.arcs if arc['id'] not in unfinished]
+
+    def _changed_stages(self):
+        """
+        Stages whose dependencies changed since the last look, plus any left pending. Crew
+        fields are re-read only for the members the crew agent stamped as edited since then,
+        and faction standings only when the city's factions_version moved; the city's scalars
+        (notoriety, treasury, loot totals, reputation) are O(1) reads and are polled.
+        """
+        completed = self.completed_triggers
+        if completed is not self._completed_seen[0] or len(completed) < self._completed_seen[1]:
+            # completed_triggers was replaced (e.g. by loading a save): stages may fire again
+            self._pending.update(range(len(self._stages)))
+        changed, self._pending = self._pending, set()
+        groups = [self._polled_dependents]
+        if self.city_agent.factions_version != self._factions_seen:
+            self._factions_seen = self.city_agent.factions_version
+            groups.append(self._faction_dependents)
+        crew, seen = self.crew_agent, self._crew_seen
+        if self._crew_dependents:
+            if seen is None or crew.roster_stamp > seen:
+                groups.extend(self._crew_dependents.values())
+            else:
+                groups.extend(self._crew_dependents[crew_id] for crew_id in crew.edited_since(seen)
+                              if crew_id in self._crew_dependents)
+            self._crew_seen = crew.changes.mark()
+        for dependents in groups:
+            for dep, orders in dependents.items():
+                value = TRIGGER_STATE_READERS[dep[0]](self, *dep[1:])
+                if dep not in self._watched or self._watched[dep] != value:
+                    self._watched[dep] = value
+                    changed.update(orders)
+        self._completed_seen = (completed, len(completed))
+        return changed
+
+    def check_arcs_steps(self):
+        """Check the arcs whose watched state changed since the last check, as a step generator.
+
+        Stages are evaluated in arc/stage order. When a stage fires and changes state, later
+        stages see the change in this pass and earlier ones on the next check.
+        """
+        queue = sorted(self._changed_stages())
+        queued = set(queue)
+        while queue:
+            order = heapq.heappop(queue)
+            trigger_id, stage, predicate = self._stages[order]
+            if trigger_id in self.completed_triggers or not predicate(self):
+                continue
+            yield from self._fire_stage_steps(stage)
+            self.completed_triggers.add(trigger_id)
+            for other in self._changed_stages():
+                if other > order and other not in queued:
+                    heapq.heappush(queue, other)
+                    queued.add(other)
+                elif other <= order:
+                    self._pending.add(other)
+
+    check_arcs = blocking(check_arcs_steps)
+
+    def _fire_stage_steps(self, stage):
         """Resolve event or special from a stage."""
         if "event" in stage:
             event_id = stage['event']
             if event_id in self.narrative_events:
                 event = self.narrative_events[event_id]
-                self._present_narrative_event(event)
+                yield from self._present_narrative_event_steps(event)
         elif "special" in stage:
             special_id = stage['special']
             if special_id in self.special_events:
                 event = self.special_events[special_id]
-                print(f"\n[Special Event Triggered] {event['description']}")
+                self.events.emit('arc.special_event', event_id=special_id, description=event['description'])
                 if "effect" in event and "unlock_heist" in event["effect"]:
                     heist_id = event["effect"]["unlock_heist"]
                     if heist_id not in self.city_agent.unlocked_heists:
                         self.city_agent.unlocked_heists.add(heist_id)
-                        print(f"[Heist Unlocked] {heist_id} is now available!")
+                        self.events.emit('arc.heist_unlocked', heist_id=heist_id)
 
 
-    def _present_narrative_event(self, event):
-        """Simple console choice system for narrative events."""
-        print(f"\n--- Narrative Event ---")
-        print(event['description'])
+    def _present_narrative_event_steps(self, event):
+        """Simple choice system for narrative events."""
+        choices = event.get('choices', [])
+        self.events.emit('narrative.event', event_id=event.get('id'), description=event['description'],
+                         choices=[choice['text'] for choice in choices])
         if 'choices' in event:
-            for i, choice in enumerate(event['choices']):
-                print(f"  [{i+1}] {choice['text']}")
-            choice_idx = -1
-            while choice_idx < 1 or choice_idx > len(event['choices']):
-                try:
-                    choice_idx = int(input("Choose: "))
-                except ValueError:
-                    continue
-            chosen = event['choices'][choice_idx-1]
+            options = [choice['text'] for choice in event['choices']]
+            context = {'event': event, 'scores': [int(choice.get('effects', {}).get('loot', 0)) for choice in event['choices']]}
+            choice_idx = None
+            while choice_idx is None:
+                choice_idx = yield Prompt.choose('narrative_choice', "Choose: ", options, context)
+            chosen = event['choices'][choice_idx]
             self._apply_effects(chosen.get('effects', {}))
 
+    _present_narrative_event = blocking(_present_narrative_event_steps)
+
     def _apply_effects(self, effects):
         """Very simple parser for choice effects."""
         if 'loot' in effects:
-            if effects['loot'] > 0:
-                self.city_agent.add_loot({"item": "Unknown Loot", "value": int(effects['loot'])})
+            amount = int(effects['loot'])  # data uses both 100 and "+150"
+            if amount > 0:
+                self.city_agent.add_loot({"item": "Unknown Loot", "value": amount})
             else:
                 # remove loot by value if negative
-                loss = abs(int(effects['loot']))
+                loss = abs(amount)
                 removed = 0
                 while self.city_agent.loot and removed < loss:
                     self.city_agent.loot.pop()
                     removed += 1
-                print(f"[Effect] Lost {loss} loot.")
+                self.events.emit('narrative.loot_lost', loss=loss)
 
         if 'respect' in effects:
             self.city_agent.update_reputation('respect', int(effects['respect']))
@@ -746,40 +3376,852 @@ class ArcManager:
                 try:
                     delta = int(str(delta).replace("+", ""))  # handles "+2", "2", -1
                 except ValueError:
-                    print(f"[Warning] Could not parse faction effect {f}: {delta}")
+                    self.events.emit('narrative.bad_faction_effect', faction=f, delta=delta)
                     continue
                 if f in self.city_agent.factions:
-                    self.city_agent.factions[f]['standing'] += delta
-                    print(f"[Faction Update] {self.city_agent.factions[f]['name']} standing changed by {delta}.")
+                    self.city_agent.edit_faction(f)['standing'] += delta
+                    self.events.emit('faction.standing', faction=f, name=self.city_agent.factions[f]['name'], delta=delta)
+
 
 
 
+class GameState:
+    """
+    The mutable campaign state (city, crew, arc progress) behind one set of agents, with
+    cheap fork() and checkpoint()/rollback(). Forks share crew members, factions and loot
+    items with their parent; whichever side writes first copies the dict it changes.
+    """
+    # Agent attributes that make up the campaign state, restored by rollback()
+    CITY_STATE = ("notoriety", "loot", "reputation", "factions", "unlocked_heists", "heists_completed",
+                  "treasury", "tool_inventory", "_owned_factions")
+    CREW_STATE = ("crew_members", "_owned")
+    ARC_STATE = ("completed_triggers", "_watched", "_pending", "_completed_seen")
+
+    def __init__(self, city_agent, crew_agent, arc_manager=None, heist_agent=None):
+        self.city_agent = city_agent
+        self.crew_agent = crew_agent
+        self.arc_manager = arc_manager
+        self.heist_agent = heist_agent
+        self._checkpoints = []
+
+    def fork(self, events=None, rng=None):
+        """An independent branch of this state; pass an EventBus() to run it silently."""
+        crew_agent = self.crew_agent.fork(events, rng)
+        city_agent = self.city_agent.fork(events)
+        arc_manager = self.arc_manager and self.arc_manager.fork(city_agent, crew_agent, events)
+        heist_agent = self.heist_agent and self.heist_agent.fork(crew_agent, city_agent, events, rng)
+        return GameState(city_agent, crew_agent, arc_manager, heist_agent)
+
+    def checkpoint(self):
+        """Remembers the current state so a later rollback() can return to it."""
+        self._checkpoints.append(self.fork())
+
+    def rollback(self):
+        """Restores the agents in place to the most recent checkpoint and discards it."""
+        if not self._checkpoints:
+            raise ValueError("no checkpoint to roll back to")
+        saved = self._checkpoints.pop()
+        pairs = [(self.city_agent, saved.city_agent, self.CITY_STATE),
+                 (self.crew_agent, saved.crew_agent, self.CREW_STATE)]
+        if self.arc_manager:
+            pairs.append((self.arc_manager, saved.arc_manager, self.ARC_STATE))
+        for live, snapshot, names in pairs:
+            for name in names:
+                setattr(live, name, getattr(snapshot, name))
+        self.crew_agent.touch()  # so the next save picks up the restored members
+
 
 # ===============================
-# Game Manager & UI
+# Simulation
 # ===============================
-class GameManager:
+HEIST_OUTCOMES = ("success", "partial", "failure")
+
+# Game data shared by every trial in a worker process. It is installed once per worker by
+# the pool initializer so the heist/tool tables are never re-sent with each chunk of trials.
+_SIM_GAME_DATA = None
+
+
+def _init_simulation_worker(game_data):
+    global _SIM_GAME_DATA
+    _SIM_GAME_DATA = game_data
+
+
+def _build_start_state(game_data, start_state=None):
+    """Normalizes the campaign state a simulated heist starts from."""
+    start_state = start_state or {}
+    player = game_data.get('player', {})
+    return {
+        "notoriety": start_state.get('notoriety', player.get('notoriety', 0)),
+        "reputation": dict(start_state.get('reputation', player.get('reputation', {"fear": 0, "respect": 0}))),
+        "factions": start_state.get('factions', {}),
+        "crew_members": start_state.get('crew_members', game_data['crew_members']),
+    }
+
+
+def _simulate_trials(heist_id, crew_ids, tool_assignments, start_state, first_trial, trials, seed, decisions):
+    """
+    Runs a chunk of silent heists and returns raw tallies. Executed inside pool workers.
+    Trial n draws from RandomStreams(seed).spawn(n), so results do not depend on how the
+    trials are split between workers.
+    """
+    game_data = _SIM_GAME_DATA
+    root_rng = RandomStreams(seed)
+
+    tool_agent = ToolAgent(game_data['tools'])
+    heists = game_data['heists']
+    random_events = game_data.get('random_events', [])
+    special_events = game_data.get('special_events', [])
+    # Trials fork one agent, so outcome effects are compiled once per chunk, not per trial
+    prototype = HeistAgent(heists, random_events, special_events, None, tool_agent, None, decisions, EventBus(), root_rng,
+                           procedural_heists(game_data))
+
+    tallies = {
+        "counts": {outcome: 0 for outcome in HEIST_OUTCOMES},
+        "loot_value": 0,
+        "notoriety_delta": 0,
+        "arrests": 0,
+        "injuries": 0,
+    }
+
+    events = EventBus()  # no sinks: heists run without formatting or printing anything
+    crew_prototype = CrewAgent(start_state['crew_members'], game_data['progression'], events, root_rng)
+    for trial in range(first_trial, first_trial + trials):
+        rng = root_rng.spawn(trial)
+        # Agents copy crew records and faction dicts on first write, so the start state is never touched.
+        crew_agent = crew_prototype.fork(events, rng)
+        city_agent = CityAgent({"notoriety": start_state['notoriety'],
+                                "reputation": start_state['reputation']}, events)
+        city_agent.factions = dict(start_state['factions'])
+        heist_agent = prototype.fork(crew_agent, city_agent, events, rng)
+
+        heist_agent.run_heist(heist_id, crew_ids, tool_assignments)
+
+        if not heist_agent.last_heist_successful:
+            outcome = "failure"
+        elif heist_agent.last_event_outcomes['partial'] or heist_agent.last_getaway_result not in (None, CrewAgent.SUCCESS):
+            outcome = "partial"
+        else:
+            outcome = "success"
+        tallies["counts"][outcome] += 1
+        tallies["loot_value"] += sum(item['value'] for item in heist_agent.last_heist_loot)
+        tallies["notoriety_delta"] += city_agent.notoriety - start_state['notoriety']
+
+        statuses = [crew_agent.get_crew_member(cid).get('status') for cid in crew_ids if crew_agent.get_crew_member(cid)]
+        if 'arrested' in statuses:
+            tallies["arrests"] += 1
+        if 'injured' in statuses:
+            tallies["injuries"] += 1
+
+    return tallies
+
+
+def simulate_heist(game_data, heist_id, crew_ids, tool_assignments=None, trials=10000,
+                   processes=None, seed=None, start_state=None, decisions=None):
+    """
+    Runs a heist many times without any console I/O and aggregates the results.
+
+    start_state may carry 'notoriety', 'reputation', 'factions' and 'crew_members' to
+    simulate from a campaign in progress; missing keys fall back to a new game.
+    decisions is the DecisionProvider answering ability prompts (NeverDecisions by default);
+    it is sent to the worker processes, so it must be picklable when processes > 1.
+    Trials are split across a process pool unless processes == 1. Returns a dict with the
+    success/partial/failure distribution, expected loot value, mean notoriety change and
+    the share of trials ending with a crew member arrested or injured. A "partial" heist
+    succeeded but had at least one partial event or an unclean getaway.
+    """
+    procedural = procedural_heists(game_data)
+    if heist_id not in {h['id'] for h in game_data['heists']} and not (procedural and heist_id in procedural):
+        raise ValueError(f"Unknown heist '{heist_id}'")
+    if trials < 1:
+        raise ValueError("trials must be at least 1")
+
+    tool_assignments = dict(tool_assignments or {})
+    start_state = _build_start_state(game_data, start_state)
+    decisions = decisions or NeverDecisions()
+    if isinstance(decisions, ConsoleDecisions):
+        raise ValueError("simulations cannot use console decisions")
+    if processes is None:
+        processes = os.cpu_count() or 1
+    processes = max(1, min(processes, trials))
+
+    if seed is None:
+        seed = random.getrandbits(64)
+    chunk_sizes = [trials // processes + (1 if i < trials % processes else 0) for i in range(processes)]
+    chunk_starts = [sum(chunk_sizes[:i]) for i in range(processes)]
+    jobs = [(heist_id, list(crew_ids), tool_assignments, start_state, start, size, seed, decisions)
+            for start, size in zip(chunk_starts, chunk_sizes)]
+
+    started = time.perf_counter()
+    if processes == 1:
+        previous = _SIM_GAME_DATA
+        _init_simulation_worker(game_data)
+        try:
+            results = [_simulate_trials(*job) for job in jobs]
+        finally:
+            _init_simulation_worker(previous)
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=processes,
+                                                    initializer=_init_simulation_worker,
+                                                    initargs=(game_data,)) as pool:
+            results = list(pool.map(_simulate_trials, *zip(*jobs)))
+
+    counts = {outcome: sum(r["counts"][outcome] for r in results) for outcome in HEIST_OUTCOMES}
+    return {
+        "heist_id": heist_id,
+        "trials": trials,
+        "counts": counts,
+        "outcomes": {outcome: counts[outcome] / trials for outcome in HEIST_OUTCOMES},
+        "expected_loot_value": sum(r["loot_value"] for r in results) / trials,
+        "mean_notoriety_delta": sum(r["notoriety_delta"] for r in results) / trials,
+        "arrest_rate": sum(r["arrests"] for r in results) / trials,
+        "injury_rate": sum(r["injuries"] for r in results) / trials,
+        "elapsed": time.perf_counter() - started,
+    }
+
+
+def print_simulation_report(report):
+    print(f"\n=== Simulation: {report['heist_id']} ({report['trials']} trials, {report['elapsed']:.2f}s) ===")
+    for outcome in HEIST_OUTCOMES:
+        print(f"  {outcome.title():<8} {report['outcomes'][outcome]:7.2%}  ({report['counts'][outcome]})")
+    print(f"  Expected loot value: {report['expected_loot_value']:.1f}")
+    print(f"  Mean notoriety change: {report['mean_notoriety_delta']:+.2f}")
+    print(f"  Arrest rate: {report['arrest_rate']:.2%} | Injury rate: {report['injury_rate']:.2%}")
+
+
+class CampaignStrategy:
+    """
+    A scripted player for simulate_campaign. Each turn is one pass through the main menu:
+    free and heal crew, shop, run one heist, learn upgrades and fence the take. Subclasses
+    change the individual choices; rng is the strategy's own random.Random-like stream.
+    """
+    objective = "success"  # suggest_parties ranking used to pick heists
+    reserve = 0            # coin kept back when paying for bribes, healing and tools
+
+    def __init__(self, rng):
+        self.rng = rng
+
+    def play_turn(self, game):
+        """Plays one turn. Returns False when no heist could be attempted."""
+        self.recover_crew(game)
+        self.shop(game)
+        choice = self.choose_heist(game)
+        if choice is None:
+            return False
+        heist_id, crew_ids, tool_assignments = choice
+        for crew_id in game.execute_heist(heist_id, crew_ids, tool_assignments):
+            options = game.available_upgrades(crew_id)
+            if options:
+                game.apply_upgrade(crew_id, self.choose_upgrade(game, crew_id, options))
+        self.sell(game)
+        return True
+
+    def can_afford(self, game, cost):
+        return game.city_agent.treasury - cost >= self.reserve
+
+    def recover_crew(self, game):
+        for member in game.arrested_members():
+            if self.can_afford(game, game.bribe_cost()):
+                game.bribe_release(member['id'])
+        active = [cid for cid, m in game.crew_agent.crew_members.items() if m.get("status", "active") == "active"]
+        if game.arrested_members() and "rescue_heist" in game.city_agent.unlocked_heists and len(active) >= 2:
+            game.rescue_arrested(active[:2])
+        for crew_id, member in list(game.crew_agent.crew_members.items()):
+            if member.get("status") == "injured" and self.can_afford(game, game.game_data["market"]["healing_cost"]):
+                game.heal_member(crew_id)
+
+    def shop(self, game):
+        pass
+
+    def candidate_heists(self, game):
+        return [heist_id for heist_id in game.available_heists() if heist_id != "rescue_heist"]
+
+    def choose_heist(self, game):
+        """(heist_id, crew_ids, tool_assignments) for this turn, or None."""
+        best, best_score = None, -1
+        for heist_id in self.candidate_heists(game):
+            for party in game.heist_agent.suggest_parties(heist_id, top_k=1, objective=self.objective):
+                if party[self.objective] > best_score:
+                    best, best_score = (heist_id, party['crew_ids'], party['tool_assignments']), party[self.objective]
+        return best
+
+    def choose_upgrade(self, game, crew_id, options):
+        return options[0]
+
+    def sell(self, game):
+        if game.city_agent.loot:
+            game.fence_items()
+
+
+class CautiousStrategy(CampaignStrategy):
+    """Takes the heist most likely to succeed and never spends below a 150 coin reserve."""
+    reserve = 150
+
+
+class GreedyStrategy(CampaignStrategy):
+    """Chases expected loot value and buys the tools its best parties would carry."""
+    objective = "expected_value"
+
+    def shop(self, game):
+        market = game.game_data["market"]["tools"]
+        for tool_id in sorted(market, key=lambda t: market[t]["price"]):
+            if tool_id not in game.city_agent.tool_inventory and self.can_afford(game, market[tool_id]["price"]):
+                game.buy_tool(tool_id)
+
+    def choose_upgrade(self, game, crew_id, options):
+        boosts = [sum(e.get('value', 0) for e in u.get('effects', []) if e.get('type') == 'stat_boost') for u in options]
+        return options[max(range(len(options)), key=boosts.__getitem__)]
+
+
+class RandomStrategy(CampaignStrategy):
+    """Picks a random unlocked heist, one of its top parties and random upgrades."""
+    def choose_heist(self, game):
+        heist_ids = self.candidate_heists(game)
+        self.rng.shuffle(heist_ids)
+        for heist_id in heist_ids:
+            parties = game.heist_agent.suggest_parties(heist_id, top_k=3)
+            if parties:
+                party = self.rng.choice(parties)
+                return heist_id, party['crew_ids'], party['tool_assignments']
+        return None
+
+    def choose_upgrade(self, game, crew_id, options):
+        return self.rng.choice(options)
+
+    def sell(self, game):
+        if game.city_agent.loot and self.rng.random() < 0.5:
+            game.fence_items()
+
+
+CAMPAIGN_STRATEGIES = {
+    "cautious": CautiousStrategy,
+    "greedy": GreedyStrategy,
+    "random": RandomStrategy,
+}
+
+
+class _CampaignTally:
+    """Event sink counting what a campaign report needs, without keeping the events."""
     def __init__(self):
-        with open('game_data.json', 'r', encoding='utf-8') as f:
-            self.game_data = json.load(f)
+        self.arrests = self.injuries = self.heists_won = self.heists_lost = 0
+
+    def handle(self, kind, fields):
+        if kind == 'effect.status':
+            if fields['status'] == 'arrested':
+                self.arrests += 1
+            elif fields['status'] == 'injured':
+                self.injuries += 1
+        elif kind == 'heist.result':
+            if fields['success']:
+                self.heists_won += 1
+            else:
+                self.heists_lost += 1
+
+
+def _simulate_campaigns(strategy, first_run, runs, turns, seed, policy, game_data_path, metrics=None):
+    """
+    Plays a chunk of campaigns and returns one result dict per run, plus the metrics sink (if
+    any) that saw every game's events, so pool workers can send theirs back. Executed inside
+    pool workers.
+    """
+    compiled = load_game_data(game_data_path)
+    results = []
+    for run in range(first_run, first_run + runs):
+        tally = _CampaignTally()
+        bus = EventBus(tally) if metrics is None else EventBus(tally, metrics)
+        game = GameManager(DECISION_PROVIDERS[policy](), bus, seed=(seed, run), compiled_data=compiled)
+        if metrics is not None:
+            metrics.city_agent = game.city_agent
+        player = CAMPAIGN_STRATEGIES[strategy](game.rng.spawn("strategy").targets)
+        turns_played = 0
+        for _ in range(turns):
+            game.arc_manager.check_arcs()
+            if not player.play_turn(game):
+                break
+            turns_played += 1
+        game.arc_manager.check_arcs()
+
+        results.append({
+            "treasury": game.city_agent.treasury,
+            "notoriety": game.city_agent.notoriety,
+            "heists_completed": game.city_agent.heists_completed,
+            "heists_won": tally.heists_won,
+            "turns_played": turns_played,
+            "arrests": tally.arrests,
+            "injuries": tally.injuries,
+            "stages_completed": len(game.arc_manager.completed_triggers),
+            "arcs_completed": sorted(game.arc_manager.completed_arcs()),
+        })
+    if metrics is not None:
+        metrics.unwatch()
+    return results, metrics
+
+
+def _distribution(values):
+    ordered = sorted(values)
+
+    def percentile(p):
+        return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+    return {"mean": sum(ordered) / len(ordered), "min": ordered[0], "p10": percentile(0.1),
+            "median": percentile(0.5), "p90": percentile(0.9), "max": ordered[-1]}
+
+
+CAMPAIGN_METRICS = ("treasury", "notoriety", "heists_completed", "heists_won", "turns_played",
+                    "arrests", "injuries", "stages_completed")
+
+
+def simulate_campaign(strategy="cautious", runs=100, turns=30, processes=None, seed=None, policy="greedy",
+                      game_data_path='game_data.json', metrics=None):
+    """
+    Plays whole campaigns through GameManager with a scripted strategy (see
+    CAMPAIGN_STRATEGIES) and aggregates the end states.
+
+    Each run starts a new game and plays up to `turns` turns: arc checks, then the
+    strategy's bribes, rescues, healing, shopping, one heist, upgrades and fencing. A run
+    stops early when no heist can be attempted. Ability prompts and narrative choices go to
+    the named DECISION_PROVIDERS policy. Run n is seeded with (seed, n), so results do not
+    depend on how runs are split across the process pool. Returns per-metric distributions
+    (mean, min, p10, median, p90, max), the share of runs completing each arc and the raw
+    per-run results.
+
+    metrics, a PrometheusSink, collects every game's events; it is written when the
+    campaigns finish and, with a process pool, as each worker's share comes back.
+    """
+    if strategy not in CAMPAIGN_STRATEGIES:
+        raise ValueError(f"Unknown strategy '{strategy}'")
+    if policy not in DECISION_PROVIDERS or policy == "console":
+        raise ValueError(f"Unknown or interactive policy '{policy}'")
+    if runs < 1:
+        raise ValueError("runs must be at least 1")
+    if processes is None:
+        processes = os.cpu_count() or 1
+    processes = max(1, min(processes, runs))
+    if seed is None:
+        seed = random.getrandbits(64)
+
+    chunk_sizes = [runs // processes + (1 if i < runs % processes else 0) for i in range(processes)]
+    chunk_starts = [sum(chunk_sizes[:i]) for i in range(processes)]
+    jobs = [(strategy, start, size, turns, seed, policy, game_data_path)
+            for start, size in zip(chunk_starts, chunk_sizes)]
+
+    started = time.perf_counter()
+    results = []
+    if processes == 1:
+        results, _ = _simulate_campaigns(*jobs[0], metrics)
+    else:
+        worker_metrics = [None if metrics is None else PrometheusSink() for _ in jobs]
+        with concurrent.futures.ProcessPoolExecutor(max_workers=processes) as pool:
+            for chunk, chunk_metrics in pool.map(_simulate_campaigns, *zip(*jobs), worker_metrics):
+                results += chunk
+                if metrics is not None:
+                    metrics.merge(chunk_metrics)
+                    if metrics.path is not None:
+                        metrics.write()
+    if metrics is not None and metrics.path is not None:
+        metrics.write()
+
+    arc_ids = [arc['id'] for arc in load_game_data(game_data_path)['data']['campaign_arcs']]
+    return {
+        "strategy": strategy,
+        "runs": runs,
+        "turns": turns,
+        "metrics": {metric: _distribution([r[metric] for r in results]) for metric in CAMPAIGN_METRICS},
+        "arc_completion": {arc_id: sum(arc_id in r["arcs_completed"] for r in results) / runs for arc_id in arc_ids},
+        "results": results,
+        "elapsed": time.perf_counter() - started,
+    }
+
+
+def print_campaign_report(report):
+    print(f"\n=== Campaign: {report['strategy']} ({report['runs']} runs x {report['turns']} turns, "
+          f"{report['elapsed']:.2f}s) ===")
+    print(f"  {'':<18}{'mean':>9}{'min':>8}{'p10':>8}{'median':>8}{'p90':>8}{'max':>8}")
+    for metric, d in report['metrics'].items():
+        print(f"  {metric:<18}{d['mean']:9.1f}{d['min']:8}{d['p10']:8}{d['median']:8}{d['p90']:8}{d['max']:8}")
+    print("  Arc completion:")
+    for arc_id, share in report['arc_completion'].items():
+        print(f"    {arc_id:<30} {share:7.2%}")
+
+
+# ===============================
+# Save Stores
+# ===============================
+class JsonSaveStore:
+    """The original format: the whole campaign state rewritten as one JSON file."""
+
+    DEFAULT_PATH = "save_game.json"
+
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+
+    def save(self, state):
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, indent=4)
+
+    def load(self):
+        with open(self.path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+
+class JournalSaveStore(JsonSaveStore):
+    """A JSON snapshot plus an append-only journal of what changed between saves.
+
+    Each save appends one line to `<path>.journal` holding only the keys that changed since
+    the previous save: crew members by id, loot as the retained prefix length plus new items,
+    and trigger/unlock sets as additions and removals. The journal is folded into the
+    snapshot every `compact_every` saves. The snapshot records a generation, moved on by
+    each compaction, and every journal line the generation it applies to; lines of another
+    generation are skipped, so a crash between rewriting the snapshot and truncating the
+    journal cannot replay old values over the new snapshot. With no journal present the
+    snapshot is an ordinary save file. A torn final line, from a save that never completed,
+    is cut off when the journal is loaded so the next save starts on a line of its own.
+
+    Journal lines are written only by save_changes, which is handed just what changed since
+    the last save (see GameManager._collect_save_changes), so a journaled save costs what
+    changed rather than the whole state. save() takes the whole state and compacts.
+    """
+
+    INCREMENTAL = True
+    SET_KEYS = ("unlocked_heists", "completed_triggers")
+    BULK_KEYS = ("crew_members", "loot")  # journaled as changed members and a loot tail
+
+    def __init__(self, path, compact_every=50):
+        super().__init__(path)
+        self.journal_path = path + '.journal'
+        self.compact_every = compact_every
+        self._values = None  # the non-bulk keys as of the last save or load, encoded; None forces a snapshot
+        self._entries = 0
+        self._generation = None  # the snapshot's generation, once this store has read or written it
+
+    def save(self, state):
+        """Writes the whole state as a new snapshot and empties the journal."""
+        self.compact(state)
+
+    def save_changes(self, changes):
+        """
+        Journals a save from just what changed: changes["values"] holds the non-bulk keys in
+        full, and "crew" ({ id: member }), "crew_order" (ids, when the roster was replaced)
+        and "loot" ({"keep", "append"}) only what changed.
+        Returns False, saving nothing, when the whole state is needed for a compaction.
+        """
+        if self._values is None or self._entries >= self.compact_every:
+            return False
+        values = self._encode(changes["values"])
+        delta = self._diff_values(self._values, values, changes["values"])
+        for key in ("crew", "crew_order", "loot"):
+            if key in changes:
+                delta[key] = changes[key]
+        self._append(delta)
+        self._values = values
+        return True
+
+    def _append(self, delta):
+        if delta:
+            delta["gen"] = self._generation
+            with open(self.journal_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(delta, separators=(',', ':')) + '\n')
+            self._entries += 1
+
+    def _encode(self, values):
+        """The non-bulk keys of values as the next save compares them: sets as frozensets, the rest as JSON text."""
+        return {key: frozenset(value) if key in self.SET_KEYS else json.dumps(value, sort_keys=True)
+                for key, value in values.items() if key not in self.BULK_KEYS}
+
+    def compact(self, state):
+        generation = self._next_generation()
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(dict(state, journal_generation=generation), f, indent=4)
+        os.replace(tmp_path, self.path)
+        with open(self.journal_path, 'w', encoding='utf-8'):
+            pass
+        self._generation = generation
+        self._values = self._encode(state)
+        self._entries = 0
+
+    def _next_generation(self):
+        if self._generation is None:
+            # Not read yet: step past the generation of whatever journal is on disk
+            try:
+                with open(self.journal_path, 'rb') as f:
+                    self._generation = json.loads(f.readline()).get("gen", 0)
+            except (OSError, ValueError):
+                self._generation = 0
+        return self._generation + 1
+
+    def load(self):
+        state = super().load()
+        generation = state.pop("journal_generation", 0)
+        entries = 0
+        try:
+            with open(self.journal_path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            data = b''
+        lines = data.split(b'\n')
+        if not lines[-1]:
+            lines.pop()  # the journal ends with a complete line
+        complete = 0  # bytes of the journal up to the end of the last entry read
+        for n, line in enumerate(lines):
+            try:
+                delta = json.loads(line)
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                if n == len(lines) - 1:
+                    break  # torn final write: the save it belonged to never completed
+                raise
+            complete += len(line) + 1
+            if delta.get("gen", 0) != generation:
+                continue  # left over from before the snapshot was last rewritten
+            self._replay(state, delta)
+            entries += 1
+        if complete < len(data):
+            with open(self.journal_path, 'r+b') as f:
+                f.truncate(complete)
+        elif complete > len(data):
+            with open(self.journal_path, 'ab') as f:
+                f.write(b'\n')  # the last entry was written whole but its newline was not
+        self._generation = generation
+        self._values = self._encode(state)
+        self._entries = entries
+        return state
+
+    def _diff_values(self, old, new, values):
+        """The journal delta between two encoded value sets; changed keys are written from values."""
+        delta = {}
+        changed = {k: values[k] for k, v in new.items() if k not in self.SET_KEYS and old.get(k) != v}
+        if changed:
+            delta["set"] = changed
+        for key in self.SET_KEYS:
+            before, after = old.get(key, frozenset()), new.get(key, frozenset())
+            if before != after:
+                delta.setdefault("add", {})[key] = sorted(after - before)
+                delta.setdefault("remove", {})[key] = sorted(before - after)
+        return delta
+
+    def _replay(self, state, delta):
+        state.update(delta.get("set", {}))
+        if "crew" in delta or "crew_order" in delta:
+            crew = {c['id']: c for c in state.get("crew_members", [])}
+            crew.update(delta.get("crew", {}))
+            order = delta.get("crew_order", list(crew))
+            state["crew_members"] = [crew[crew_id] for crew_id in order]
+        if "loot" in delta:
+            state["loot"] = state.get("loot", [])[:delta["loot"]["keep"]] + delta["loot"]["append"]
+        for key in self.SET_KEYS:
+            members = set(state.get(key, []))
+            members |= set(delta.get("add", {}).get(key, []))
+            members -= set(delta.get("remove", {}).get(key, []))
+            if key in state or members:
+                state[key] = sorted(members)
+
+
+class SqliteSaveStore:
+    """Named save slots in one SQLite database, with per-heist history for cross-run queries.
+
+    Crew, loot, factions, unlocked heists and completed triggers get a table each, keyed by
+    slot, so loading or overwriting one slot never reads the others. A history row is added
+    whenever a slot is saved with a new heists_completed count.
+    """
+
+    DEFAULT_PATH = "save_game.db"
+    SLOTTED = True
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS slots (
+            slot TEXT PRIMARY KEY, saved_at REAL, notoriety INTEGER, treasury INTEGER,
+            heists_completed INTEGER, reputation TEXT, tool_inventory TEXT, extra TEXT);
+        CREATE TABLE IF NOT EXISTS crew (
+            slot TEXT, crew_id TEXT, position INTEGER, role TEXT, level INTEGER, status TEXT, data TEXT,
+            PRIMARY KEY (slot, crew_id));
+        CREATE TABLE IF NOT EXISTS loot (
+            slot TEXT, position INTEGER, item TEXT, value INTEGER, data TEXT,
+            PRIMARY KEY (slot, position));
+        CREATE TABLE IF NOT EXISTS factions (
+            slot TEXT, faction_id TEXT, standing INTEGER, data TEXT,
+            PRIMARY KEY (slot, faction_id));
+        CREATE TABLE IF NOT EXISTS unlocked_heists (
+            slot TEXT, heist_id TEXT, PRIMARY KEY (slot, heist_id));
+        CREATE TABLE IF NOT EXISTS completed_triggers (
+            slot TEXT, trigger_id TEXT, PRIMARY KEY (slot, trigger_id));
+        CREATE TABLE IF NOT EXISTS history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, slot TEXT, saved_at REAL, heists_completed INTEGER,
+            notoriety INTEGER, treasury INTEGER, loot_value INTEGER, crew_size INTEGER, arrested INTEGER);
+        CREATE INDEX IF NOT EXISTS history_notoriety ON history (notoriety);
+        CREATE INDEX IF NOT EXISTS history_slot ON history (slot, heists_completed);
+        CREATE INDEX IF NOT EXISTS crew_status ON crew (status);
+        CREATE INDEX IF NOT EXISTS loot_value ON loot (value);
+    """
+    SLOT_TABLES = ("crew", "loot", "factions", "unlocked_heists", "completed_triggers")
+    COLUMN_KEYS = ("notoriety", "treasury", "heists_completed", "reputation", "tool_inventory",
+                   "crew_members", "loot", "factions", "unlocked_heists", "completed_triggers")
+
+    def __init__(self, path=DEFAULT_PATH, slot="default"):
+        self.path = path
+        self.slot = slot
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path)
+        conn.executescript(self.SCHEMA)
+        return conn
+
+    def save(self, state):
+        slot, now = self.slot, time.time()
+        crew = state.get("crew_members", [])
+        loot = state.get("loot", [])
+        extra = {k: v for k, v in state.items() if k not in self.COLUMN_KEYS}
+        conn = self._connect()
+        try:
+            with conn:
+                previous = conn.execute("SELECT heists_completed FROM slots WHERE slot = ?", (slot,)).fetchone()
+                for table in self.SLOT_TABLES:
+                    conn.execute(f"DELETE FROM {table} WHERE slot = ?", (slot,))
+                conn.execute("INSERT OR REPLACE INTO slots VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                             (slot, now, state.get("notoriety", 0), state.get("treasury", 100),
+                              state.get("heists_completed", 0), json.dumps(state.get("reputation", {})),
+                              json.dumps(state.get("tool_inventory", {})), json.dumps(extra)))
+                conn.executemany("INSERT INTO crew VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                 [(slot, c['id'], i, c.get('role'), c.get('level', 1), c.get('status', 'active'),
+                                   json.dumps(c)) for i, c in enumerate(crew)])
+                conn.executemany("INSERT INTO loot VALUES (?, ?, ?, ?, ?)",
+                                 [(slot, i, item.get('item'), item.get('value', 0), json.dumps(item))
+                                  for i, item in enumerate(loot)])
+                conn.executemany("INSERT INTO factions VALUES (?, ?, ?, ?)",
+                                 [(slot, f, data.get('standing', 0), json.dumps(data))
+                                  for f, data in state.get("factions", {}).items()])
+                conn.executemany("INSERT INTO unlocked_heists VALUES (?, ?)",
+                                 [(slot, h) for h in state.get("unlocked_heists", [])])
+                conn.executemany("INSERT INTO completed_triggers VALUES (?, ?)",
+                                 [(slot, t) for t in state.get("completed_triggers", [])])
+                if previous is None or previous[0] != state.get("heists_completed", 0):
+                    conn.execute("INSERT INTO history (slot, saved_at, heists_completed, notoriety, treasury, "
+                                 "loot_value, crew_size, arrested) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                                 (slot, now, state.get("heists_completed", 0), state.get("notoriety", 0),
+                                  state.get("treasury", 100), sum(item.get('value', 0) for item in loot), len(crew),
+                                  sum(1 for c in crew if c.get('status') == 'arrested')))
+        finally:
+            conn.close()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            raise FileNotFoundError(self.path)
+        slot = self.slot
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT notoriety, treasury, heists_completed, reputation, tool_inventory, extra "
+                               "FROM slots WHERE slot = ?", (slot,)).fetchone()
+            if row is None:
+                raise FileNotFoundError(f"{self.path}: no save slot {slot!r}")
+            state = json.loads(row[5])
+            state.update({
+                "notoriety": row[0],
+                "treasury": row[1],
+                "heists_completed": row[2],
+                "reputation": json.loads(row[3]),
+                "tool_inventory": json.loads(row[4]),
+                "crew_members": [json.loads(data) for (data,) in conn.execute(
+                    "SELECT data FROM crew WHERE slot = ? ORDER BY position", (slot,))],
+                "loot": [json.loads(data) for (data,) in conn.execute(
+                    "SELECT data FROM loot WHERE slot = ? ORDER BY position", (slot,))],
+                "factions": {f: json.loads(data) for f, data in conn.execute(
+                    "SELECT faction_id, data FROM factions WHERE slot = ?", (slot,))},
+                "unlocked_heists": [h for (h,) in conn.execute(
+                    "SELECT heist_id FROM unlocked_heists WHERE slot = ? ORDER BY heist_id", (slot,))],
+                "completed_triggers": [t for (t,) in conn.execute(
+                    "SELECT trigger_id FROM completed_triggers WHERE slot = ? ORDER BY trigger_id", (slot,))],
+            })
+            return state
+        finally:
+            conn.close()
+
+    def _query(self, sql, params=()):
+        if not os.path.exists(self.path):
+            return []
+        conn = self._connect()
+        try:
+            cursor = conn.execute(sql, params)
+            names = [d[0] for d in cursor.description]
+            return [dict(zip(names, row)) for row in cursor]
+        finally:
+            conn.close()
+
+    def list_slots(self):
+        """Every slot with its headline numbers, most recently saved first."""
+        return self._query("SELECT slot, saved_at, notoriety, treasury, heists_completed FROM slots "
+                           "ORDER BY saved_at DESC")
+
+    def history(self, slot=None, min_notoriety=None):
+        """History rows across slots, optionally for one slot or above a notoriety level."""
+        clauses, params = [], []
+        if slot is not None:
+            clauses.append("slot = ?")
+            params.append(slot)
+        if min_notoriety is not None:
+            clauses.append("notoriety > ?")
+            params.append(min_notoriety)
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        return self._query(f"SELECT * FROM history{where} ORDER BY slot, heists_completed, id", params)
+
+    def delete_slot(self, slot):
+        conn = self._connect()
+        try:
+            with conn:
+                for table in self.SLOT_TABLES + ("slots", "history"):
+                    conn.execute(f"DELETE FROM {table} WHERE slot = ?", (slot,))
+        finally:
+            conn.close()
+
+
+SAVE_STORES = {
+    "json": JsonSaveStore,
+    "journal": JournalSaveStore,
+    "sqlite": SqliteSaveStore,
+}
 
-        self.city_agent = CityAgent(self.game_data['player'])
-        self.crew_agent = CrewAgent(self.game_data['crew_members'], self.game_data['progression'])
-        self.tool_agent = ToolAgent(self.game_data['tools'])
+
+# ===============================
+# Game Manager & UI
+# ===============================
+class GameManager:
+    def __init__(self, decisions=None, events=None, seed=None, save_format="json", save_slot="default",
+                 compiled_data=None, output=None):
+        compiled = compiled_data or load_game_data('game_data.json')
+        self.game_data = compiled['data']
+        indexes = compiled['indexes']
+
+        self.decisions = decisions or ConsoleDecisions()
+        self.events = events or console_bus()
+        self.output = output  # replaces print for menu text, e.g. to write to a player's connection
+        self.rng = RandomStreams(seed)  # the same seed replays the same campaign
+        self.save_format = save_format
+        self.save_slot = save_slot  # only stores that hold several slots (sqlite) use this
+        self._save_stores = {}
+        self.changes = ChangeClock()  # this game's alone, so other games never show up as its changes
+        self._save_marks = {}  # shape: { save path: mark of self.changes at its last save or load }
+        self._fencing_modifiers = None  # shape: { faction id: (name, fencing_modifiers) }
+        self._fencing_prices = None     # (factions_version, multiplier, applied modifiers)
+
+        self.city_agent = CityAgent(self.game_data['player'], self.events, self.changes)
+        self.crew_agent = CrewAgent(indexes['crew_members'], self.game_data['progression'], self.events, self.rng,
+                                    self.changes)
+        self.tool_agent = ToolAgent(indexes['tools'])
         self.heist_agent = HeistAgent(
-            self.game_data['heists'],
+            indexes['heists'],
             self.game_data['random_events'],
-            self.game_data['special_events'],
+            indexes['special_events'],
             self.crew_agent,
             self.tool_agent,
-            self.city_agent
+            self.city_agent,
+            self.decisions,
+            self.events,
+            self.rng,
+            procedural_heists(self.game_data)
         )
         self.arc_manager = ArcManager(
             self.game_data['campaign_arcs'],
-            self.game_data['narrative_events'],
-            self.game_data['special_events'],
+            indexes['narrative_events'],
+            indexes['special_events'],
             self.city_agent,
-            self.crew_agent
+            self.crew_agent,
+            self.decisions,
+            self.events
         )
 
 
@@ -787,11 +4229,44 @@ class GameManager:
             self.enable_cheat_mode()
 
 
-    def save_game(self, filename="save_game.json"):
-        save_data = {
+    def _print(self, *args, **kwargs):
+        (self.output or print)(*args, **kwargs)
+
+    @property
+    def state(self):
+        """The current campaign as a GameState, e.g. game.state.fork() for what-if planning."""
+        return GameState(self.city_agent, self.crew_agent, self.arc_manager, self.heist_agent)
+
+    def simulate_heist(self, heist_id, crew_ids, tool_assignments=None, trials=10000, processes=None, seed=None, decisions=None):
+        """Simulates a heist from the current campaign state without changing it."""
+        start_state = {
+            "notoriety": self.city_agent.notoriety,
+            "reputation": self.city_agent.reputation,
+            "factions": self.city_agent.factions,
+            "crew_members": [member.to_dict() for member in self.crew_agent.crew_members.values()],
+        }
+        return simulate_heist(self.game_data, heist_id, crew_ids, tool_assignments, trials=trials,
+                              processes=processes, seed=seed, start_state=start_state, decisions=decisions)
+
+    def _save_store(self, filename):
+        if filename not in self._save_stores:
+            store_class = SAVE_STORES[self.save_format]
+            if getattr(store_class, 'SLOTTED', False):
+                self._save_stores[filename] = store_class(filename, self.save_slot)
+            else:
+                self._save_stores[filename] = store_class(filename)
+        return self._save_stores[filename]
+
+    def _collect_save_state(self):
+        state = self._collect_save_values()
+        state["loot"] = list(self.city_agent.loot)
+        state["crew_members"] = [member.to_dict() for member in self.crew_agent.crew_members.values()]
+        return state
+
+    def _collect_save_values(self):
+        """The parts of the save state small enough to collect and compare in full on every save."""
+        return {
             "notoriety": self.city_agent.notoriety,
-            "loot": self.city_agent.loot,
-            "crew_members": list(self.crew_agent.crew_members.values()),
             "reputation": self.city_agent.reputation,
             "heists_completed": self.city_agent.heists_completed,
             "tool_inventory": self.city_agent.tool_inventory,
@@ -800,106 +4275,132 @@ class GameManager:
             "completed_triggers": list(self.arc_manager.completed_triggers),
             "treasury": self.city_agent.treasury
         }
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(save_data, f, indent=4)
-        print(f"\n[Game saved to {filename}.]")
 
-    def load_game(self, filename="save_game.json"):
+    def _collect_save_changes(self, since):
+        """
+        What an incremental store needs to save the changes since a ChangeClock mark: the
+        small values, the crew members edited since, and the loot from the first change on.
+        """
+        changes = {"values": self._collect_save_values()}
+        crew = self.crew_agent
+        edited = {crew_id: crew.crew_members[crew_id].to_dict() for crew_id in crew.edited_since(since)}
+        if edited:
+            changes["crew"] = edited
+        if crew.roster_stamp > since:
+            changes["crew_order"] = list(crew.crew_members)
+        loot = self.city_agent.loot.changed_since(since)
+        if loot is not None:
+            changes["loot"] = {"keep": loot[0], "append": loot[1]}
+        return changes
+
+    def _restore_save_state(self, save_data):
+        self.city_agent.notoriety = save_data.get('notoriety', 0)
+        self.city_agent.loot = save_data.get('loot', [])
+        # In place: the heist agent and arc manager hold this same CrewAgent
+        self.crew_agent.load_members(save_data.get('crew_members', []))
+        self.city_agent.reputation = save_data.get('reputation', {"fear": 0, "respect": 0})
+        self.city_agent.factions = save_data.get('factions', self.city_agent.factions)
+        self.arc_manager.completed_triggers = set(save_data.get('completed_triggers', []))
+        self.city_agent.heists_completed = save_data.get("heists_completed", 0)
+        self.city_agent.tool_inventory = save_data.get("tool_inventory", {})
+        self.city_agent.treasury = save_data.get("treasury", 100)
+
+        saved_unlocked = save_data.get("unlocked_heists")
+        if saved_unlocked is not None:
+            self.city_agent.unlocked_heists = set(saved_unlocked)
+
+        if any(m.get("status") == "arrested" for m in self.crew_agent.crew_members.values()):
+            self.city_agent.unlocked_heists.add("rescue_heist")
+
+    def save_game(self, filename=None):
+        filename = filename or SAVE_STORES[self.save_format].DEFAULT_PATH
+        store = self._save_store(filename)
+        mark, since = self.changes.mark(), self._save_marks.get(filename)
+        if (since is None or not getattr(store, 'INCREMENTAL', False)
+                or not store.save_changes(self._collect_save_changes(since))):
+            store.save(self._collect_save_state())
+        self._save_marks[filename] = mark
+        self._print(f"\n[Game saved to {filename}.]")
+
+    def load_game(self, filename=None):
+        filename = filename or SAVE_STORES[self.save_format].DEFAULT_PATH
         try:
-            with open(filename, 'r', encoding='utf-8') as f:
-                save_data = json.load(f)
-
-            self.city_agent.notoriety = save_data.get('notoriety', 0)
-            self.city_agent.loot = save_data.get('loot', [])
-            saved_crew = save_data.get('crew_members', [])
-            self.crew_agent.crew_members = {c['id']: c for c in saved_crew}
-            # Re-init crew agent so XP/levels sync properly
-            self.crew_agent = CrewAgent(list(self.crew_agent.crew_members.values()), self.game_data['progression'])
-            self.city_agent.reputation = save_data.get('reputation', {"fear": 0, "respect": 0})
-            self.city_agent.factions = save_data.get('factions', self.city_agent.factions)
-            self.arc_manager.completed_triggers = set(save_data.get('completed_triggers', []))
-            self.city_agent.heists_completed = save_data.get("heists_completed", 0)
-            self.city_agent.tool_inventory = save_data.get("tool_inventory", {})
-            self.city_agent.treasury = save_data.get("treasury", 100)
-
-            saved_unlocked = save_data.get("unlocked_heists")
-            if saved_unlocked is not None:
-                self.city_agent.unlocked_heists = set(saved_unlocked)
-
-            if any(m.get("status") == "arrested" for m in self.crew_agent.crew_members.values()):
-                self.city_agent.unlocked_heists.add("rescue_heist")
-
-            print(f"[Game loaded from {filename}.]")
+            self._restore_save_state(self._save_store(filename).load())
+            self._save_marks[filename] = self.changes.mark()
+            self._print(f"[Game loaded from {filename}.]")
             return True
         except FileNotFoundError:
             return False
-        except (KeyError, json.JSONDecodeError) as e:
-            print(f"[Save file is corrupted or invalid: {e}. Starting a new game.]")
+        except (KeyError, json.JSONDecodeError, sqlite3.DatabaseError) as e:
+            self._print(f"[Save file is corrupted or invalid: {e}. Starting a new game.]")
             return False
 
-    def start_game(self):
-        print("Welcome to The Clockwork Heist!")
-        print("="*30)
+    def start_game_steps(self):
+        """The interactive game as a step generator: menus, heists and arcs until the player exits."""
+        self._print("Welcome to The Clockwork Heist!")
+        self._print("="*30)
 
-        choice = input("Start [N]ew Game or [L]oad Game? ").upper()
+        choice = (yield Prompt.ask('new_or_load', "Start [N]ew Game or [L]oad Game? ")).upper()
         if choice == 'L':
             if not self.load_game():
-                print("No save file found. Starting a new game.")
+                self._print("No save file found. Starting a new game.")
 
         while True:
-            self.arc_manager.check_arcs()
+            yield from self.arc_manager.check_arcs_steps()
 
-            print("\n--- Main Menu ---")
-            print(f"Notoriety: {self.city_agent.notoriety} | Treasury: {self.city_agent.treasury} coin | Reputation: Fear {self.city_agent.reputation['fear']}, Respect {self.city_agent.reputation['respect']}")
+            self._print("\n--- Main Menu ---")
+            self._print(f"Notoriety: {self.city_agent.notoriety} | Treasury: {self.city_agent.treasury} coin | Reputation: Fear {self.city_agent.reputation['fear']}, Respect {self.city_agent.reputation['respect']}")
 
             current_loot = "None"
             if self.city_agent.loot:
-                current_loot = ', '.join([item['item'] for item in self.city_agent.loot])
-            print(f"Loot: {current_loot}")
+                current_loot = ', '.join(self.city_agent.loot.names())
+            self._print(f"Loot: {current_loot}")
 
-            print("\n[P]lan Heist")
-            print("[C]rew Roster")
-            print("[M]arket / Hideout")
-            print("[F]action Status") 
-            print("[S]ave Game")
-            print("[E]xit Game")
+            self._print("\n[P]lan Heist")
+            self._print("[C]rew Roster")
+            self._print("[M]arket / Hideout")
+            self._print("[F]action Status") 
+            self._print("[S]ave Game")
+            self._print("[E]xit Game")
 
-            arrested_members = [m for m in self.crew_agent.crew_members.values() if m.get("status") == "arrested"]
+            arrested_members = self.arrested_members()
             if arrested_members:
                 target_name = arrested_members[0]['name']
-                print(f"\n[Alert] {target_name} was arrested!")
-                print(f"[B]ribe the Watch: Pay coin to free {target_name}")
+                self._print(f"\n[Alert] {target_name} was arrested!")
+                self._print(f"[B]ribe the Watch: Pay coin to free {target_name}")
                 if "rescue_heist" in self.city_agent.unlocked_heists:
-                    print(f"[R]escue Mission: Break {target_name} out of the Watch Barracks!")
+                    self._print(f"[R]escue Mission: Break {target_name} out of the Watch Barracks!")
 
             
-            action = input("> ").upper()
+            action = (yield Prompt.ask('main_menu', "> ")).upper()
 
             if action == 'P':
-                self.plan_and_execute_heist()
+                yield from self.plan_and_execute_heist_steps()
             elif action == 'S':
                 self.save_game()
             elif action == 'F':
-                self.show_faction_status()
+                yield from self.show_faction_status_steps()
             elif action == 'M':
-                self.show_market_menu()
+                yield from self.show_market_menu_steps()
             elif action == 'C':
                 self.show_crew_roster()
             elif action == 'B' and arrested_members:
-                self._bribe_for_release()
+                yield from self._bribe_for_release_steps()
             elif action == 'R' and arrested_members and "rescue_heist" in self.city_agent.unlocked_heists:
-                self._attempt_rescue_heist()
+                yield from self._attempt_rescue_heist_steps()
             elif action == 'E':
-                print("\nYou melt back into the shadows of Brasshaven...")
+                self._print("\nYou melt back into the shadows of Brasshaven...")
                 break
             else:
-                print("Invalid choice. Please try again.")
+                self._print("Invalid choice. Please try again.")
+
+    start_game = blocking(start_game_steps)
 
     def show_crew_roster(self):
-        print("\n=== Crew Roster ===")
+        self._print("\n=== Crew Roster ===")
         members = self.crew_agent.crew_members
         if not members:
-            print("No crew members found.")
+            self._print("No crew members found.")
             return
         for m in sorted(members.values(), key=lambda x: x['name']):
             name = m.get("name", "Unknown")
@@ -909,206 +4410,285 @@ class GameManager:
             xp = m.get("xp", 0)
             skills = m.get("skills", {})
             upgrades = m.get("upgrades", [])
-            print(f"- {name} [{role}] — Status: {status} — Lv {lvl} ({xp} XP) — Skills: {skills}")
+            self._print(f"- {name} [{role}] — Status: {status} — Lv {lvl} ({xp} XP) — Skills: {skills}")
             if upgrades:
-                print(f"  Upgrades: {', '.join(upgrades)}")
+                self._print(f"  Upgrades: {', '.join(upgrades)}")
 
 
     
     
-    def _handle_level_ups(self, leveled_up_crew_ids):
+    def _handle_level_ups_steps(self, leveled_up_crew_ids):
         if not leveled_up_crew_ids:
             return
 
-        print("\n--- Crew Progression ---")
+        self._print("\n--- Crew Progression ---")
         for crew_id in leveled_up_crew_ids:
             member = self.crew_agent.get_crew_member(crew_id)
             if not member: continue
-            print(f"\n{member['name']} has leveled up and can learn a new skill!")
+            self._print(f"\n{member['name']} has leveled up and can learn a new skill!")
 
-            general_upgrades = self.game_data['progression']['upgrade_options']['general']
-            role_upgrades = self.game_data['progression']['upgrade_options'].get(member['role'].lower(), [])
-            available_upgrades = [u for u in general_upgrades + role_upgrades if u['id'] not in member.get('upgrades', [])]
+            available_upgrades = self.available_upgrades(crew_id)
 
             if not available_upgrades:
-                print(f"{member['name']} has already learned all available upgrades!")
+                self._print(f"{member['name']} has already learned all available upgrades!")
                 continue
 
-            print("Choose an upgrade:")
+            self._print("Choose an upgrade:")
             for i, upgrade in enumerate(available_upgrades):
-                print(f"  [{i+1}] {upgrade['text']}")
+                self._print(f"  [{i+1}] {upgrade['text']}")
 
             choice = -1
             while choice < 1 or choice > len(available_upgrades):
                 try:
-                    choice_str = input(f"Enter number (1-{len(available_upgrades)}): ")
+                    choice_str = yield Prompt.ask('upgrade', f"Enter number (1-{len(available_upgrades)}): ")
                     choice = int(choice_str)
                 except ValueError:
-                    print("Invalid input.")
+                    self._print("Invalid input.")
 
             selected_upgrade_obj = available_upgrades[choice - 1]
 
-            if 'upgrades' not in member:
-                member['upgrades'] = []
-            member['upgrades'].append(selected_upgrade_obj['id']) 
-            print(f"{member['name']} has learned: '{selected_upgrade_obj['text']}'!")
-
-            if 'effects' in selected_upgrade_obj:
-                for effect in selected_upgrade_obj['effects']:
-                    if effect.get('type') == 'stat_boost':
-                        skill = effect['skill']
-                        value = effect['value']
-                        member['skills'][skill] = member['skills'].get(skill, 0) + value
-                        print(f"[Skill Increased] {member['name']}'s {skill} is now {member['skills'][skill]}.")
-
-    def show_market_menu(self):
+            boosts = self.apply_upgrade(crew_id, selected_upgrade_obj)
+            self._print(f"{member['name']} has learned: '{selected_upgrade_obj['text']}'!")
+            for skill, value in boosts:
+                self._print(f"[Skill Increased] {member['name']}'s {skill} is now {value}.")
+
+    _handle_level_ups = blocking(_handle_level_ups_steps)
+
+    def available_upgrades(self, crew_id):
+        """Upgrades crew_id can still learn: the general ones plus those for their role."""
+        member = self.crew_agent.get_crew_member(crew_id)
+        options = self.game_data['progression']['upgrade_options']
+        role_upgrades = options.get(member['role'].lower(), [])
+        return [u for u in options['general'] + role_upgrades if u['id'] not in member.get('upgrades', [])]
+
+    def apply_upgrade(self, crew_id, upgrade):
+        """Teaches an upgrade and applies its stat boosts. Returns [(skill, new value)]."""
+        member = self.crew_agent.edit_member(crew_id)
+        if 'upgrades' not in member:
+            member['upgrades'] = []
+        member['upgrades'].append(upgrade['id'])
+        boosts = []
+        for effect in upgrade.get('effects', []):
+            if effect.get('type') == 'stat_boost':
+                skill = effect['skill']
+                member['skills'][skill] = member['skills'].get(skill, 0) + effect['value']
+                boosts.append((skill, member['skills'][skill]))
+        return boosts
+
+    def show_market_menu_steps(self):
         """Handles spending loot: healing crew, buying tools, and fencing treasures."""
         while True:
-            print("\n--- The Black Market ---")
-            print(f"Treasury: {self.city_agent.treasury_value()} coin.")
-            print(f"Loot Inventory: {[item['item'] for item in self.city_agent.loot] or 'None'}")
-            print("[1] Heal Injured Crew")
-            print("[2] Buy Tools")
-            print("[3] Fence Loot (convert treasures into coin)")
-            print("[4] Return to Main Menu")
-            choice = input("> ").strip()
+            self._print("\n--- The Black Market ---")
+            self._print(f"Treasury: {self.city_agent.treasury_value()} coin.")
+            self._print(f"Loot Inventory: {self.city_agent.loot.names() or 'None'}")
+            self._print("[1] Heal Injured Crew")
+            self._print("[2] Buy Tools")
+            self._print("[3] Fence Loot (convert treasures into coin)")
+            self._print("[4] Return to Main Menu")
+            choice = (yield Prompt.ask('market_menu', "> ")).strip()
 
             if choice == "1":
-                self._heal_injured_crew()
+                yield from self._heal_injured_crew_steps()
             elif choice == "2":
-                self._buy_tools()
+                yield from self._buy_tools_steps()
             elif choice == "3":
-                self._fence_loot()
+                yield from self._fence_loot_steps()
             elif choice == "4":
                 break
             else:
-                print("Invalid choice.")
+                self._print("Invalid choice.")
 
+    show_market_menu = blocking(show_market_menu_steps)
 
-    def _attempt_rescue_heist(self):
-        print("\nThe Watch Barracks rise from Brasshaven’s steel heart, bristling with riflemen and clockwork hounds.")
-        print("Breaking in is madness — but loyalty runs deeper than fear. Tonight, you attempt the impossible: a prison break.")
+    def _attempt_rescue_heist_steps(self):
+        self._print("\nThe Watch Barracks rise from Brasshaven’s steel heart, bristling with riflemen and clockwork hounds.")
+        self._print("Breaking in is madness — but loyalty runs deeper than fear. Tonight, you attempt the impossible: a prison break.")
 
-        arrested = [m for m in self.crew_agent.crew_members.values() if m.get('status') == "arrested"]
+        arrested = self.arrested_members()
         if not arrested:
-            print("No crew are under arrest.")
+            self._print("No crew are under arrest.")
             return
 
         active_crew_ids = [cid for cid, m in self.crew_agent.crew_members.items() if m.get("status", "active") == "active"]
         if not active_crew_ids:
-            print("No active crew available for the rescue!")
+            self._print("No active crew available for the rescue!")
             return
 
         # For simplicity, we use the first 2 available crew members for the rescue
-        crew_for_heist = active_crew_ids[:2]
-        tool_assignments = {} # No tool assignment phase for this special heist
-
-        self.heist_agent.run_heist("rescue_heist", crew_for_heist, tool_assignments)
-
-        if self.heist_agent.last_heist_successful:
-            # Re-check who is arrested, in case the list is outdated
-            arrested_now = [m for m in self.crew_agent.crew_members.values() if m.get('status') == "arrested"]
-            if arrested_now:
-                freed = arrested_now[0]
-                freed['status'] = "active"
-                print(f"\n[Rescue Successful!] {freed['name']} has been freed from the Watch!")
-        else:
-            print("\nThe rescue failed. Your captured crew remain imprisoned for now.")
+        freed = yield from self.rescue_arrested_steps(active_crew_ids[:2])
+        if freed:
+            self._print(f"\n[Rescue Successful!] {freed['name']} has been freed from the Watch!")
+        elif not self.heist_agent.last_heist_successful:
+            self._print("\nThe rescue failed. Your captured crew remain imprisoned for now.")
+
+    _attempt_rescue_heist = blocking(_attempt_rescue_heist_steps)
+
+    def arrested_members(self):
+        return [m for m in self.crew_agent.crew_members.values() if m.get('status') == "arrested"]
+
+    def rescue_arrested_steps(self, crew_ids):
+        """Runs the rescue heist with crew_ids; on success frees the first arrested member and returns them."""
+        yield from self.heist_agent.run_heist_steps("rescue_heist", crew_ids, {}) # No tool assignment phase for this special heist
+        if not self.heist_agent.last_heist_successful:
+            return None
+        # Re-check who is arrested, in case the list is outdated
+        arrested_now = self.arrested_members()
+        if not arrested_now:
+            return None
+        freed = self.crew_agent.edit_member(arrested_now[0]['id'])
+        freed['status'] = "active"
+        return freed
+
+    rescue_arrested = blocking(rescue_arrested_steps)
 
 
     
-    def _bribe_for_release(self):
-        arrested = [m for m in self.crew_agent.crew_members.values() if m.get('status') == "arrested"]
+    def _bribe_for_release_steps(self):
+        arrested = self.arrested_members()
         if not arrested:
-            print("No crew are under arrest.")
+            self._print("No crew are under arrest.")
             return
 
         target = arrested[0] # Handle one at a time for simplicity
-        cost = 100 + (self.city_agent.notoriety * 5)
-        print(f"Bribing the Watch to release {target['name']} will cost {cost} coin.")
-        print(f"You have {self.city_agent.treasury} coin.")
+        cost = self.bribe_cost()
+        self._print(f"Bribing the Watch to release {target['name']} will cost {cost} coin.")
+        self._print(f"You have {self.city_agent.treasury} coin.")
 
         if self.city_agent.treasury >= cost:
-            confirm = input(f"Pay {cost} coin? [Y/N]: ").upper()
+            confirm = (yield Prompt.ask('bribe', f"Pay {cost} coin? [Y/N]: ")).upper()
             if confirm == 'Y':
-                self.city_agent.treasury -= cost
-                target['status'] = "active"
-                print(f"{target['name']} is freed after some coin changes hands.")
+                self.bribe_release(target['id'])
+                self._print(f"{target['name']} is freed after some coin changes hands.")
         else:
-            print("You don't have enough coin for the bribe.")
+            self._print("You don't have enough coin for the bribe.")
+
+    _bribe_for_release = blocking(_bribe_for_release_steps)
+
+    def bribe_cost(self):
+        return 100 + (self.city_agent.notoriety * 5)
+
+    def bribe_release(self, crew_id):
+        """Pays the Watch to free an arrested member. Returns False if the treasury is short."""
+        if not self.spend_coin(self.bribe_cost()):
+            return False
+        self.crew_agent.edit_member(crew_id)['status'] = "active"
+        return True
 
 
     
-    def _fence_loot(self):
+    def _fence_loot_steps(self):
         if not self.city_agent.loot:
-            print("You have no treasures to fence.")
+            self._print("You have no treasures to fence.")
             return
 
-        multiplier = 1.0
-        for faction_id, faction in self.city_agent.factions.items():
-            data = next((f for f in self.game_data["factions"] if f["id"] == faction_id), None)
-            if not data: continue
-
-            mods = data.get("fencing_modifiers", {})
-            standing = faction.get("standing", 0)
-
-            if standing >= 3 and "allied" in mods:
-                multiplier *= mods["allied"]
-                print(f"[Faction Bonus] {data['name']} (Allied): x{mods['allied']}")
-            elif standing > 0 and "friendly" in mods:
-                multiplier *= mods["friendly"]
-                print(f"[Faction Bonus] {data['name']} (Friendly): x{mods['friendly']}")
-            elif standing <= -3 and "hostile" in mods:
-                multiplier *= mods["hostile"]
-                print(f"[Faction Penalty] {data['name']} (Hostile): x{mods['hostile']}")
+        multiplier, modifiers = self.fencing_multiplier()
+        for name, standing, factor in modifiers:
+            kind = "Penalty" if standing == "Hostile" else "Bonus"
+            self._print(f"[Faction {kind}] {name} ({standing}): x{factor}")
 
-        print("\n--- Fence Loot ---")
+        self._print("\n--- Fence Loot ---")
         loot_to_sell = list(self.city_agent.loot) # Create a copy
         for i, item in enumerate(loot_to_sell, 1):
             adj_value = int(item['value'] * multiplier)
-            print(f"[{i}] {item['item']} (Base: {item['value']} -> Fencing: {adj_value} coin)")
+            self._print(f"[{i}] {item['item']} (Base: {item['value']} -> Fencing: {adj_value} coin)")
 
-        choice = input("Choose loot to fence (number), 'all', or 'back': ").strip().lower()
+        choice = (yield Prompt.ask('fence_loot', "Choose loot to fence (number), 'all', 'best N', or 'back': ")).strip().lower()
         if choice == "back":
             return
 
         if choice == "all":
-            total = sum(int(item['value'] * multiplier) for item in loot_to_sell)
-            self.city_agent.treasury += total
-            self.city_agent.loot.clear()
-            print(f"All loot fenced for {total} coin! Treasury: {self.city_agent.treasury}")
+            total = self.fence_items()
+            self._print(f"All loot fenced for {total} coin! Treasury: {self.city_agent.treasury}")
+            return
+
+        if choice.startswith("best") and choice[4:].strip().isdigit():
+            count = int(choice[4:])
+            total = self.fence_best(count)
+            self._print(f"Your {count} most valuable treasures fenced for {total} coin! Treasury: {self.city_agent.treasury}")
             return
 
         try:
             idx = int(choice) - 1
             if 0 <= idx < len(loot_to_sell):
-                item = loot_to_sell.pop(idx)
-                # Find and remove the actual item from the main loot list
-                self.city_agent.loot.remove(item)
-                adj_value = int(item['value'] * multiplier)
-                self.city_agent.treasury += adj_value
-                print(f"Fenced {item['item']} for {adj_value} coin. Treasury: {self.city_agent.treasury}")
+                item = loot_to_sell[idx]
+                adj_value = self.fence_items([item])
+                self._print(f"Fenced {item['item']} for {adj_value} coin. Treasury: {self.city_agent.treasury}")
             else:
-                print("Invalid selection.")
+                self._print("Invalid selection.")
         except ValueError:
-            print("Invalid input.")
+            self._print("Invalid input.")
+
+    _fence_loot = blocking(_fence_loot_steps)
+
+
+
+    def fencing_multiplier(self):
+        """
+        The price multiplier from faction standings, and the (faction name, standing label,
+        factor) of every modifier that applied. Cached until a standing changes.
+        """
+        version = self.city_agent.factions_version
+        if self._fencing_prices is None or self._fencing_prices[0] != version:
+            self._fencing_prices = (version,) + self._compute_fencing_multiplier()
+        return self._fencing_prices[1], self._fencing_prices[2]
+
+    def _compute_fencing_multiplier(self):
+        if self._fencing_modifiers is None:
+            self._fencing_modifiers = {f["id"]: (f["name"], f.get("fencing_modifiers", {}))
+                                       for f in self.game_data["factions"]}
+        multiplier, applied = 1.0, []
+        for faction_id, faction in self.city_agent.factions.items():
+            data = self._fencing_modifiers.get(faction_id)
+            if not data: continue
 
+            name, mods = data
+            standing = faction.get("standing", 0)
 
+            if standing >= 3 and "allied" in mods:
+                label = "Allied"
+            elif standing > 0 and "friendly" in mods:
+                label = "Friendly"
+            elif standing <= -3 and "hostile" in mods:
+                label = "Hostile"
+            else:
+                continue
+            multiplier *= mods[label.lower()]
+            applied.append((name, label, mods[label.lower()]))
+        return multiplier, applied
+
+    def fence_items(self, items=None):
+        """Sells the given loot items (all loot by default) into the treasury. Returns the coin earned."""
+        multiplier, _ = self.fencing_multiplier()
+        if items is None:
+            # Items of equal value fence for the same price, so price each value once
+            total = sum(int(value * multiplier) * count for value, count in self.city_agent.loot.value_counts.items())
+            self.city_agent.loot.clear()
+        else:
+            total = 0
+            for item in items:
+                # Find and remove the actual item from the main loot list
+                self.city_agent.loot.remove(item)
+                total += int(item['value'] * multiplier)
+        self.city_agent.treasury += total
+        return total
 
+    def fence_best(self, count):
+        """Sells the count most valuable loot items. Returns the coin earned."""
+        return self.fence_items(self.city_agent.loot.best(count))
 
-    def _heal_injured_crew(self):
+    def _heal_injured_crew_steps(self):
         injured = [m for m in self.crew_agent.crew_members.values() if m.get("status") == "injured"]
         if not injured:
-            print("No crew members are injured.")
+            self._print("No crew members are injured.")
             return
 
         healing_cost = self.game_data["market"]["healing_cost"]
 
-        print("\n--- Healing Services ---")
+        self._print("\n--- Healing Services ---")
         for i, member in enumerate(injured, 1):
-            print(f"[{i}] {member['name']} - Heal for {healing_cost} coin (You have {self.city_agent.treasury})")
+            self._print(f"[{i}] {member['name']} - Heal for {healing_cost} coin (You have {self.city_agent.treasury})")
 
-        choice = input("Choose crew to heal (number) or 'back': ").strip()
+        choice = (yield Prompt.ask('heal_crew', "Choose crew to heal (number) or 'back': ")).strip()
         if choice == "back":
             return
 
@@ -1116,27 +4696,34 @@ class GameManager:
             idx = int(choice) - 1
             if 0 <= idx < len(injured):
                 member = injured[idx]
-                if self._spend_coin(healing_cost):
-                    member["status"] = "active" # FIX: Set status to active
-                    print(f"{member['name']} has been healed and is ready for the next heist!")
+                if self._report_spend(self.heal_member(member['id']), healing_cost):
+                    self._print(f"{member['name']} has been healed and is ready for the next heist!")
             else:
-                print("Invalid selection.")
+                self._print("Invalid selection.")
         except ValueError:
-            print("Invalid input.")
+            self._print("Invalid input.")
 
+    _heal_injured_crew = blocking(_heal_injured_crew_steps)
+
+    def heal_member(self, crew_id):
+        """Pays the healer to return an injured member to active duty. Returns False if the treasury is short."""
+        if not self.spend_coin(self.game_data["market"]["healing_cost"]):
+            return False
+        self.crew_agent.edit_member(crew_id)["status"] = "active" # FIX: Set status to active
+        return True
 
-    def _buy_tools(self):
+    def _buy_tools_steps(self):
         tools_for_sale = self.game_data["market"]["tools"]
 
-        print("\n--- Tools for Sale ---")
+        self._print("\n--- Tools for Sale ---")
         tool_ids = list(tools_for_sale.keys())
         for i, tool_id in enumerate(tool_ids, 1):
             tool = self.tool_agent.tools[tool_id]
             price = tools_for_sale[tool_id]["price"]
             owned = self.city_agent.tool_inventory.get(tool_id, 0)
-            print(f"[{i}] {tool['name']} - {price} coin (Owned: {owned})")
+            self._print(f"[{i}] {tool['name']} - {price} coin (Owned: {owned})")
 
-        choice = input("Choose tool to buy (number) or 'back': ").strip()
+        choice = (yield Prompt.ask('buy_tool', "Choose tool to buy (number) or 'back': ")).strip()
         if choice == "back":
             return
 
@@ -1147,32 +4734,43 @@ class GameManager:
                 tool = self.tool_agent.tools[tool_id]
                 price = tools_for_sale[tool_id]["price"]
 
-                if self._spend_coin(price):
-                    self.city_agent.tool_inventory[tool_id] = self.city_agent.tool_inventory.get(tool_id, 0) + 1
-                    print(f"Purchased {tool['name']}! You now own {self.city_agent.tool_inventory[tool_id]}.")
+                if self._report_spend(self.buy_tool(tool_id), price):
+                    self._print(f"Purchased {tool['name']}! You now own {self.city_agent.tool_inventory[tool_id]}.")
             else:
-                print("Invalid selection.")
+                self._print("Invalid selection.")
         except ValueError:
-            print("Invalid input.")
+            self._print("Invalid input.")
 
+    _buy_tools = blocking(_buy_tools_steps)
 
 
-    def _spend_coin(self, amount):
+    def buy_tool(self, tool_id):
+        """Buys one of a market tool. Returns False if the treasury is short."""
+        if not self.spend_coin(self.game_data["market"]["tools"][tool_id]["price"]):
+            return False
+        self.city_agent.tool_inventory[tool_id] = self.city_agent.tool_inventory.get(tool_id, 0) + 1
+        return True
+
+    def spend_coin(self, amount):
         """Try to spend treasury coin. Returns True if successful."""
         if self.city_agent.treasury < amount:
-            print("Not enough coin!")
             return False
-
         self.city_agent.treasury -= amount
-        print(f"Spent {amount} coin. Treasury now: {self.city_agent.treasury}")
         return True
 
+    def _report_spend(self, spent, amount):
+        if spent:
+            self._print(f"Spent {amount} coin. Treasury now: {self.city_agent.treasury}")
+        else:
+            self._print("Not enough coin!")
+        return spent
+
 
 
 
-    def show_faction_status(self):
+    def show_faction_status_steps(self):
         """Displays current standings with Brasshaven factions."""
-        print("\n--- Faction Status ---")
+        self._print("\n--- Faction Status ---")
         for fid, faction in self.city_agent.factions.items():
             standing = faction.get('standing', 0)
             name = faction.get('name', fid)
@@ -1181,14 +4779,14 @@ class GameManager:
             elif standing > 0: rep = "Friendly"
             elif standing < 0: rep = "Unfriendly"
             else: rep = "Neutral"
-            print(f"{name}: Standing {standing} ({rep})")
-        input("\nPress Enter to return to the main menu...")
+            self._print(f"{name}: Standing {standing} ({rep})")
+        yield Prompt.ask('faction_status', "\nPress Enter to return to the main menu...")
+
+    show_faction_status = blocking(show_faction_status_steps)
 
     def enable_cheat_mode(self):
-        print("[CHEAT MODE ENABLED] Story progression testing active.")
-        for member in self.crew_agent.crew_members.values():
-            for skill in member['skills']:
-                member['skills'][skill] = 10
+        self._print("[CHEAT MODE ENABLED] Story progression testing active.")
+        self.crew_agent.set_all_skills(10)
         self.city_agent.factions = {
             "guilds": {"standing": 0, "name": "The Guilds"},
             "nobles": {"standing": 0, "name": "The Nobles"},
@@ -1197,28 +4795,25 @@ class GameManager:
         self.city_agent.notoriety = 0
 
     
-    def plan_and_execute_heist(self):
-        print("\nAvailable Heists:")
-        available_heists = {
-            h_id: h for h_id, h in self.heist_agent.heists.items()
-            if h_id in self.city_agent.unlocked_heists
-        }
+    def plan_and_execute_heist_steps(self):
+        self._print("\nAvailable Heists:")
+        available_heists = self.available_heists()
         if not available_heists:
-            print("No heists are currently available.")
+            self._print("No heists are currently available.")
             return
 
         for heist_id, heist in available_heists.items():
-            print(f"  [{heist_id}] {heist['name']} (Difficulty: {heist['difficulty']})")
+            self._print(f"  [{heist_id}] {heist['name']} (Difficulty: {heist['difficulty']})")
 
-        chosen_heist_id = input("Choose a heist to attempt (or 'back' to return): ").strip()
+        chosen_heist_id = (yield Prompt.ask('heist_choice', "Choose a heist to attempt (or 'back' to return): ")).strip()
         if chosen_heist_id == 'back': return
         if chosen_heist_id not in available_heists:
-            print("Invalid heist ID. Returning to Main Menu.")
+            self._print("Invalid heist ID. Returning to Main Menu.")
             return
 
-        heist = self.heist_agent.heists[chosen_heist_id]
+        heist = available_heists[chosen_heist_id]
 
-        print("\nAvailable Crew Members:")
+        self._print("\nAvailable Crew Members:")
         active_crew = {cid: c for cid, c in self.crew_agent.crew_members.items() if c.get('status', 'active') == 'active'}
         xp_thresholds = self.game_data['progression']['xp_thresholds']
         for crew_id, crew in self.crew_agent.crew_members.items():
@@ -1228,77 +4823,475 @@ class GameManager:
             status = crew.get('status', 'active')
 
             if status != 'active':
-                print(f"  [X] {crew['name']} ({crew['role']}) - {status.upper()}")
+                self._print(f"  [X] {crew['name']} ({crew['role']}) - {status.upper()}")
             else:
-                print(f"  [{crew_id}] {crew['name']} ({crew['role']}) - Lvl: {level} ({xp}/{next_lvl_xp} XP)")
+                self._print(f"  [{crew_id}] {crew['name']} ({crew['role']}) - Lvl: {level} ({xp}/{next_lvl_xp} XP)")
 
-        chosen_crew_ids_str = input(f"Select up to {heist.get('max_party_size', 3)} crew (e.g., rogue_1,mage_1): ")
+        suggestions = self.heist_agent.suggest_parties(chosen_heist_id)
+        if suggestions:
+            self._print("\nSuggested Crews (without abilities):")
+            for suggestion in suggestions:
+                tools = ", ".join(f"{cid}: {tid}" for cid, tid in suggestion['tool_assignments'].items()) or "no tools"
+                self._print(f"  {','.join(suggestion['crew_ids'])} ({tools}) - {suggestion['success']:.1%}")
+
+        chosen_crew_ids_str = yield Prompt.ask('crew_choice', f"Select up to {heist.get('max_party_size', 3)} crew (e.g., rogue_1,mage_1): ")
         chosen_crew_ids = [c.strip() for c in chosen_crew_ids_str.split(',') if c.strip()]
 
         # --- Validation ---
         if not chosen_crew_ids:
-            print("No crew selected. Aborting.")
+            self._print("No crew selected. Aborting.")
             return
         if any(c_id not in active_crew for c_id in chosen_crew_ids):
-            print("An invalid or unavailable crew member was selected. Aborting.")
+            self._print("An invalid or unavailable crew member was selected. Aborting.")
             return
         if len(chosen_crew_ids) > heist.get("max_party_size", 3):
-            print(f"Too many crew members selected. This heist allows a maximum of {heist.get('max_party_size', 3)}.")
+            self._print(f"Too many crew members selected. This heist allows a maximum of {heist.get('max_party_size', 3)}.")
             return
 
         crew_roles = [self.crew_agent.get_crew_member(c_id)['role'] for c_id in chosen_crew_ids]
         required_roles = heist.get("required_roles", [])
         if not all(role in crew_roles for role in required_roles):
-            print(f"This heist requires: {', '.join(required_roles)}. You must include them.")
+            self._print(f"This heist requires: {', '.join(required_roles)}. You must include them.")
             return
         
         tool_assignments = {}
         if self.city_agent.tool_inventory:
-            print("\n--- Assign Tools ---")
+            self._print("\n--- Assign Tools ---")
             available_tools = list(self.city_agent.tool_inventory.keys())
             for crew_id in chosen_crew_ids:
                 member = self.crew_agent.get_crew_member(crew_id)
-                print(f"\nAssign tool to {member['name']} ({member['role']}):")
-                print("  [0] None")
+                self._print(f"\nAssign tool to {member['name']} ({member['role']}):")
+                self._print("  [0] None")
                 for i, tool_id in enumerate(available_tools, 1):
                     tool = self.tool_agent.tools[tool_id]
                     if member['role'] in tool['usable_by']:
-                        print(f"  [{i}] {tool['name']} (Owned: {self.city_agent.tool_inventory[tool_id]})")
+                        self._print(f"  [{i}] {tool['name']} (Owned: {self.city_agent.tool_inventory[tool_id]})")
 
-                choice = input(f"Choose tool (number): ").strip()
+                choice = (yield Prompt.ask('tool_choice', f"Choose tool (number): ")).strip()
                 try:
                     idx = int(choice)
                     if idx == 0: continue
                     tool_id_to_assign = available_tools[idx - 1]
                     if self.tool_agent.validate_tool_usage(tool_id_to_assign, member['role']):
                          tool_assignments[crew_id] = tool_id_to_assign
-                         print(f"Assigned {self.tool_agent.tools[tool_id_to_assign]['name']}.")
+                         self._print(f"Assigned {self.tool_agent.tools[tool_id_to_assign]['name']}.")
                     else:
-                         print("Invalid tool for this crew member's role.")
+                         self._print("Invalid tool for this crew member's role.")
                 except (ValueError, IndexError):
-                    print("Invalid choice. No tool assigned.")
+                    self._print("Invalid choice. No tool assigned.")
+
+        self._print("\n--- Heist Preparation Complete ---")
+        self._print(f"Heist: {heist['name']}")
+        self._print(f"Crew: {[self.crew_agent.get_crew_member(cid)['name'] for cid in chosen_crew_ids]}")
+        self._print(f"Tools: {[self.tool_agent.tools[tid]['name'] for tid in tool_assignments.values()] or 'None'}")
 
-        print("\n--- Heist Preparation Complete ---")
-        print(f"Heist: {heist['name']}")
-        print(f"Crew: {[self.crew_agent.get_crew_member(cid)['name'] for cid in chosen_crew_ids]}")
-        print(f"Tools: {[self.tool_agent.tools[tid]['name'] for tid in tool_assignments.values()] or 'None'}")
+        odds = self.heist_agent.estimate_heist_odds(chosen_heist_id, chosen_crew_ids, tool_assignments)
+        self._print(f"Estimated Success Chance: {odds['success']:.1%} (without abilities)")
+        if odds['getaway']:
+            self._print(f"Clean Getaway Chance: {odds['getaway'][CrewAgent.SUCCESS]:.1%}")
 
-        if input("Proceed with the heist? (yes/no): ").strip().lower() != 'yes':
-            print("Heist canceled.")
+        if (yield Prompt.ask('proceed', "Proceed with the heist? (yes/no): ")).strip().lower() != 'yes':
+            self._print("Heist canceled.")
             return
         
-        leveled_up_crew = self.heist_agent.run_heist(chosen_heist_id, chosen_crew_ids, tool_assignments)
-        
-        self.city_agent.heists_completed += 1
+        leveled_up_crew = yield from self.execute_heist_steps(chosen_heist_id, chosen_crew_ids, tool_assignments)
         
         if leveled_up_crew:
-            self._handle_level_ups(leveled_up_crew)
+            yield from self._handle_level_ups_steps(leveled_up_crew)
+
+    plan_and_execute_heist = blocking(plan_and_execute_heist_steps)
 
+    def available_heists(self):
+        """Unlocked hand-written heists, then the procedural jobs on offer (generated as they are listed)."""
+        heists = {
+            h_id: h for h_id, h in self.heist_agent.heists.items()
+            if h_id in self.city_agent.unlocked_heists
+        }
+        procedural = self.heist_agent.procedural
+        if procedural:
+            for heist_id in procedural.offers(self.city_agent.heists_completed):
+                heists[heist_id] = procedural.get(heist_id)
+        return heists
+
+    def execute_heist_steps(self, heist_id, crew_ids, tool_assignments):
+        """Runs a heist as a campaign turn. Returns the ids of crew who levelled up."""
+        leveled_up_crew = yield from self.heist_agent.run_heist_steps(heist_id, crew_ids, tool_assignments)
+        self.city_agent.heists_completed += 1
+        return leveled_up_crew
+
+    execute_heist = blocking(execute_heist_steps)
+
+
+# ===============================
+# Session Host
+# ===============================
+class SessionDecisions(DecisionProvider):
+    """
+    Decisions typed by a player over a network connection. Prompts are written to the
+    player's stream and their answers awaited, so run_steps_async can serve many players
+    from one event loop and a slow player only holds up their own game. Answers are read
+    the way ConsoleDecisions reads them. A closed connection, or no answer within
+    idle_timeout seconds, ends the session with ConnectionResetError or asyncio.TimeoutError.
+    """
+    def __init__(self, reader, writer, idle_timeout=None):
+        self.reader = reader
+        self.writer = writer
+        self.idle_timeout = idle_timeout
+
+    async def ask(self, decision_id, prompt, context=None):
+        self.writer.write(prompt.encode('utf-8'))
+        await self.writer.drain()
+        line = await asyncio.wait_for(self.reader.readline(), self.idle_timeout)
+        if not line:
+            raise ConnectionResetError("player disconnected")
+        return line.decode('utf-8', 'replace').rstrip('\r\n')
+
+    async def confirm(self, ability_id, prompt, context=None):
+        return (await self.ask(ability_id, prompt, context)).upper() == 'Y'
+
+    async def choose(self, decision_id, prompt, options, context=None):
+        return _parse_choice(await self.ask(decision_id, prompt, context), options, context)
+
+
+class StreamSink:
+    """
+    Sends a session's game text to its player: an event sink, and a stand-in for print
+    (GameManager's output). Writes are buffered until the session next waits on the player.
+    """
+    def __init__(self, writer):
+        self.writer = writer
+
+    def handle(self, kind, fields):
+        self.writer.write((render_event(kind, fields) + "\n").encode('utf-8'))
+
+    def __call__(self, *args, sep=" ", end="\n", **kwargs):
+        self.writer.write((sep.join(map(str, args)) + end).encode('utf-8'))
+
+
+class SessionHost:
+    """
+    Serves the interactive game to many players at once from one asyncio event loop, e.g.
+    over local TCP with SessionHost().serve(port=8765) and any line-based client (nc, telnet).
+    Each connection gets its own GameManager, sharing the compiled game data, and plays
+    start_game_steps under run_steps_async. Games are saved to the player's crew name as a
+    slot of a slotted store, so a returning player can load theirs.
+    """
+    def __init__(self, compiled_data=None, save_format="sqlite", seed=None, idle_timeout=None):
+        store_class = SAVE_STORES[save_format]
+        if not getattr(store_class, 'SLOTTED', False):
+            raise ValueError(f"save format '{save_format}' keeps one game; sessions need a slotted store")
+        self.compiled = compiled_data or load_game_data('game_data.json')
+        self.save_format = save_format
+        self.seed = seed
+        self.idle_timeout = idle_timeout
+        self.sessions = {}  # shape: { crew name: GameManager } for the games being played
+        self._served = 0
+
+    async def serve_session(self, reader, writer):
+        """Plays one game over a connection; the handler for asyncio.start_server."""
+        self._served += 1
+        number = self._served
+        decisions = SessionDecisions(reader, writer, self.idle_timeout)
+        output = StreamSink(writer)
+        name = None
+        try:
+            while name is None:
+                name = (await decisions.ask('crew_name', "Name your crew: ")).strip() or f"crew-{number}"
+                if name in self.sessions:
+                    output(f"The {name} crew is already out on the streets.")
+                    name = None
+            seed = None if self.seed is None else (self.seed, number)
+            game = GameManager(decisions, EventBus(output), seed=seed, save_format=self.save_format,
+                               save_slot=name, compiled_data=self.compiled, output=output)
+            self.sessions[name] = game
+            await run_steps_async(game.start_game_steps(), decisions)
+            await writer.drain()
+        except (ConnectionError, asyncio.TimeoutError):
+            pass
+        finally:
+            self.sessions.pop(name, None)
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def start(self, host="127.0.0.1", port=8765):
+        """Starts listening and returns the asyncio server; port 0 picks a free port."""
+        return await asyncio.start_server(self.serve_session, host, port)
+
+    async def serve(self, host="127.0.0.1", port=8765):
+        """Serves sessions until cancelled."""
+        server = await self.start(host, port)
+        async with server:
+            await server.serve_forever()
+
+
+# ===============================
+# Profiling
+# ===============================
+# Set to a path (ending in .json for JSON, anything else for pstats) to profile a whole run
+PROFILE_ENV = "CLOCKWORK_PROFILE"
+
+
+class PhaseProfiler:
+    """
+    Call counts and wall-clock time per named phase of the engine. Time is kept both
+    inclusive ('total', as pstats cumtime) and exclusive of nested phases ('own', as
+    tottime), along with which phase each call came from. Nothing is timed until
+    enable_profiling() wraps the phase methods, and disable_profiling() puts them back.
+
+    Step generators (run_heist_steps, the menus, ...) are timed only while they run, so
+    the time a player takes to answer shows under prompts.* rather than the phase that asked.
+    """
+
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.stats = {}    # shape: { phase: [calls, own seconds, total seconds, active depth] }
+        self.callers = {}  # shape: { (phase, calling phase or None): [calls, own seconds, total seconds] }
+        self.origins = {}  # shape: { phase: (file, line) of the first function timed under it }
+        self._stack = []   # one [phase, seconds spent in nested phases] per active call
+
+    def reset(self):
+        self.stats.clear()
+        self.callers.clear()
+
+    def wrap(self, phase, func):
+        """func, timed under phase."""
+        code = getattr(func, '__code__', None)
+        self.origins.setdefault(phase, (code.co_filename, code.co_firstlineno) if code else ("~", 0))
+        enter, leave = self._enter, self._leave
+
+        if inspect.isgeneratorfunction(func):
+            @functools.wraps(func)
+            def timed(*args, **kwargs):
+                steps = func(*args, **kwargs)
+                resume, answer, first = steps.send, None, True
+                while True:
+                    timing = enter(phase)
+                    try:
+                        prompt = resume(answer)
+                    except StopIteration as done:
+                        return done.value
+                    finally:
+                        leave(timing, first)
+                        first = False
+                    try:
+                        resume, answer = steps.send, (yield prompt)
+                    except GeneratorExit:
+                        steps.close()
+                        raise
+                    except BaseException as error:
+                        resume, answer = steps.throw, error
+        else:
+            @functools.wraps(func)
+            def timed(*args, **kwargs):
+                timing = enter(phase)
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    leave(timing, True)
+        timed.__profiled__ = func
+        return timed
+
+    def _enter(self, phase):
+        stats = self.stats.get(phase)
+        if stats is None:
+            stats = self.stats[phase] = [0, 0.0, 0.0, 0]
+        stats[3] += 1
+        frame = [phase, 0.0]
+        self._stack.append(frame)
+        return stats, frame, self.clock()
+
+    def _leave(self, timing, first):
+        """Books one timed run; first is False for the later runs of a resumed step generator."""
+        stats, frame, started = timing
+        elapsed = self.clock() - started
+        stack = self._stack
+        stack.pop()
+        own = elapsed - frame[1]
+        stats[1] += own
+        stats[3] -= 1
+        if not stats[3]:
+            stats[2] += elapsed  # a recursive call's time is already in the outer one
+        parent = stack[-1] if stack else None
+        if parent is not None:
+            parent[1] += elapsed
+        edge = self.callers.setdefault((frame[0], parent[0] if parent else None), [0, 0.0, 0.0])
+        if first:
+            stats[0] += 1
+            edge[0] += 1
+        edge[1] += own
+        edge[2] += elapsed
+
+    def report(self):
+        """{ phase: {"calls", "own_seconds", "total_seconds", "callers": { phase: calls }} }, slowest first."""
+        phases = sorted(self.stats, key=lambda phase: -self.stats[phase][2])
+        return {phase: {"calls": self.stats[phase][0],
+                        "own_seconds": self.stats[phase][1],
+                        "total_seconds": self.stats[phase][2],
+                        "callers": {caller: edge[0] for (callee, caller), edge in self.callers.items()
+                                    if callee == phase and caller is not None}}
+                for phase in phases}
+
+    def pstats_dict(self):
+        """The stats in the layout pstats.Stats loads, one 'function' per phase."""
+        def key(phase):
+            filename, line = self.origins.get(phase, ("~", 0))
+            return (filename, line, phase)
+
+        stats = {}
+        for phase, (calls, own, total, _) in self.stats.items():
+            callers = {key(caller): (edge[0], edge[0], edge[1], edge[2])
+                       for (callee, caller), edge in self.callers.items() if callee == phase and caller is not None}
+            stats[key(phase)] = (calls, calls, own, total, callers)
+        return stats
+
+    def dump(self, path):
+        """Writes the stats to path: JSON if it ends in .json, otherwise a pstats file."""
+        if path.endswith('.json'):
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump({"phases": self.report()}, f, indent=2)
+        else:
+            with open(path, 'wb') as f:
+                marshal.dump(self.pstats_dict(), f)
+
+
+def _profiled_targets():
+    """(class, method name, phase) for every method enable_profiling() times."""
+    targets = [
+        (HeistAgent, "run_heist_steps", "heist"),
+        (HeistAgent, "_generate_events", "heist.event_generation"),
+        (HeistPlan, "best_member", "heist.best_crew"),
+        (HeistPlan, "tool_action", "heist.tool_resolution"),
+        (CrewAgent, "perform_skill_check", "heist.checks"),
+        (HeistAgent, "_apply_effects", "heist.effects"),
+        (HeistAgent, "_run_getaway", "heist.getaway"),
+        (ArcManager, "check_arcs_steps", "arcs.check"),
+        (ArcManager, "_apply_effects", "arcs.effects"),
+    ]
+    providers, pending = [], [DecisionProvider]
+    while pending:
+        cls = pending.pop()
+        providers.append(cls)
+        pending.extend(cls.__subclasses__())
+    for cls in providers:
+        for name in ("confirm", "choose", "ask"):
+            if name in vars(cls):
+                targets.append((cls, name, f"prompts.{name}"))
+    for name in ("plan_and_execute_heist", "show_crew_roster", "show_market_menu", "show_faction_status",
+                 "save_game", "load_game", "_handle_level_ups", "_fence_loot", "_heal_injured_crew",
+                 "_buy_tools", "_bribe_for_release", "_attempt_rescue_heist"):
+        steps = f"{name}_steps"
+        targets.append((GameManager, steps if steps in vars(GameManager) else name, f"menu.{name}"))
+    return targets
+
+
+_PROFILER = None
+_PROFILED_ORIGINALS = []  # entries: (class, method name, original function)
+
+
+def enable_profiling(profiler=None):
+    """
+    Starts timing the engine's phases into profiler (a new PhaseProfiler by default) and
+    returns it. Until this is called the phases run unwrapped, so profiling costs nothing.
+    """
+    global _PROFILER
+    if _PROFILER is not None:
+        disable_profiling()
+    _PROFILER = profiler or PhaseProfiler()
+    for cls, name, phase in _profiled_targets():
+        original = vars(cls)[name]
+        _PROFILED_ORIGINALS.append((cls, name, original))
+        setattr(cls, name, _PROFILER.wrap(phase, original))
+    return _PROFILER
+
+
+def disable_profiling():
+    """Restores the unwrapped phases and returns the profiler that was running, if any."""
+    global _PROFILER
+    while _PROFILED_ORIGINALS:
+        cls, name, original = _PROFILED_ORIGINALS.pop()
+        setattr(cls, name, original)
+    profiler, _PROFILER = _PROFILER, None
+    return profiler
+
+
+def profile_to(path):
+    """Profiles the rest of this process and writes the stats to path when it exits."""
+    profiler = enable_profiling()
+    atexit.register(profiler.dump, path)
+    return profiler
+
+
+# Only the process that was started profiles; spawned worker processes import this module too
+if os.environ.get(PROFILE_ENV) and multiprocessing.parent_process() is None:
+    profile_to(os.environ[PROFILE_ENV])
 
 
 # ===============================
 # Entry Point
 # ===============================
+def _parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="The Clockwork Heist")
+    parser.add_argument("--simulate", metavar="HEIST_ID", help="run a heist headlessly and report outcome statistics")
+    parser.add_argument("--crew", default="", help="comma-separated crew ids, e.g. rogue_1,mage_1")
+    parser.add_argument("--tools", default="", help="comma-separated crew=tool pairs, e.g. rogue_1=tool_gadget")
+    parser.add_argument("--campaign", metavar="STRATEGY", choices=sorted(CAMPAIGN_STRATEGIES),
+                        help="play whole campaigns headlessly with a scripted strategy and report the outcomes")
+    parser.add_argument("--runs", type=int, default=100, help="campaigns to play with --campaign")
+    parser.add_argument("--turns", type=int, default=30, help="turn limit per campaign with --campaign")
+    parser.add_argument("--trials", type=int, default=10000)
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=None, help="seed the dice, for a reproducible game or simulation")
+    parser.add_argument("--save-format", choices=sorted(SAVE_STORES), default="json",
+                        help="json rewrites the whole save; journal appends only what changed; "
+                             "sqlite keeps named slots in save_game.db")
+    parser.add_argument("--slot", default="default", help="save slot name for --save-format sqlite")
+    parser.add_argument("--policy", choices=["never", "yes", "greedy"], default=None,
+                        help="how ability prompts are answered during simulation "
+                             "(default: never for --simulate, greedy for --campaign)")
+    parser.add_argument("--serve", metavar="PORT", type=int,
+                        help="host games for many players over TCP on PORT, one per connection; each "
+                             "crew is saved as a slot in save_game.db")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on with --serve")
+    parser.add_argument("--idle-timeout", type=float, default=None,
+                        help="seconds a --serve player may leave a prompt unanswered before being dropped")
+    parser.add_argument("--metrics", metavar="PATH",
+                        help="write gameplay and engine metrics to PATH in Prometheus text format while "
+                             "playing or running --campaign")
+    parser.add_argument("--metrics-interval", type=float, default=15.0, help="seconds between --metrics writes")
+    parser.add_argument("--profile", metavar="PATH",
+                        help=f"time the engine's phases and write them to PATH on exit (.json, or pstats "
+                             f"otherwise); worker processes are not profiled. Also set by ${PROFILE_ENV}")
+    return parser.parse_args(argv)
+
+
 if __name__ == "__main__":
-    game = GameManager()
-    game.start_game()
\ No newline at end of file
+    args = _parse_args()
+    if args.profile and not os.environ.get(PROFILE_ENV):
+        profile_to(args.profile)
+    if args.simulate:
+        data = load_game_data('game_data.json')['data']
+        crew = [c.strip() for c in args.crew.split(',') if c.strip()]
+        tools = dict(pair.split('=', 1) for pair in args.tools.split(',') if '=' in pair)
+        print_simulation_report(simulate_heist(data, args.simulate, crew, tools, trials=args.trials,
+                                               processes=args.processes, seed=args.seed,
+                                               decisions=DECISION_PROVIDERS[args.policy or "never"]()))
+    elif args.serve is not None:
+        print(f"Serving The Clockwork Heist on {args.host}:{args.serve}...")
+        try:
+            asyncio.run(SessionHost(seed=args.seed, idle_timeout=args.idle_timeout).serve(args.host, args.serve))
+        except KeyboardInterrupt:
+            pass
+    elif args.campaign:
+        metrics = PrometheusSink(args.metrics, args.metrics_interval) if args.metrics else None
+        print_campaign_report(simulate_campaign(args.campaign, runs=args.runs, turns=args.turns,
+                                                processes=args.processes, seed=args.seed,
+                                                policy=args.policy or "greedy", metrics=metrics))
+    else:
+        game = GameManager(seed=args.seed, save_format=args.save_format, save_slot=args.slot)
+        if args.metrics:
+            metrics = game.events.add_sink(PrometheusSink(args.metrics, args.metrics_interval, game.city_agent))
+            atexit.register(metrics.write)
+        game.start_game()
\ No newline at end of file
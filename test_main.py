@@ -89,6 +89,81 @@ class TestGameAgents(unittest.TestCase):
         result = self.crew_agent.perform_skill_check('rogue_1', 'stealth', 10)
         self.assertEqual(result, main.CrewAgent.FAILURE)
 
+    def test_skill_check_probabilities_match_every_roll(self):
+        """The analytic distribution agrees with perform_skill_check over all d10 rolls."""
+        temp = {'rogue_1': {'stealth': -1}}
+        for difficulty in range(0, 20):
+            for margin in (0, 1, 3):
+                counts = {main.CrewAgent.SUCCESS: 0, main.CrewAgent.PARTIAL: 0, main.CrewAgent.FAILURE: 0}
+                with patch('builtins.print'):
+                    for roll in range(1, 11):
+                        counts[self.crew_agent.perform_skill_check('rogue_1', 'stealth', difficulty, margin, roll=roll,
+                                                                   tool_bonus=3, temporary_effects=temp)] += 1
+                probs = self.crew_agent.skill_check_probabilities('rogue_1', 'stealth', difficulty, margin, tool_bonus=2,
+                                                                  temporary_effects=temp, event_bonus=1, exact=True)
+                self.assertEqual({k: v * 10 for k, v in probs.items()}, counts)
+
+    def test_skill_check_distribution_array(self):
+        """The vectorized variant matches the scalar calculator element by element."""
+        skills, bonuses, difficulties = [0, 3, 5, 9], [0, 2, 1, 4], [3, 8, 15, 2]
+        arrays = main.skill_check_distribution_array(skills, bonuses, difficulties)
+        for i in range(len(skills)):
+            expected = main.skill_check_distribution(skills[i] + bonuses[i], difficulties[i])
+            for outcome, p in expected.items():
+                self.assertAlmostEqual(float(arrays[outcome][i]), p)
+
+    def test_crew_member_records_behave_like_dicts(self):
+        """Records compare, print and save like the member dicts, and forks copy skill rows on write."""
+        source = self.game_data['crew_members'][0]
+        member = self.crew_agent.get_crew_member('rogue_1')
+        self.assertEqual(member, source)
+        self.assertEqual(list(member), list(source))
+        self.assertEqual(repr(member['skills']), repr(source['skills']))
+        self.assertEqual(json.loads(json.dumps(member.to_dict())), source)
+        self.assertEqual(member.get('status', 'active'), 'active')
+
+        child = self.crew_agent.fork()
+        edited = child.edit_member('rogue_1')
+        edited['skills']['stealth'] = 9
+        edited['skills']['acrobatics'] = 3  # a new skill widens the shared matrix
+        edited['upgrades'].append('rogue_shadowstep')
+        self.assertEqual(member['skills'], source['skills'])
+        self.assertEqual(member['upgrades'], [])
+        self.assertEqual(child.get_crew_member('rogue_1')['skills'],
+                         {"stealth": 9, "lockpicking": 4, "combat": 2, "magic": 0, "acrobatics": 3})
+        self.assertNotIn('acrobatics', member['skills'])
+        self.assertEqual(self.crew_agent.get_crew_member('mage_1').skill('magic'), 5)
+
+        import pickle
+        self.assertEqual(pickle.loads(pickle.dumps(edited)), edited.to_dict())
+
+    def test_vectorized_crew_selection_matches_python(self):
+        """NumPy best-member, shortlist and cheat-mode paths match the plain Python loops on a large roster."""
+        import random
+        rng = random.Random(4)
+        roster = [{"id": f"m{i}", "name": f"M{i}", "role": rng.choice(["Rogue", "Mage", "Artificer"]),
+                   "skills": {skill: rng.randint(0, 7) for skill in rng.sample(["stealth", "lockpicking", "combat", "magic"], 3)},
+                   "xp": 0, "level": 1, "upgrades": []} for i in range(60)]
+        crew_agent = main.CrewAgent(roster, self.game_data['progression'], main.EventBus())
+        heist_agent = main.HeistAgent(self.game_data['heists'], [], [], crew_agent, self.tool_agent, self.city_agent,
+                                      events=main.EventBus())
+        self.city_agent.tool_inventory = {'tool_gadget': 1, 'tool_lockpick': 1}
+        crew_ids = [f"m{i}" for i in range(0, 60, 2)]
+        temp = {f"m{i}": {"magic": rng.randint(-3, 3)} for i in range(0, 60, 3)}
+
+        vectorized = [crew_agent.best_member(crew_ids, skill, temp) for skill in ("stealth", "magic", "combat")]
+        parties = heist_agent.suggest_parties('heist_1', top_k=3)
+        with patch('main.np', None):
+            self.assertEqual([crew_agent.best_member(crew_ids, skill, temp) for skill in ("stealth", "magic", "combat")],
+                             vectorized)
+            self.assertEqual(heist_agent.suggest_parties('heist_1', top_k=3), parties)
+            python_agent = crew_agent.fork()
+            python_agent.set_all_skills(10)
+        crew_agent.set_all_skills(10)
+        self.assertEqual([m.to_dict() for m in crew_agent.crew_members.values()],
+                         [m.to_dict() for m in python_agent.crew_members.values()])
+        self.assertEqual(crew_agent.get_crew_member('m0')['skills'], dict.fromkeys(roster[0]['skills'], 10))
+
     # --- ToolAgent Tests (Updated for Phase 2) ---
     def test_get_tool_effect_bonus(self):
         """Test getting a structured bonus effect."""
@@ -120,6 +195,46 @@ class TestGameAgents(unittest.TestCase):
         self.assertEqual(len(self.city_agent.loot), initial_loot_count + 1)
         self.assertIn(new_loot, self.city_agent.loot)
 
+    def test_loot_ledger_matches_list_semantics(self):
+        """Test that the loot ledger behaves like a list while keeping its aggregates current."""
+        items = [{"item": "Ring", "value": 50}, {"item": "Idol", "value": 300},
+                 {"item": "Ring", "value": 50}, {"item": "Gem", "value": 120}]
+        reference = [dict(item) for item in items]
+        self.city_agent.loot = items
+        self.assertIsInstance(self.city_agent.loot, main.LootLedger)
+        ledger = self.city_agent.loot
+        fork = self.city_agent.fork()
+
+        ledger.remove({"item": "Ring", "value": 50})
+        reference.remove({"item": "Ring", "value": 50})
+        self.assertEqual(ledger.pop(), reference.pop())
+        self.assertEqual(ledger, reference)
+        self.assertEqual(ledger.total_value, 350)
+        self.assertEqual(ledger.item_counts, {"Idol": 1, "Ring": 1})
+        self.assertEqual(ledger.names(), ["Idol", "Ring"])
+        self.assertEqual(ledger.best(1), [{"item": "Idol", "value": 300}])
+        del ledger[:1]
+        self.assertEqual(ledger, [{"item": "Ring", "value": 50}])
+
+        self.assertEqual(fork.loot, items)
+        self.assertEqual(fork.loot.total_value, 520)
+        self.assertEqual([item["item"] for item in fork.loot.best(3)], ["Idol", "Gem", "Ring"])
+
+    def test_fence_best_sells_most_valuable_loot(self):
+        """Test that fencing the best N items pays for exactly those items."""
+        game = main.GameManager(events=main.EventBus())
+        game.city_agent.loot = [{"item": "Ring", "value": 50}, {"item": "Idol", "value": 300},
+                                {"item": "Gem", "value": 120}]
+        multiplier, _ = game.fencing_multiplier()
+        treasury = game.city_agent.treasury
+        earned = game.fence_best(2)
+        self.assertEqual(earned, int(300 * multiplier) + int(120 * multiplier))
+        self.assertEqual(game.city_agent.treasury, treasury + earned)
+        self.assertEqual(game.city_agent.loot, [{"item": "Ring", "value": 50}])
+        self.assertEqual(game.fence_items(), int(50 * multiplier))
+        self.assertEqual(len(game.city_agent.loot), 0)
+        self.assertEqual(game.city_agent.loot.total_value, 0)
+
     # --- HeistAgent Integration Tests (Updated for Phase 2) ---
     @patch('builtins.input', return_value='N') # Mock user input for abilities
     @patch('main.CrewAgent.perform_skill_check', return_value=main.CrewAgent.SUCCESS)
@@ -163,6 +278,503 @@ class TestGameAgents(unittest.TestCase):
         self.assertEqual(len(self.city_agent.loot), initial_loot_count)
 
 
+    def test_estimate_heist_odds_exact(self):
+        """Odds multiply the per-event pass chances and spend tool charges once."""
+        heist = self.game_data['heists'][0]
+        heist['events'][0]['difficulty'] = 12   # rogue stealth 5 (+2 gadget): 7 of 10 rolls pass
+        heist['events'][1]['difficulty'] = 10   # mage magic 5: 7 of 10 rolls pass
+        heist_agent = main.HeistAgent(self.game_data['heists'], [], [], self.crew_agent, self.tool_agent, self.city_agent)
+
+        odds = heist_agent.estimate_heist_odds('heist_1', ['rogue_1', 'mage_1'], {'rogue_1': 'tool_gadget'})
+        self.assertAlmostEqual(odds['success'], 0.7 * 0.7)
+
+        heist['events'].append(dict(heist['events'][0], id='event_guard_2'))
+        odds = heist_agent.estimate_heist_odds('heist_1', ['rogue_1', 'mage_1'], {'rogue_1': 'tool_gadget'})
+        self.assertAlmostEqual(odds['success'], 0.7 * 0.7 * 0.5)  # one charge per heist
+
+    def test_estimate_heist_odds_requirements_and_random_events(self):
+        """Requirement gates fail outright; random events are averaged over every insertion point."""
+        heist = self.game_data['heists'][0]
+        heist_agent = main.HeistAgent(self.game_data['heists'], [], [], self.crew_agent, self.tool_agent, self.city_agent)
+        heist['events'][1]['requirements'] = {'magic': 6}
+        self.assertEqual(heist_agent.estimate_heist_odds('heist_1', ['rogue_1', 'mage_1'])['success'], 0)
+
+        del heist['events'][1]['requirements']
+        random_events = [{"id": "rand_impossible", "description": "A wall of fire", "check": "magic", "difficulty": 99}]
+        heist_agent = main.HeistAgent(self.game_data['heists'], random_events, [], self.crew_agent, self.tool_agent, self.city_agent)
+        odds = heist_agent.estimate_heist_odds('heist_1', ['rogue_1', 'mage_1'])
+        self.assertAlmostEqual(odds['success'], 0.75)
+
+    def test_compile_plan_best_member_table(self):
+        """The plan picks the first highest-skilled member, honouring temporary effects."""
+        plan = self.heist_agent.compile_plan('heist_1', ['mage_1', 'rogue_1', 'ghost_1'])
+        self.assertEqual(plan.best_member('stealth'), ('rogue_1', 5))
+        self.assertEqual(plan.best_member('combat'), ('mage_1', 3))
+        self.assertEqual(plan.best_member('stealth', {'rogue_1': {'stealth': -4}}), ('mage_1', 2))
+        self.assertIsNone(plan.member('ghost_1'))
+        self.assertIsNone(self.heist_agent.compile_plan('no_such_heist', ['rogue_1']))
+
+    def test_compile_plan_resolves_tool_actions(self):
+        """Tool effects are matched to events once, including hyphenated conditions."""
+        self.tool_agent.tools['tool_disguise'] = {"id": "tool_disguise", "name": "Disguise", "usable_by": ["Rogue"],
+                                                  "effect": {"type": "difficulty_reduction", "condition": "guard-patrol", "value": 2}}
+        guard, ward = self.game_data['heists'][0]['events']
+        plan = self.heist_agent.compile_plan('heist_1', ['rogue_1', 'mage_1'], {'rogue_1': 'tool_disguise', 'mage_1': 'tool_gadget'})
+        self.assertEqual(plan.tool_action(guard, 'rogue_1')[3], main.HeistPlan.TOOL_REDUCTION)
+        self.assertIsNone(plan.tool_action(ward, 'rogue_1')[3])
+        self.assertEqual(plan.tool_action(guard, 'mage_1'), (None, None, {}, None))  # Mages cannot use the gadget
+
+    def test_apply_compiled_effects(self):
+        """Compiled outcome effects target members and loot the same way as the data describes."""
+        heist = self.game_data['heists'][0]
+        heist['events'][0]['failure']['effects'] = [
+            {"type": "temp_debuff", "role": "mage", "skill": "magic", "value": -2},
+            {"type": "lose_loot", "scope": "half"},
+            {"type": "add_notoriety", "value": 2},
+        ]
+        heist_agent = main.HeistAgent(self.game_data['heists'], [], [], self.crew_agent, self.tool_agent, self.city_agent)
+        loot = [{"item": "A"}, {"item": "B"}, {"item": "C"}]
+        heist_agent._apply_effects(heist['events'][0]['failure']['effects'], ['rogue_1', 'mage_1'], 'rogue_1', loot)
+        self.assertEqual(heist_agent.temporary_effects, {'mage_1': {'magic': -2}})
+        self.assertEqual(loot, [{"item": "B"}, {"item": "C"}])
+        self.assertEqual(self.city_agent.notoriety, 2)
+
+    def test_effects_are_validated_at_load(self):
+        """Unknown effect types and missing fields fail when the heist data is loaded."""
+        heist = self.game_data['heists'][0]
+        heist['events'][0]['failure']['effects'] = [{"type": "summon_dragon"}]
+        with self.assertRaises(ValueError):
+            main.HeistAgent(self.game_data['heists'], [], [], self.crew_agent, self.tool_agent, self.city_agent)
+        heist['events'][0]['failure']['effects'] = [{"type": "set_status", "who": "active_member"}]
+        with self.assertRaises(ValueError):
+            main.HeistAgent(self.game_data['heists'], [], [], self.crew_agent, self.tool_agent, self.city_agent)
+
+    def test_suggest_parties_matches_brute_force(self):
+        """The solver's best party scores as well as any party found by exhaustive search."""
+        heist = self.game_data['heists'][0]
+        heist['events'][0]['difficulty'], heist['events'][1]['difficulty'] = 12, 10
+        self.city_agent.tool_inventory = {'tool_gadget': 1, 'tool_lockpick': 1}
+
+        best = 0
+        for party in (['rogue_1'], ['mage_1'], ['rogue_1', 'mage_1']):
+            for tool in (None, 'tool_gadget', 'tool_lockpick'):
+                tools = {'rogue_1': tool} if tool and 'rogue_1' in party else {}
+                best = max(best, self.heist_agent.estimate_heist_odds('heist_1', party, tools)['success'])
+
+        suggestions = self.heist_agent.suggest_parties('heist_1', top_k=2)
+        self.assertAlmostEqual(suggestions[0]['success'], best)
+        self.assertEqual(suggestions[0]['tool_assignments'], {'rogue_1': 'tool_gadget'})
+        self.assertGreaterEqual(suggestions[0]['success'], suggestions[1]['success'])
+        by_value = self.heist_agent.suggest_parties('heist_1', top_k=1, objective='expected_value')
+        self.assertAlmostEqual(by_value[0]['expected_value'], best * 100)
+
+    def test_suggest_parties_exact_on_small_rosters(self):
+        """On a small roster the top party is the best of every legal party and tool loadout."""
+        import itertools
+        crew = [{"id": "sneak", "name": "Sneak", "role": "Rogue", "skills": {"stealth": 8, "magic": 0}},
+                {"id": "hex", "name": "Hex", "role": "Mage", "skills": {"stealth": 0, "magic": 8}},
+                {"id": "vale", "name": "Vale", "role": "Scout", "skills": {"stealth": 5, "magic": 5}},
+                {"id": "brute", "name": "Brute", "role": "Rogue", "skills": {"stealth": 3, "magic": 1}},
+                {"id": "adept", "name": "Adept", "role": "Mage", "skills": {"stealth": 2, "magic": 6}}]
+        crew_agent = main.CrewAgent(crew, self.game_data['progression'])
+        heist_agent = main.HeistAgent(self.game_data['heists'], [], [], crew_agent, self.tool_agent, self.city_agent)
+        heist = self.game_data['heists'][0]
+        heist['events'][0]['difficulty'], heist['events'][1]['difficulty'] = 9, 9
+        self.city_agent.tool_inventory = {'tool_gadget': 1}
+
+        for size in (1, 2, 3):
+            heist['max_party_size'] = size
+            best = 0
+            for k in range(1, size + 1):
+                for party in itertools.combinations(crew_agent.crew_members, k):
+                    for holder in (None,) + party:
+                        tools = {holder: 'tool_gadget'} if holder else {}
+                        best = max(best, heist_agent.estimate_heist_odds('heist_1', party, tools)['success'])
+            suggestions = heist_agent.suggest_parties('heist_1', top_k=3)
+            self.assertAlmostEqual(suggestions[0]['success'], best)
+            if size == 1:
+                # Tops neither check on its own, but covers both
+                self.assertEqual(suggestions[0]['crew_ids'], ['vale'])
+
+    def test_suggest_parties_respects_roles_status_and_inventory(self):
+        """Suggestions only use active members, required roles, owned tools and legal party sizes."""
+        heist = self.game_data['heists'][0]
+        heist['required_roles'] = ['Mage']
+        heist['max_party_size'] = 1
+        self.city_agent.tool_inventory = {'tool_gadget': 0}
+        suggestions = self.heist_agent.suggest_parties('heist_1', top_k=5)
+        self.assertEqual([s['crew_ids'] for s in suggestions], [['mage_1']])
+        self.assertEqual(suggestions[0]['tool_assignments'], {})
+
+        self.crew_agent.get_crew_member('mage_1')['status'] = 'injured'
+        self.assertEqual(self.heist_agent.suggest_parties('heist_1'), [])
+
+    # --- Game Data Cache Tests ---
+    def test_game_data_cache_reuse_and_invalidation(self):
+        """The compiled cache is reused while the JSON is unchanged and rebuilt when it changes."""
+        import os
+        import tempfile
+        with open('game_data.json', 'r', encoding='utf-8') as f:
+            game_data = json.load(f)
+        path = os.path.join(tempfile.mkdtemp(), 'game_data.json')
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(game_data, f)
+
+        compiled = main.load_game_data(path)
+        self.assertTrue(os.path.exists(path + '.cache'))
+        heist_1 = next(h for h in compiled['data']['heists'] if h['id'] == 'heist_1')
+        self.assertIs(compiled['indexes']['heists']['heist_1'], heist_1)
+        with patch('main.compile_game_data', side_effect=AssertionError("cache not used")):
+            main.load_game_data(path)
+            os.utime(path, ns=(0, 0))  # touched, same content: the hash keeps the cache valid
+            main.load_game_data(path)
+
+        next(h for h in game_data['heists'] if h['id'] == 'heist_1')['name'] = "Renamed Manor"
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(game_data, f)
+        self.assertEqual(main.load_game_data(path)['indexes']['heists']['heist_1']['name'], "Renamed Manor")
+
+    def test_compile_game_data_validates(self):
+        """Duplicate ids and missing sections are rejected before anything is cached."""
+        with open('game_data.json', 'r', encoding='utf-8') as f:
+            game_data = json.load(f)
+        game_data['tools'].append(dict(game_data['tools'][0]))
+        with self.assertRaises(ValueError):
+            main.compile_game_data(game_data)
+        with self.assertRaises(ValueError):
+            main.compile_game_data({"heists": []})
+
+    def test_streamed_game_data_matches_eager_load(self):
+        """Streamed sections decode on access to the same items, and the byte index is reused."""
+        import os
+        import pickle
+        import tempfile
+        with open('game_data.json', 'r', encoding='utf-8') as f:
+            game_data = json.load(f)
+        game_data['narrative_events'].append({"id": "événement_brûlé", "description": "Ünïcode \"quoted\" {text}"})
+        path = os.path.join(tempfile.mkdtemp(), 'game_data.json')
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(game_data, f, indent=1, ensure_ascii=False)
+
+        eager = main.load_game_data(path, stream=False)
+        streamed = main.load_game_data(path, stream=True)
+        events = streamed['indexes']['narrative_events']
+        self.assertIsInstance(events, main.LazySection)
+        self.assertEqual(events._decoded, {})
+        self.assertEqual(events['événement_brûlé'], eager['indexes']['narrative_events']['événement_brûlé'])
+        for section, value in eager['data'].items():
+            self.assertEqual(list(streamed['data'][section]), list(value))
+        self.assertEqual(list(pickle.loads(pickle.dumps(events))), game_data['narrative_events'])
+
+        with patch('main.index_game_data') as mock_index:
+            main.stream_game_data(path)
+        mock_index.assert_not_called()
+        game = main.GameManager(events=main.EventBus(), compiled_data=streamed)
+        self.assertEqual(len(game.arc_manager._stages), len(main.GameManager(events=main.EventBus()).arc_manager._stages))
+
+    def test_streamed_game_data_rejects_duplicate_ids(self):
+        import os
+        import tempfile
+        with open('game_data.json', 'r', encoding='utf-8') as f:
+            game_data = json.load(f)
+        game_data['campaign_arcs'].append(dict(game_data['campaign_arcs'][0]))
+        path = os.path.join(tempfile.mkdtemp(), 'game_data.json')
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(game_data, f)
+        with self.assertRaises(ValueError):
+            main.load_game_data(path, stream=True)
+
+    # --- Procedural Heist Tests ---
+    def test_procedural_heists_are_seeded_and_cached(self):
+        """Generated heists depend only on seed, district and number, and the LRU cache stays bounded."""
+        with open('game_data.json', 'r', encoding='utf-8') as f:
+            config = json.load(f)['procedural_heists']
+        small = main.ProceduralHeists(dict(config, cache_size=2))
+        heist = small.get('proc_foundry_3')
+        self.assertEqual(heist, main.ProceduralHeists(config).get('proc_foundry_3'))
+        self.assertNotEqual(heist, small.get('proc_foundry_4'))
+        self.assertEqual(heist['id'], 'proc_foundry_3')
+        for key in ('name', 'difficulty', 'required_roles', 'potential_loot', 'getaway', 'events'):
+            self.assertIn(key, heist)
+
+        self.assertIs(small.get('proc_foundry_3'), heist)  # a hit makes it most recently used
+        small.get('proc_heights_0')
+        self.assertEqual(list(small._cache), ['proc_foundry_3', 'proc_heights_0'])
+        for bad_id in ('proc_nowhere_1', 'proc_foundry_03', 'proc_foundry_x', 'heist_1'):
+            self.assertIsNone(small.get(bad_id))
+
+        config['events'][0]['failure']['effects'] = [{"type": "no_such_effect"}]
+        with self.assertRaises(ValueError):
+            main.validate_procedural_heists(config)
+
+    def test_procedural_heists_listed_lazily_and_playable(self):
+        """Only the jobs on offer are generated, and they run and simulate like hand-written heists."""
+        game = main.GameManager(events=main.EventBus(), seed=5)
+        procedural = game.heist_agent.procedural
+        offers = [h_id for h_id in game.available_heists() if h_id.startswith('proc_')]
+        self.assertEqual(offers, procedural.offers(0))
+        self.assertEqual(sorted(procedural._cache), sorted(offers))
+
+        party = game.heist_agent.suggest_parties(offers[0], top_k=1)[0]
+        game.execute_heist(offers[0], party['crew_ids'], party['tool_assignments'])
+        self.assertEqual(game.city_agent.heists_completed, 1)
+        self.assertNotIn(offers[0], game.available_heists())
+
+        report = game.simulate_heist(offers[0], party['crew_ids'], trials=20, processes=1, seed=1)
+        self.assertEqual(sum(report['counts'].values()), 20)
+
+    # --- Save Store Tests ---
+    def test_journal_save_round_trip(self):
+        """Journaled saves append only deltas and replay to the same state as a full save."""
+        import os
+        import tempfile
+        path = os.path.join(tempfile.mkdtemp(), 'save_game.json')
+        game = main.GameManager(events=main.EventBus(), save_format="journal")
+        with patch('builtins.print'):
+            game.save_game(path)
+            for n in range(3):
+                game.city_agent.add_loot({"item": f"Trinket {n}", "value": 10 * n})
+                game.city_agent.notoriety += 1
+                game.arc_manager.completed_triggers.add(f"trigger_{n}")
+                game.crew_agent.edit_member('rogue_1')['xp'] += 5
+                game.save_game(path)
+        with open(path + '.journal', 'r', encoding='utf-8') as f:
+            entries = [json.loads(line) for line in f]
+        self.assertEqual(len(entries), 3)
+        self.assertEqual(list(entries[-1]['crew']), ['rogue_1'])
+        self.assertEqual(entries[-1]['loot']['append'], [{"item": "Trinket 2", "value": 20}])
+
+        loaded = main.GameManager(events=main.EventBus(), save_format="journal")
+        with patch('builtins.print'):
+            self.assertTrue(loaded.load_game(path))
+        expected, actual = game._collect_save_state(), loaded._collect_save_state()
+        for key in main.JournalSaveStore.SET_KEYS:
+            self.assertEqual(sorted(expected.pop(key)), sorted(actual.pop(key)))
+        self.assertEqual(expected, actual)
+
+    def test_journal_saves_only_what_changed(self):
+        """Journaled games save without collecting the whole state, even across a rollback or a load."""
+        import os
+        import tempfile
+        path = os.path.join(tempfile.mkdtemp(), 'save_game.json')
+        game = main.GameManager(events=main.EventBus(), save_format="journal", seed=6)
+        with patch('builtins.print'):
+            game.save_game(path)
+            game.crew_agent.edit_member('mage_1')['xp'] += 3
+            game.city_agent.add_loot({"item": "Idol", "value": 40})
+            state = game.state
+            state.checkpoint()
+            game.execute_heist('heist_1', ['rogue_1', 'mage_1'], {})
+            state.rollback()
+            with patch.object(main.GameManager, '_collect_save_state', side_effect=AssertionError), \
+                    patch('copy.deepcopy', side_effect=AssertionError):
+                game.save_game(path)
+                game.crew_agent.edit_member('rogue_1')['status'] = "injured"
+                game.save_game(path)
+        with open(path + '.journal', 'r', encoding='utf-8') as f:
+            entries = [json.loads(line) for line in f]
+        self.assertEqual(len(entries), 2)
+        self.assertEqual(entries[0]['loot']['append'], [{"item": "Idol", "value": 40}])
+        self.assertEqual(list(entries[1]['crew']), ['rogue_1'])
+        self.assertNotIn('loot', entries[1])
+
+        def saved(manager):
+            state = manager._collect_save_state()
+            return {key: sorted(value) if key in main.JournalSaveStore.SET_KEYS else value
+                    for key, value in state.items()}
+
+        loaded = main.GameManager(events=main.EventBus(), save_format="journal")
+        self.assertIsNot(loaded.changes, game.changes)  # each game orders only its own changes
+        self.assertIs(loaded.crew_agent.changes, loaded.city_agent.loot.changes)
+        with patch('builtins.print'):
+            self.assertTrue(loaded.load_game(path))
+            self.assertEqual(saved(loaded), saved(game))
+            loaded.execute_heist('heist_1', ['rogue_1', 'mage_1'], {})
+            loaded.save_game(path)
+            reloaded = main.GameManager(events=main.EventBus(), save_format="journal")
+            self.assertTrue(reloaded.load_game(path))
+        self.assertEqual(saved(reloaded), saved(loaded))
+
+    def test_journal_compaction_and_torn_write(self):
+        """Compaction folds the journal into the snapshot; a torn final line is ignored."""
+        import os
+        import tempfile
+        path = os.path.join(tempfile.mkdtemp(), 'save_game.json')
+
+        def save(store, state, loot=None):  # as GameManager.save_game does
+            changes = {"values": {key: value for key, value in state.items() if key != "loot"}}
+            if loot is not None:
+                changes["loot"] = loot
+            if not store.save_changes(changes):
+                store.save(state)
+
+        store = main.JournalSaveStore(path, compact_every=2)
+        state = {"notoriety": 0, "loot": [], "unlocked_heists": ["heist_1"]}
+        for n in range(1, 5):  # a snapshot, two journal entries, then a compaction
+            state["notoriety"] = n
+            save(store, state)
+        with open(path, 'r', encoding='utf-8') as f:
+            self.assertEqual(json.load(f)["notoriety"], 4)
+        with open(path + '.journal', 'r', encoding='utf-8') as f:
+            self.assertEqual(f.read(), '')
+
+        state["loot"] = [{"item": "Ring", "value": 5}]
+        save(store, state, {"keep": 0, "append": state["loot"]})
+        with open(path + '.journal', 'a', encoding='utf-8') as f:
+            f.write('{"set": {"notor')
+        store = main.JournalSaveStore(path)
+        self.assertEqual(store.load(), state)
+
+        for n in (5, 6):  # later saves go on lines of their own and stay loadable
+            state["notoriety"] = n
+            save(store, state)
+        self.assertEqual(main.JournalSaveStore(path).load(), state)
+        with open(path + '.journal', 'r', encoding='utf-8') as f:
+            self.assertEqual(len(f.read().splitlines()), 3)
+
+    def test_sqlite_slots_round_trip(self):
+        """Each slot loads back independently of the others in the same database."""
+        import os
+        import tempfile
+        path = os.path.join(tempfile.mkdtemp(), 'saves.db')
+        first = main.GameManager(events=main.EventBus(), save_format="sqlite", save_slot="first")
+        second = main.GameManager(events=main.EventBus(), save_format="sqlite", save_slot="second")
+        first.city_agent.add_loot({"item": "Gold Watch", "value": 50})
+        first.city_agent.factions = {"guilds": {"name": "Guilds", "standing": -2}}
+        first.crew_agent.crew_members['rogue_1']['xp'] = 30
+        second.city_agent.notoriety = 7
+        with patch('builtins.print'):
+            first.save_game(path)
+            second.save_game(path)
+
+            loaded = main.GameManager(events=main.EventBus(), save_format="sqlite", save_slot="first")
+            self.assertTrue(loaded.load_game(path))
+            self.assertFalse(main.GameManager(events=main.EventBus(), save_format="sqlite",
+                                              save_slot="missing").load_game(path))
+        expected, actual = first._collect_save_state(), loaded._collect_save_state()
+        for key in ("unlocked_heists", "completed_triggers"):
+            self.assertEqual(sorted(expected.pop(key)), sorted(actual.pop(key)))
+        self.assertEqual(expected, actual)
+        self.assertEqual(main.SqliteSaveStore(path, "second").load()["notoriety"], 7)
+        self.assertEqual({s['slot'] for s in main.SqliteSaveStore(path).list_slots()}, {"first", "second"})
+        conn = main.SqliteSaveStore(path, "first")._connect()
+        statuses = {row[0] for row in conn.execute("SELECT status FROM crew WHERE slot = 'first'")}
+        conn.close()
+        self.assertEqual(statuses, {"active"})  # members with no status recorded count as active
+
+    def test_journal_ignores_entries_from_before_compaction(self):
+        """A crash after rewriting the snapshot but before truncating the journal loses nothing."""
+        import os
+        import shutil
+        import tempfile
+        path = os.path.join(tempfile.mkdtemp(), 'save_game.json')
+        store = main.JournalSaveStore(path, compact_every=2)
+        state = {"notoriety": 1, "loot": [], "completed_triggers": []}
+        store.save(state)
+        for n in (2, 3):
+            state = dict(state, notoriety=n, completed_triggers=[f"t{n}"])
+            self.assertTrue(store.save_changes({"values": dict(state)}))
+        shutil.copy(path + '.journal', path + '.stale')
+        state = dict(state, notoriety=0, completed_triggers=[])
+        main.JournalSaveStore(path, compact_every=2).compact(state)
+        os.replace(path + '.stale', path + '.journal')  # the truncation never happened
+
+        self.assertEqual(main.JournalSaveStore(path).load(), state)
+        state = dict(state, notoriety=9)
+        main.JournalSaveStore(path, compact_every=2).compact(state)  # a store that never loaded
+        self.assertEqual(main.JournalSaveStore(path).load(), state)
+
+    def test_loaded_game_plays_heists(self):
+        """A loaded roster is made of crew records, shared by every agent, so heists run on it."""
+        import os
+        import tempfile
+        path = os.path.join(tempfile.mkdtemp(), 'save_game.json')
+        game = main.GameManager(events=main.EventBus(), seed=2)
+        with patch('builtins.print'):
+            game.save_game(path)
+            self.assertTrue(game.load_game(path))
+        self.assertIsInstance(game.crew_agent.get_crew_member('rogue_1'), main.CrewMember)
+        game.execute_heist('heist_1', ['rogue_1', 'mage_1'], {})
+        self.assertEqual(game.city_agent.heists_completed, 1)
+
+    def test_loaded_game_keeps_one_roster(self):
+        """After a load, heist XP reaches the menus, the arc triggers and the next save."""
+        import os
+        import tempfile
+        path = os.path.join(tempfile.mkdtemp(), 'save_game.json')
+        game = main.GameManager(events=main.EventBus(), seed=4)
+        with patch('builtins.print'):
+            game.save_game(path)
+            game.load_game(path)
+            for _ in range(3):
+                game.execute_heist('heist_1', ['rogue_1', 'mage_1'], {})
+        self.assertIs(game.heist_agent.crew_agent, game.crew_agent)
+        self.assertIs(game.arc_manager.crew_agent, game.crew_agent)
+        xp = [game.crew_agent.get_crew_member(crew_id)['xp'] for crew_id in ('rogue_1', 'mage_1')]
+        self.assertTrue(all(xp))
+        saved = {member['id']: member['xp'] for member in game._collect_save_state()['crew_members']}
+        self.assertEqual([saved['rogue_1'], saved['mage_1']], xp)
+
+    def test_sqlite_history_queries(self):
+        """History gets a row per completed heist and can be filtered by notoriety."""
+        import os
+        import tempfile
+        store = main.SqliteSaveStore(os.path.join(tempfile.mkdtemp(), 'saves.db'), "run_a")
+        for heists, notoriety in ((0, 0), (1, 4), (1, 5), (2, 12)):
+            store.save({"notoriety": notoriety, "heists_completed": heists, "loot": [{"item": "Coin", "value": 3}]})
+        store.slot = "run_b"
+        store.save({"notoriety": 11, "heists_completed": 1})
+
+        self.assertEqual([r['heists_completed'] for r in store.history("run_a")], [0, 1, 2])
+        self.assertEqual([(r['slot'], r['notoriety']) for r in store.history(min_notoriety=10)],
+                         [("run_a", 12), ("run_b", 11)])
+        store.delete_slot("run_a")
+        self.assertEqual([r['slot'] for r in store.history()], ["run_b"])
+
+    # --- Game State Tests ---
+    def test_game_state_fork_isolates_branches(self):
+        """A forked branch can run heists without touching its parent or the game data."""
+        state = main.GameState(self.city_agent, self.crew_agent, self.arc_manager, self.heist_agent)
+        self.city_agent.factions = {"guilds": {"name": "Guilds", "standing": 0}}
+        branch = state.fork(events=main.EventBus())
+        self.assertIs(branch.crew_agent.get_crew_member('rogue_1'), self.crew_agent.get_crew_member('rogue_1'))
+
+        branch.crew_agent.add_xp('rogue_1', 30)
+        branch.crew_agent.edit_member('mage_1')['status'] = 'arrested'
+        branch.city_agent.edit_faction('guilds')['standing'] = -999
+        branch.city_agent.add_loot({"item": "Gold Watch", "value": 50})
+        branch.arc_manager.check_arcs()
+        self.assertIs(branch.heist_agent.crew_agent, branch.crew_agent)
+
+        self.assertEqual(self.crew_agent.get_crew_member('rogue_1')['xp'], 0)
+        self.assertEqual(self.game_data['crew_members'][0]['xp'], 0)
+        self.assertNotIn('status', self.crew_agent.get_crew_member('mage_1'))
+        self.assertEqual(self.city_agent.factions['guilds']['standing'], 0)
+        self.assertEqual(self.city_agent.loot, [])
+        self.assertEqual(branch.crew_agent.get_crew_member('rogue_1')['level'], 3)
+        self.assertIn("arc_clockwork_tower_tease:stage_0", branch.arc_manager.completed_triggers)
+        self.assertEqual(self.arc_manager.completed_triggers, set())
+
+    @patch('builtins.input', return_value='N')
+    def test_game_state_rollback(self, mock_input):
+        """rollback() restores the agents in place, including after a full heist."""
+        state = main.GameState(self.city_agent, self.crew_agent, self.arc_manager, self.heist_agent)
+        state.checkpoint()
+        with patch('builtins.print'):
+            self.heist_agent.run_heist('heist_1', ['rogue_1', 'mage_1'], {})
+        self.crew_agent.add_xp('mage_1', 30)
+        self.city_agent.increase_notoriety(4)
+        state.rollback()
+
+        self.assertEqual(self.city_agent.notoriety, 0)
+        self.assertEqual(self.city_agent.loot, [])
+        self.assertEqual(self.crew_agent.get_crew_member('mage_1')['xp'], 0)
+        self.assertIs(self.heist_agent.crew_agent, self.crew_agent)
+        self.crew_agent.add_xp('mage_1', 10)  # still copy-on-write after the rollback
+        self.assertEqual(self.game_data['crew_members'][1]['xp'], 0)
+        with self.assertRaises(ValueError):
+            state.rollback()
+
     # --- ArcManager Tests ---
     def test_final_heist_not_unlocked_on_new_game(self):
         """Verify the final heist is not unlocked at the start of a new game."""
@@ -185,6 +797,585 @@ class TestGameAgents(unittest.TestCase):
         expected_heists = {'heist_1', 'heist_2', 'heist_3', 'heist_4', 'heist_5', 'heist_6'}
         self.assertEqual(city_agent.unlocked_heists, expected_heists)
 
+    def test_arc_triggers_only_rechecked_when_watched_state_changes(self):
+        """Stages are re-evaluated only when the state they depend on changes."""
+        arcs = [{"id": "arc_levels", "stages": [{"trigger": "rogue_1 level >= 2", "special": "unlock_finale_clockwork_tower"}]},
+                {"id": "arc_heat", "stages": [{"threshold": 3, "special": "unlock_finale_clockwork_tower"}]}]
+        arc_manager = main.ArcManager(arcs, [], self.game_data['special_events'], self.city_agent, self.crew_agent,
+                                      events=main.EventBus())
+        calls = []
+
+        def counting(trigger_id, predicate):
+            return lambda manager: calls.append(trigger_id) or predicate(manager)
+        arc_manager._stages = [(t, s, counting(t, p)) for t, s, p in arc_manager._stages]
+
+        arc_manager.check_arcs()
+        self.assertEqual(calls, ["arc_levels:stage_0", "arc_heat:stage_0"])
+        del calls[:]
+        arc_manager.check_arcs()
+        self.city_agent.update_reputation('fear', 2)  # not watched by any stage
+        arc_manager.check_arcs()
+        self.assertEqual(calls, [])
+
+        self.city_agent.increase_notoriety(3)
+        arc_manager.check_arcs()
+        self.assertEqual(calls, ["arc_heat:stage_0"])
+        self.assertIn("arc_heat:stage_0", arc_manager.completed_triggers)
+        self.assertIn("heist_finale_clockwork_tower", self.city_agent.unlocked_heists)
+
+    def test_arc_checks_read_only_edited_members_and_moved_factions(self):
+        """Crew fields are re-read only for edited members, and standings only after a faction changes."""
+        self.city_agent.factions = {"guilds": {"name": "Guilds", "standing": 0}}
+        arcs = [{"id": "arc_crew", "stages": [{"trigger": "crew.rogue_1.level >= 5", "special": "none"},
+                                              {"trigger": "crew.mage_1.level >= 5", "special": "none"}]},
+                {"id": "arc_guilds", "stages": [{"trigger": "faction.guilds < 0", "special": "none"}]}]
+        arc_manager = main.ArcManager(arcs, [], [], self.city_agent, self.crew_agent, events=main.EventBus())
+        arc_manager.check_arcs()
+        reads = []
+        readers = {name: (lambda name, read: lambda manager, *args: reads.append((name,) + args) or read(manager, *args))(
+            name, main.TRIGGER_STATE_READERS[name]) for name in ("crew", "faction")}
+        with patch.dict(main.TRIGGER_STATE_READERS, readers):
+            self.crew_agent.add_xp('rogue_1', 1)
+            arc_manager.check_arcs()
+            self.assertEqual(reads, [("crew", "rogue_1", "level")])
+            del reads[:]
+            self.city_agent.edit_faction('guilds')['standing'] -= 1
+            arc_manager.check_arcs()
+            self.assertEqual(reads, [("faction", "guilds")])
+
+    def test_arc_stage_effects_reach_later_stages_in_same_check(self):
+        """A stage whose effects change watched state lets later stages fire in the same pass."""
+        self.city_agent.factions = {"guilds": {"name": "Guilds", "standing": 0}}
+        narrative = [{"id": "event_betrayal", "description": "The guilds are betrayed.",
+                      "choices": [{"text": "Betray them", "effects": {"faction": {"guilds": -1}}}]}]
+        arcs = [{"id": "arc_a", "stages": [{"threshold": 0, "event": "event_betrayal"},
+                                           {"trigger": "faction_hostile_all", "special": "unlock_finale_clockwork_tower"}]}]
+        arc_manager = main.ArcManager(arcs, narrative, self.game_data['special_events'], self.city_agent, self.crew_agent,
+                                      main.CallableDecisions(lambda ability_id, context: False, lambda decision_id, options, context: 0),
+                                      main.EventBus())
+        arc_manager.check_arcs()
+        self.assertEqual(arc_manager.completed_triggers, {"arc_a:stage_0", "arc_a:stage_1"})
+        self.assertIn("heist_finale_clockwork_tower", self.city_agent.unlocked_heists)
+
+    def test_trigger_expressions(self):
+        """Trigger expressions cover comparisons, and/or/not and the main pieces of game state."""
+        self.city_agent.factions = {"guilds": {"name": "Guilds", "standing": -2}}
+        self.city_agent.add_loot({"item": "Gold Watch", "value": 50})
+        self.city_agent.update_reputation('fear', 3)
+        self.crew_agent.crew_members['mage_1']['status'] = 'arrested'
+
+        def holds(text):
+            predicate, _ = main.compile_trigger(text)
+            return predicate(self.arc_manager)
+
+        self.assertTrue(holds('loot_value >= 50 and loot_count == 1'))
+        self.assertTrue(holds('reputation.fear > 2 and not reputation.respect > 0'))
+        self.assertTrue(holds('faction.guilds < 0 and faction_hostile_all'))
+        self.assertTrue(holds('crew.mage_1.status == "arrested" or notoriety > 100'))
+        self.assertTrue(holds('(heists_completed >= 1 or treasury >= 100) and rogue_1 level == 1'))
+        self.assertFalse(holds('rogue_1 level > 1'))  # the operator is honoured, not assumed to be >=
+        self.assertFalse(holds('crew.nobody.level >= 0 or faction.nobody.standing < 0'))
+        self.assertEqual(main.compile_trigger('loot_value > 0 or crew.rogue_1.level >= 2')[1],
+                         {("loot_value",), ("crew", "rogue_1", "level")})
+
+    def test_arc_completes_past_stages_without_triggers(self):
+        """An arc counts as completed once every stage that can fire has fired."""
+        arcs = [{"id": "arc_a", "stages": [{"threshold": 2, "special": "none"}, {"special": "none"}]},
+                {"id": "arc_b", "stages": [{"threshold": 9, "special": "none"}]}]
+        arc_manager = main.ArcManager(arcs, [], [], self.city_agent, self.crew_agent, main.NeverDecisions())
+        self.assertEqual(arc_manager.completed_arcs(), [])
+        self.city_agent.notoriety = 2
+        with patch('builtins.print'):
+            arc_manager.check_arcs()
+        self.assertEqual(arc_manager.completed_arcs(), ["arc_a"])
+
+    def test_status_trigger_on_untouched_member(self):
+        """A member with no status recorded counts as active, as everywhere else in the engine."""
+        self.assertNotIn('status', self.crew_agent.get_crew_member('rogue_1'))
+        predicate, _ = main.compile_trigger('crew.rogue_1.status == "active"')
+        self.assertTrue(predicate(self.arc_manager))
+        predicate, _ = main.compile_trigger('crew.rogue_1.status != "active"')
+        self.assertFalse(predicate(self.arc_manager))
+
+    def test_malformed_triggers_rejected_at_load(self):
+        """A trigger that does not parse fails when the game data is compiled, not mid-campaign."""
+        for text in ('notoriety >=', 'notoriety >= 3 and', 'fame > 1', 'rogue_1 level >= high', '(notoriety > 1'):
+            with self.assertRaises(ValueError):
+                main.compile_trigger(text)
+        with open('game_data.json', 'r', encoding='utf-8') as f:
+            game_data = json.load(f)
+        game_data['campaign_arcs'][0]['stages'].append({"trigger": "notoriety >>= 3", "event": "x"})
+        with self.assertRaises(ValueError):
+            main.compile_game_data(game_data)
+
+    def test_narrative_effects_accept_signed_strings(self):
+        """Choice effects written as "+150" apply like plain numbers."""
+        with patch('builtins.print'):
+            self.arc_manager._apply_effects({'loot': '+150', 'fear': '+1'})
+        self.assertEqual(self.city_agent.loot, [{"item": "Unknown Loot", "value": 150}])
+        self.assertEqual(self.city_agent.reputation['fear'], 1)
+
+    # --- Decision Provider Tests ---
+    def test_greedy_decisions_use_threshold(self):
+        """Greedy spends abilities only on checks below its threshold."""
+        greedy = main.GreedyThresholdDecisions(threshold=0.5)
+        self.assertTrue(greedy.confirm('tinkers_edge', '', {'success_chance': 0.3}))
+        self.assertFalse(greedy.confirm('tinkers_edge', '', {'success_chance': 0.9}))
+        self.assertTrue(greedy.confirm('chronoward', '', {}))
+        self.assertEqual(greedy.choose('narrative_choice', '', ['a', 'b', 'c'], {'scores': [0, 100, -1]}), 1)
+
+    def test_decision_providers_must_confirm(self):
+        """A provider that does not answer ability prompts cannot be created."""
+        with self.assertRaises(TypeError):
+            main.DecisionProvider()
+
+        class ChoosesOnly(main.DecisionProvider):
+            def choose(self, decision_id, prompt, options, context=None):
+                return 0
+        with self.assertRaises(TypeError):
+            ChoosesOnly()
+
+    @patch('builtins.input', side_effect=AssertionError("decision providers must not prompt"))
+    def test_run_heist_with_decision_provider(self, mock_input):
+        """Abilities are answered by the provider instead of stdin."""
+        self.crew_agent.get_crew_member('rogue_1')['upgrades'] = ['rogue_shadowstep']
+        asked = []
+        decisions = main.CallableDecisions(lambda ability_id, context: asked.append(ability_id) or True)
+        heist_agent = main.HeistAgent(self.game_data['heists'], [], [], self.crew_agent,
+                                      self.tool_agent, self.city_agent, decisions)
+        heist_agent.run_heist('heist_1', ['rogue_1', 'mage_1'], {})
+
+        self.assertIn('rogue_shadowstep', asked)
+        self.assertIn('rogue_shadowstep', heist_agent.abilities_used_this_heist)
+
+    def test_success_chance_worked_out_only_when_read(self):
+        """Providers that never read the success estimate do not pay for it."""
+        self.crew_agent.get_crew_member('rogue_1')['upgrades'] = ['rogue_ghost_in_gears']
+
+        def run(decisions):
+            heist_agent = main.HeistAgent(self.game_data['heists'], [], [], self.crew_agent,
+                                          self.tool_agent, self.city_agent, decisions)
+            with patch.object(main.HeistAgent, '_estimate_event_chance', return_value=0.5) as estimate:
+                heist_agent.run_heist('heist_1', ['rogue_1', 'mage_1'], {})
+            return estimate.call_count
+
+        self.assertEqual(run(main.NeverDecisions()), 0)
+        chances = []
+        self.assertGreater(run(main.CallableDecisions(lambda a, c: chances.append(c['success_chance']))), 0)
+        self.assertEqual(set(chances), {0.5})
+
+    def test_narrative_choice_from_provider(self):
+        """ArcManager resolves narrative choices through its decision provider."""
+        self.city_agent.factions = {"guilds": {"standing": 0, "name": "The Guilds"}}
+        event = {"id": "offer", "description": "An offer.", "choices": [
+            {"text": "Refuse", "effects": {"faction": {"guilds": -1}}},
+            {"text": "Accept", "effects": {"faction": {"guilds": "+2"}}},
+        ]}
+        arc_manager = main.ArcManager([], [event], [], self.city_agent, self.crew_agent,
+                                      main.CallableDecisions(lambda a, c: False, lambda d, options, c: 1))
+        arc_manager._present_narrative_event(event)
+        self.assertEqual(self.city_agent.factions['guilds']['standing'], 2)
+
+    def test_console_choices_take_numbers_or_listed_keys(self):
+        """Typed choices pick by number, or by key where the prompt lists keys; anything else re-prompts."""
+        event = {"id": "offer", "description": "An offer.", "choices": [
+            {"text": "Refuse", "effects": {}}, {"text": "Accept", "effects": {"loot": 50}}]}
+        arc_manager = main.ArcManager([], [event], [], self.city_agent, self.crew_agent, main.ConsoleDecisions())
+        with patch('builtins.input', side_effect=["Acc", "3", "2"]) as mock_input, patch('builtins.print'):
+            arc_manager._present_narrative_event(event)
+        self.assertEqual(mock_input.call_count, 3)
+        self.assertEqual(self.city_agent.loot.total_value, 50)
+
+        console, potions = main.ConsoleDecisions(), ["stealth", "combat", "magic"]
+        with patch('builtins.input', side_effect=["m", "Magic"]):
+            self.assertEqual(console.choose('alchemy_potion', '', potions, {'keys': ["S", "C", "M"]}), 2)
+            self.assertIsNone(console.choose('alchemy_potion', '', potions, {'keys': ["S", "C", "M"]}))
+
+    # --- Event Bus Tests ---
+    @patch('random.randint', return_value=10)
+    def test_event_bus_collects_structured_events(self, mock_randint):
+        """Agents emit typed events to every sink; the console rendering matches the old output."""
+        collector = main.CollectorSink()
+        events = main.EventBus(collector)
+        crew_agent = main.CrewAgent(self.game_data['crew_members'], self.game_data['progression'], events)
+        city_agent = main.CityAgent(self.game_data['player'], events)
+        heist_agent = main.HeistAgent(self.game_data['heists'], [], [], crew_agent, self.tool_agent, city_agent,
+                                      main.NeverDecisions(), events)
+        heist_agent.run_heist('heist_1', ['rogue_1', 'mage_1'], {})
+
+        checks = collector.of_kind('check.roll')
+        self.assertEqual([(c['crew_id'], c['skill'], c['result']) for c in checks],
+                         [('rogue_1', 'stealth', 'success'), ('mage_1', 'magic', 'success')])
+        self.assertEqual(collector.of_kind('heist.summary')[0]['loot'], ['Dagger'])
+        self.assertEqual(main.render_event('check.roll', checks[0]),
+                         "  > Silas attempts stealth check (Difficulty: 3)\n  > Skill: 5\n"
+                         "  > + Tool/Ability Bonus: 0 + Roll: 10 = Total: 15")
+
+    @patch('builtins.print')
+    def test_silent_bus_and_jsonl_sink(self, mock_print):
+        """A bus without sinks prints nothing; the JSONL sink writes one object per event."""
+        import os
+        import tempfile
+        silent = main.EventBus(main.NullSink())
+        self.assertFalse(silent.enabled)
+        main.CityAgent(self.game_data['player'], silent).increase_notoriety(2)
+        mock_print.assert_not_called()
+
+        path = os.path.join(tempfile.mkdtemp(), 'events.jsonl')
+        sink = main.JsonlFileSink(path)
+        main.CityAgent(self.game_data['player'], main.EventBus(sink)).increase_notoriety(2)
+        sink.close()
+        with open(path, encoding='utf-8') as f:
+            self.assertEqual([json.loads(line) for line in f], [{"kind": "city.notoriety", "notoriety": 2, "amount": 2}])
+        with self.assertRaises(ValueError):
+            main.EventBus(main.CollectorSink()).emit('no.such_kind')
+
+    @patch('random.randint', return_value=10)
+    def test_prometheus_sink_exports_heist_metrics(self, mock_randint):
+        """The metrics sink counts heists, checks and abilities and writes the text format on its interval."""
+        import os
+        import tempfile
+        path = os.path.join(tempfile.mkdtemp(), 'clockwork.prom')
+        ticks = iter(range(0, 1000, 2))
+        sink = main.PrometheusSink(path, interval=5, city_agent=self.city_agent, clock=lambda: next(ticks))
+        events = main.EventBus(sink)
+        self.crew_agent.events = self.city_agent.events = events
+        heist_agent = main.HeistAgent(self.game_data['heists'], [], [], self.crew_agent, self.tool_agent, self.city_agent,
+                                      main.AlwaysYesDecisions(), events)
+        heist_agent.run_heist('heist_1', ['rogue_1', 'mage_1'], {})
+        events.emit('heist.summary', heist_id='heist_1', notoriety=3, loot=[], abilities=['scout_1'])  # a summary with no start
+        self.assertTrue(os.path.exists(path))
+        self.assertFalse(os.path.exists(path + '.tmp'))
+
+        self.city_agent.treasury = 250
+        text = sink.render()
+        for line in ('# TYPE clockwork_heists_started_total counter',
+                     'clockwork_heists_started_total{heist_id="heist_1"} 1',
+                     'clockwork_heists_succeeded_total{heist_id="heist_1"} 1',
+                     'clockwork_skill_checks_total{skill="magic",result="success"} 1',
+                     'clockwork_ability_uses_total{ability="scout_1"} 1',
+                     'clockwork_treasury 250',
+                     'clockwork_run_heist_seconds_bucket{le="+Inf"} 1',
+                     'clockwork_run_heist_seconds_count 1'):
+            self.assertIn(line, text.splitlines())
+        self.assertNotIn('clockwork_heists_failed_total', text)
+
+        total = main.PrometheusSink()
+        total.merge(sink)
+        total.merge(sink)
+        self.assertIn('clockwork_skill_checks_total{skill="stealth",result="success"} 2', total.render())
+        self.assertEqual(total.gauges['clockwork_treasury'], 250)
+        self.assertEqual(main._prometheus_labels((("text", 'say "hi"\n'),)), '{text="say \\"hi\\"\\n"}')
+
+    def test_prometheus_sink_times_overlapping_heists(self):
+        """Heists from games sharing one sink are timed from their own start."""
+        ticks = iter([0, 0, 10, 20, 21])  # the first tick is read when the sink is built
+        sink = main.PrometheusSink(clock=lambda: next(ticks))
+        events = main.EventBus(sink)
+        for run_id in (1, 2):
+            events.emit('heist.start', heist_id='heist_1', name="The Noble's Manor", crew_ids=[], run_id=run_id)
+        for run_id in (1, 2):
+            events.emit('heist.summary', heist_id='heist_1', notoriety=0, loot=[], abilities=[], run_id=run_id)
+        self.assertEqual((sink.latency_count, sink.latency_sum), (2, 31))
+
+    # --- Simulation Tests ---
+    @patch('builtins.input', side_effect=AssertionError("simulation must not prompt"))
+    def test_simulate_heist_is_headless_and_reproducible(self, mock_input):
+        """Simulated heists never prompt, leave the source data untouched and honour the seed."""
+        report = main.simulate_heist(self.game_data, 'heist_1', ['rogue_1', 'mage_1'], trials=200, processes=1, seed=7)
+        again = main.simulate_heist(self.game_data, 'heist_1', ['rogue_1', 'mage_1'], trials=200, processes=1, seed=7)
+
+        self.assertEqual(report['counts'], again['counts'])
+        self.assertEqual(sum(report['counts'].values()), 200)
+        self.assertAlmostEqual(sum(report['outcomes'].values()), 1.0)
+        self.assertEqual(self.game_data['crew_members'][0]['xp'], 0)
+
+    def test_simulate_heist_process_pool(self):
+        """Trials split across worker processes are all accounted for."""
+        report = main.simulate_heist(self.game_data, 'heist_1', ['rogue_1', 'mage_1'], trials=40, processes=2, seed=1)
+        self.assertEqual(sum(report['counts'].values()), 40)
+        self.assertGreaterEqual(report['expected_loot_value'], 0)
+
+    def test_random_streams_replay_and_independence(self):
+        """Equal seeds replay a heist exactly; substreams and spawned children never coincide."""
+        def play(seed):
+            collector = main.CollectorSink()
+            events = main.EventBus(collector)
+            rng = main.RandomStreams(seed)
+            crew_agent = main.CrewAgent(json.loads(json.dumps(self.game_data['crew_members'])), self.game_data['progression'], events, rng)
+            city_agent = main.CityAgent(self.game_data['player'], events)
+            heist_agent = main.HeistAgent(self.game_data['heists'], [], [], crew_agent, self.tool_agent, city_agent,
+                                          main.NeverDecisions(), events, rng)
+            for _ in range(5):
+                heist_agent.run_heist('heist_1', ['rogue_1', 'mage_1'], {})
+            return [c['roll'] for c in collector.of_kind('check.roll')]
+
+        self.assertEqual(play(42), play(42))
+        self.assertNotEqual(play(42), play(43))
+
+        rng = main.RandomStreams(42)
+        draws = [[stream.random() for _ in range(3)] for stream in (rng.rolls, rng.events, rng.targets,
+                                                                   rng.spawn(0).rolls, rng.spawn(1).rolls)]
+        self.assertEqual(len({tuple(d) for d in draws}), 5)
+        self.assertIs(main.RandomStreams().rolls, main.random)
+
+    def test_simulation_independent_of_process_split(self):
+        """Each trial has its own stream, so the worker count does not change the result."""
+        events = self.game_data['heists'][0]['events']
+        events[0]['difficulty'], events[1]['difficulty'] = 12, 10
+        one = main.simulate_heist(self.game_data, 'heist_1', ['rogue_1', 'mage_1'], trials=30, processes=1, seed=3)
+        three = main.simulate_heist(self.game_data, 'heist_1', ['rogue_1', 'mage_1'], trials=30, processes=3, seed=3)
+        self.assertEqual(one['counts'], three['counts'])
+        self.assertEqual(one['mean_notoriety_delta'], three['mean_notoriety_delta'])
+
+    def test_game_manager_market_logic(self):
+        """The market and progression actions work without any console input."""
+        game = main.GameManager(events=main.EventBus())
+        game.city_agent.treasury = 500
+        game.city_agent.factions = {"syndicates": {"name": "Rogue Syndicates", "standing": 4}}
+        game.city_agent.loot = [{"item": "Gem", "value": 100}, {"item": "Ring", "value": 50}]
+
+        self.assertEqual(game.fencing_multiplier(), (1.4, [("Rogue Syndicates", "Allied", 1.4)]))
+        self.assertEqual(game.fence_items([game.city_agent.loot[1]]), 70)
+        self.assertEqual(game.fence_items(), 140)
+        self.assertEqual((game.city_agent.loot, game.city_agent.treasury), ([], 710))
+
+        self.assertTrue(game.buy_tool('tool_lockpick'))
+        self.assertEqual(game.city_agent.tool_inventory, {'tool_lockpick': 1})
+        game.crew_agent.edit_member('rogue_1')['status'] = 'injured'
+        game.crew_agent.edit_member('mage_1')['status'] = 'arrested'
+        self.assertTrue(game.heal_member('rogue_1'))
+        self.assertTrue(game.bribe_release('mage_1'))
+        self.assertEqual(game.arrested_members(), [])
+        self.assertEqual(game.city_agent.treasury, 710 - 50 - 50 - 100)
+        game.city_agent.treasury = 10
+        self.assertFalse(game.buy_tool('tool_explosives'))
+
+    def test_fencing_prices_rebuild_only_when_standings_change(self):
+        """The fencing multiplier is cached until an effect, a new factions dict or a rollback moves a standing."""
+        game = main.GameManager(events=main.EventBus())
+        game.city_agent.factions = {"syndicates": {"name": "Rogue Syndicates", "standing": 1},
+                                    "guilds": {"name": "The Brasshaven Guilds", "standing": 0}}
+        with patch.object(game, '_compute_fencing_multiplier', wraps=game._compute_fencing_multiplier) as compute:
+            self.assertEqual(game.fencing_multiplier()[0], 1.2)
+            game.fence_items()
+            game.fencing_multiplier()
+            self.assertEqual(compute.call_count, 1)
+
+            state = game.state
+            state.checkpoint()
+            game.arc_manager._apply_effects({'faction': {'syndicates': '+2'}})
+            self.assertEqual(game.fencing_multiplier()[0], 1.4)
+            game.heist_agent._apply_effects([{'type': 'set_faction_hostile', 'faction': 'guilds'}], [], None, [])
+            self.assertAlmostEqual(game.fencing_multiplier()[0], 1.4 * 0.8)
+            self.assertEqual(compute.call_count, 3)
+
+            state.fork().city_agent.edit_faction('syndicates')['standing'] = -5  # a fork's edits stay its own
+            self.assertAlmostEqual(game.fencing_multiplier()[0], 1.4 * 0.8)
+            state.rollback()
+            self.assertEqual(game.fencing_multiplier(), (1.2, [("Rogue Syndicates", "Friendly", 1.2)]))
+            self.assertEqual(compute.call_count, 4)
+
+        upgrade = next(u for u in game.available_upgrades('rogue_1') if u.get('effects'))
+        boosts = game.apply_upgrade('rogue_1', upgrade)
+        self.assertNotIn(upgrade, game.available_upgrades('rogue_1'))
+        for skill, value in boosts:
+            self.assertEqual(game.crew_agent.get_crew_member('rogue_1')['skills'][skill], value)
+
+    def test_simulate_campaign_independent_of_process_split(self):
+        """Campaign runs are seeded per run, so the worker count does not change the report."""
+        metrics_one, metrics_two = main.PrometheusSink(), main.PrometheusSink()
+        one = main.simulate_campaign("random", runs=4, turns=4, processes=1, seed=11, metrics=metrics_one)
+        two = main.simulate_campaign("random", runs=4, turns=4, processes=2, seed=11, metrics=metrics_two)
+        self.assertEqual(one['results'], two['results'])
+        self.assertEqual(metrics_one.counters, metrics_two.counters)
+        self.assertEqual(sum(count for (name, _), count in metrics_one.counters.items()
+                             if name == 'clockwork_heists_started_total'),
+                         sum(r['heists_completed'] for r in one['results']))
+        self.assertEqual(one['metrics']['heists_completed']['max'], 4)
+        self.assertEqual(set(one['arc_completion']), {arc['id'] for arc in main.GameManager(
+            events=main.EventBus()).game_data['campaign_arcs']})
+        with self.assertRaises(ValueError):
+            main.simulate_campaign("reckless", runs=1)
+
+    def test_simulate_unknown_heist(self):
+        with self.assertRaises(ValueError):
+            main.simulate_heist(self.game_data, 'no_such_heist', ['rogue_1'], trials=1, processes=1)
+
+
+    # --- Profiling Tests ---
+    def test_profiling_times_phases_and_unwraps(self):
+        """Phases are only wrapped while profiling is on, and nested phases record their caller."""
+        original = main.HeistAgent.run_heist_steps
+        profiler = main.enable_profiling()
+        try:
+            self.assertIsNot(main.HeistAgent.run_heist_steps, original)
+            self.heist_agent.decisions = main.NeverDecisions()
+            self.heist_agent.events = main.EventBus()
+            self.heist_agent.run_heist('heist_1', ['rogue_1', 'mage_1'], {})
+            self.arc_manager.check_arcs()
+        finally:
+            self.assertIs(main.disable_profiling(), profiler)
+        self.assertIs(main.HeistAgent.run_heist_steps, original)
+        self.assertIs(main.CrewAgent.perform_skill_check, main.CrewAgent.__dict__['perform_skill_check'])
+        self.assertFalse(hasattr(main.HeistPlan.best_member, '__profiled__'))
+
+        report = profiler.report()
+        self.assertEqual(report['heist']['calls'], 1)
+        self.assertEqual(report['heist.event_generation']['callers'], {'heist': 1})
+        self.assertEqual(report['heist.checks']['calls'], 2)
+        self.assertEqual(report['arcs.check']['calls'], 1)
+        for stats in report.values():
+            self.assertLessEqual(stats['own_seconds'], stats['total_seconds'] + 1e-9)
+        nested = sum(report[p]['total_seconds'] for p in ('heist.event_generation', 'heist.checks', 'heist.best_crew'))
+        self.assertGreaterEqual(report['heist']['total_seconds'], nested - 1e-9)
+
+    def test_profile_exports_json_and_pstats(self):
+        """A profile can be written as JSON or loaded back with pstats."""
+        import os
+        import pstats
+        import tempfile
+        ticks = iter(range(100))
+        profiler = main.PhaseProfiler(clock=lambda: next(ticks))
+        outer = profiler.wrap('outer', lambda: inner())
+        inner = profiler.wrap('inner', lambda: None)
+        outer()
+        outer()
+        self.assertEqual(profiler.report()['outer'], {"calls": 2, "own_seconds": 4, "total_seconds": 6, "callers": {}})
+        self.assertEqual(profiler.report()['inner']['callers'], {'outer': 2})
+
+        with tempfile.TemporaryDirectory() as tmp:
+            json_path, pstats_path = os.path.join(tmp, 'phases.json'), os.path.join(tmp, 'phases.prof')
+            profiler.dump(json_path)
+            profiler.dump(pstats_path)
+            with open(json_path, encoding='utf-8') as f:
+                self.assertEqual(json.load(f)['phases']['inner']['calls'], 2)
+            stats = pstats.Stats(pstats_path)
+        by_phase = {key[2]: value for key, value in stats.stats.items()}
+        self.assertEqual(by_phase['outer'][:4], (2, 2, 4, 6))
+        self.assertEqual(by_phase['inner'][:4], (2, 2, 2, 2))
+        self.assertEqual(stats.total_tt, 6)
+
+    # --- Session Host Tests ---
+    def test_async_steps_play_like_blocking_game(self):
+        """The menus and a heist played through run_steps_async match the blocking console game."""
+        import asyncio
+        answers = ["N", "P", "heist_1", "rogue_1,mage_1", "yes", "F", "", "E"]
+
+        class ScriptedDecisions(main.DecisionProvider):
+            def __init__(self):
+                self.answers = iter(answers)
+
+            async def ask(self, decision_id, prompt, context=None):
+                await asyncio.sleep(0)
+                return next(self.answers)
+
+            async def confirm(self, ability_id, prompt, context=None):
+                return (await self.ask(ability_id, prompt, context)).upper() == 'Y'
+
+        def play(decisions, run):
+            collector, lines = main.CollectorSink(), []
+            game = main.GameManager(decisions, main.EventBus(collector), seed=3,
+                                    output=lambda *args, **kwargs: lines.append(args))
+            run(game)
+            # Heist run ids are unique per process, so they differ between the two games
+            events = [(kind, {k: v for k, v in fields.items() if k != 'run_id'}) for kind, fields in collector.events]
+            return events, lines, game.city_agent.heists_completed
+
+        with patch('builtins.input', side_effect=answers):
+            blocking = play(main.ConsoleDecisions(), lambda game: game.start_game())
+        decisions = ScriptedDecisions()
+        played = play(decisions, lambda game: asyncio.run(main.run_steps_async(game.start_game_steps(), decisions)))
+        self.assertEqual(played, blocking)
+        self.assertEqual(played[2], 1)
+
+    def test_session_host_serves_players_concurrently(self):
+        """Players on separate connections play at once; one who stalls holds up nobody else."""
+        import asyncio
+
+        async def play(port, lines):
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write("".join(line + "\n" for line in lines).encode())
+            output = (await reader.read()).decode()
+            writer.close()
+            return output
+
+        async def serve():
+            host = main.SessionHost(seed=1)
+            server = await host.start(port=0)
+            port = server.sockets[0].getsockname()[1]
+            slow_reader, slow_writer = await asyncio.open_connection('127.0.0.1', port)
+            self.assertEqual(await slow_reader.readuntil(b": "), b"Name your crew: ")
+            outputs = await asyncio.wait_for(asyncio.gather(
+                play(port, ["Cogs", "N", "F", "", "E"]),
+                play(port, ["Gears", "N", "C", "E"])), timeout=10)
+            self.assertEqual(host.sessions, {})
+            slow_writer.write(b"Springs\nN\nE\n")
+            outputs.append((await slow_reader.read()).decode())
+            slow_writer.close()
+            server.close()
+            await server.wait_closed()
+            return outputs
+
+        cogs, gears, springs = asyncio.run(serve())
+        self.assertIn("--- Faction Status ---", cogs)
+        self.assertIn("=== Crew Roster ===", gears)
+        self.assertNotIn("=== Crew Roster ===", cogs)
+        for output in (cogs, gears, springs):
+            self.assertIn("Welcome to The Clockwork Heist!", output)
+            self.assertTrue(output.endswith("You melt back into the shadows of Brasshaven...\n"))
+
+    def test_session_host_loads_a_saved_crew_into_play(self):
+        """A returning player loads their crew's slot and goes straight into a heist."""
+        import asyncio
+        import os
+        import tempfile
+
+        async def play(port, lines):
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write("".join(line + "\n" for line in lines).encode())
+            output = (await reader.read()).decode()
+            writer.close()
+            return output
+
+        async def serve():
+            host = main.SessionHost(compiled, seed=1)
+            server = await host.start(port=0)
+            port = server.sockets[0].getsockname()[1]
+            saved = await play(port, ["Cogs", "N", "S", "E"])
+            loaded = await play(port, ["Cogs", "L", "P", "heist_1", "rogue_1,mage_1", "yes", "E"])
+            server.close()
+            await server.wait_closed()
+            return saved, loaded
+
+        compiled = main.load_game_data('game_data.json')
+        cwd = os.getcwd()
+        os.chdir(tempfile.mkdtemp())  # the sessions save to save_game.db in the working directory
+        try:
+            saved, loaded = asyncio.run(serve())
+        finally:
+            os.chdir(cwd)
+        self.assertIn("[Game saved to save_game.db.]", saved)
+        self.assertIn("[Game loaded from save_game.db.]", loaded)
+        self.assertIn("--- Starting Heist: The Noble", loaded)
+        self.assertIn("Final Notoriety:", loaded)
+        self.assertTrue(loaded.endswith("You melt back into the shadows of Brasshaven...\n"))
+
+    # --- Benchmark Tests ---
+    def test_benchmarks_smoke(self):
+        """The benchmark suite runs on scaled synthetic data and reports every result."""
+        import benchmarks
+        with open('game_data.json', 'r', encoding='utf-8') as f:
+            base = json.load(f)
+        scaled = benchmarks.scaled_game_data(base, 20)
+        self.assertEqual(len(main.compile_game_data(scaled)['indexes']['heists']), 20)
+
+        names = ['run_heist', 'check_arcs_changing', 'save_game_journal', 'load_game_data_cold']
+        report = benchmarks.run_benchmarks([10], names, repeat=1, iteration_scale=0.01)
+        self.assertEqual([(r['name'], r['scale']) for r in report['results']], [(n, 10) for n in names])
+        self.assertTrue(all(r['seconds'] > 0 and r['peak_memory_kb'] >= 0 for r in report['results']))
+        json.dumps(report)
+
 
 if __name__ == '__main__':
     unittest.main()